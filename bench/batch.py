@@ -0,0 +1,209 @@
+# batch evaluation of PID variants over a recorded trace with NumPy
+#
+#   python -m bench.batch trace.bin --gains 0.21 0.0013 12 --random 10000
+#   python -m bench.batch trace.bin --gains 0.21 0.0013 12 --check
+#   python -m bench.batch trace.bin --controller PID_GyroTurn --gains 0.9 0.015 5
+#
+# PID.update is linear in the gains: correction = kp * error + ki * integral
+# + kd * difference, and for a given trace the error, integral and difference
+# series don't depend on them. so the recurrence runs once per integral
+# variant (leak 0.5 is modded_integral, 1 the classic sum) and N gain sets
+# become one broadcast over an N x ticks array, evaluated in chunks. the
+# arithmetic is done in the same order as PID.update so the corrections are
+# identical, --check compares against the Python loop (the timed update with
+# --period, fed the recorded times)
+#
+# only the rows of one controller are used (--controller, PID_LineTrack by
+# default), with its integral, last error and dt restarted at the rows where
+# the loop restarted them. LineTrack's gains go through its speed schedule:
+# the schedule adds the same speed-dependent amount to any kp and kd, so it
+# is one more series, kp + a(speed) stays linear in kp
+#
+# open loop: the recorded errors are fed back unchanged, the scores say how
+# hard each variant would drive the motors on that trace, not how the robot
+# would have moved (bench.tune runs the closed loop)
+
+import math
+import time
+
+import numpy as np
+
+import sim
+from telemetry import load as loadTrace, select, START, START_LOOP, START_INTEGRAL, START_NEW
+
+# leak per tick of each integral variant
+MODDED = 0.5
+CLASSIC = 1.0
+# gain sets per broadcast
+CHUNK = 256
+
+
+def terms(errors, leak = MODDED, times = None, period = None, lastError = 0.0, starts = None):
+  # (errors, integral, difference, scale) series of one controller's rows.
+  # with period (ms) the update is the timed one, scaled by the recorded dt.
+  # starts are the rows' start flags
+  errors = np.asarray(errors, dtype = float)
+  n = len(errors)
+  flags = np.zeros(n, dtype = int) if starts is None else np.asarray(starts, dtype = int)
+  scale = np.ones(n)
+  if period is not None:
+    scale[1:] = np.diff(np.asarray(times, dtype = float)) / period
+    # a new loop's first update has no dt yet
+    scale[(flags & START_LOOP) != 0] = 1
+  # the recurrence is inherently sequential, once per trace
+  integral = np.empty(n)
+  value = 0.0
+  for i, (error, s, flag) in enumerate(zip(errors.tolist(), scale.tolist(), flags.tolist())):
+    if flag & START_INTEGRAL:
+      value = 0.0
+    if leak == CLASSIC:
+      value += error * s
+    elif period is None:
+      value = value * leak + error
+    else:
+      value = value * leak ** s + error * s
+    integral[i] = value
+  difference = np.empty(n)
+  if n:
+    difference[0] = errors[0] - lastError
+    difference[1:] = errors[1:] - errors[:-1]
+    # a new controller starts from last error 0
+    new = (flags & START_NEW) != 0
+    difference[new] = errors[new]
+  return errors, integral, difference, scale
+
+
+def scheduleOffset(rows, series):
+  # what LineTrack's speed schedule adds to kp * error + kd * derivative, at
+  # the speed the loop ran (and looked its gains up at) on each row
+  from pid import lineTrackSchedule
+  schedule = lineTrackSchedule(0, 0, 0)
+  errors, integral, difference, scale = series
+  offset = np.empty(len(rows))
+  for i, row in enumerate(rows):
+    kp, ki, kd = schedule.gains((row[3] + row[4]) / 2)
+    derivative = difference[i] / scale[i] if scale[i] > 0 else 0
+    offset[i] = kp * errors[i] + kd * derivative
+  return offset
+
+
+def corrections(series, kp, ki, kd):
+  # len(kp) x ticks corrections for gain arrays kp, ki, kd
+  errors, integral, difference, scale = series
+  kp = np.asarray(kp, dtype = float)[:, None]
+  ki = np.asarray(ki, dtype = float)[:, None]
+  kd = np.asarray(kd, dtype = float)[:, None]
+  derivative = kd * difference[None, :]
+  if not np.all(scale == 1):
+    valid = scale > 0
+    derivative = np.divide(derivative, scale[None, :], out = derivative, where = valid[None, :])
+    # a tick with no elapsed time keeps the last derivative
+    index = np.maximum.accumulate(np.where(valid, np.arange(len(scale)), 0))
+    derivative = derivative[:, index]
+  return kp * errors[None, :] + ki * integral[None, :] + derivative
+
+
+def evaluate(rows, kp, ki, kd, leak = MODDED, period = None, chunk = CHUNK, scheduled = False):
+  # per gain set over one controller's rows: rms change against the recorded
+  # corrections, peak correction and ticks that would command past 100 %
+  trace = np.asarray(rows, dtype = float)
+  series = terms(trace[:, 1], leak, trace[:, 0], period, starts = trace[:, START])
+  offset = scheduleOffset(rows, series) if scheduled else 0
+  recorded = trace[:, 2]
+  cruise = np.abs((trace[:, 3] + trace[:, 4]) / 2)
+  kp, ki, kd = [np.asarray(g, dtype = float) for g in (kp, ki, kd)]
+  n = len(kp)
+  rms = np.empty(n)
+  peak = np.empty(n)
+  saturated = np.empty(n, dtype = int)
+  for start in range(0, n, chunk):
+    end = min(start + chunk, n)
+    out = corrections(series, kp[start:end], ki[start:end], kd[start:end]) + offset
+    rms[start:end] = np.sqrt(np.mean((out - recorded[None, :]) ** 2, axis = 1))
+    peak[start:end] = np.max(np.abs(out), axis = 1)
+    saturated[start:end] = np.sum(cruise[None, :] + np.abs(out) > 100, axis = 1)
+  return rms, peak, saturated
+
+
+def check(rows, gains, leak = MODDED, period = None, scheduled = False):
+  # largest difference between the batch and PID.update for each gain set.
+  # the timed update reads the recorded times in place of the clock
+  import pid as module
+  from pid import PID, lineTrackSchedule
+  trace = np.asarray(rows, dtype = float)
+  kp, ki, kd = zip(*gains)
+  series = terms(trace[:, 1], leak, trace[:, 0], period, starts = trace[:, START])
+  batch = corrections(series, kp, ki, kd)
+  if scheduled:
+    batch = batch + scheduleOffset(rows, series)
+  clock = module.ticks_us
+  worst = []
+  try:
+    for i, (p, k, d) in enumerate(gains):
+      times = iter([int(round(row[0] * 1000)) for row in rows])
+      module.ticks_us = lambda: next(times)
+      pid = PID(p, k, d, period)
+      schedule = lineTrackSchedule(p, k, d) if scheduled else None
+      loop = []
+      for row in rows:
+        start = int(row[START])
+        if start & START_NEW:
+          pid.lastError = 0
+        if start & START_INTEGRAL:
+          pid.resetIntegral()
+        if start & START_LOOP:
+          pid.startLoop()
+        tick = schedule.gains((row[3] + row[4]) / 2) if scheduled else (p, k, d)
+        pid.update(row[1], tick[0], tick[1], tick[2], modded_integral = leak != CLASSIC)
+        loop.append(pid.correction)
+      worst.append(float(np.max(np.abs(batch[i] - np.array(loop)))) if loop else 0.0)
+  finally:
+    module.ticks_us = clock
+  return worst
+
+
+def main(argv = None):
+  import argparse
+  parser = argparse.ArgumentParser(description = 'batch PID evaluation over a trace')
+  parser.add_argument('trace')
+  parser.add_argument('--gains', nargs = 3, type = float, required = True, metavar = ('KP', 'KI', 'KD'))
+  parser.add_argument('--random', type = int, default = 1000, metavar = 'N', help = 'gain sets around --gains')
+  parser.add_argument('--spread', type = float, default = 4)
+  parser.add_argument('--seed', type = int, default = 0)
+  parser.add_argument('--period', type = float, help = 'evaluate the timed update at this period (ms)')
+  parser.add_argument('--top', type = int, default = 5)
+  parser.add_argument('--check', action = 'store_true', help = 'compare against PID.update and exit')
+  parser.add_argument('--controller', default = 'PID_LineTrack', help = 'class name of the controller to evaluate')
+  args = parser.parse_args(argv)
+
+  fields, rows, names = loadTrace(args.trace)
+  rows = select(rows, names, args.controller)
+  if not rows:
+    print('no %s rows in the trace' % args.controller)
+    return 1
+  scheduled = args.controller == 'PID_LineTrack'
+  if args.check:
+    gains = [tuple(args.gains), (1, 0, 0), (0, 1, 0), (0, 0, 1)]
+    for leak in (MODDED, CLASSIC):
+      print('leak %g: max difference %s' % (leak, check(rows, gains, leak, args.period, scheduled)))
+    return 0
+
+  rng = np.random.default_rng(args.seed)
+  span = math.log(args.spread)
+  gains = np.array(args.gains)[None, :] * np.exp(rng.uniform(-span, span, (args.random, 3)))
+  gains[0] = args.gains
+  for name, leak in (('modded', MODDED), ('classic', CLASSIC)):
+    host = time.perf_counter()
+    rms, peak, saturated = evaluate(rows, gains[:, 0], gains[:, 1], gains[:, 2], leak, args.period,
+                                    scheduled = scheduled)
+    host = time.perf_counter() - host
+    print('%s integral: %d gain sets x %d ticks in %.2f s, given gains rms %.3f peak %.1f saturated %d' % (
+      name, len(gains), len(rows), host, rms[0], peak[0], saturated[0]))
+    for i in np.lexsort((rms, saturated))[:args.top]:
+      print('  %10.4g %10.4g %10.4g  rms %8.3f peak %7.1f saturated %d' % (
+        gains[i, 0], gains[i, 1], gains[i, 2], rms[i], peak[i], saturated[i]))
+  return 0
+
+
+if __name__ == '__main__':
+  raise SystemExit(main())
@@ -0,0 +1,223 @@
+# control-loop rate benchmarks for the controllers in pid.py
+#
+#   python -m bench.loops                  # compare against bench/baseline.json
+#   python -m bench.loops --save           # record a new baseline
+#   python -m bench.loops LineTrack        # only cases matching a substring
+#
+# every controller calls base.run() exactly once per iteration, so the
+# benchmark swaps base.run for a recorder that timestamps iterations and ends
+# the loop after a fixed count. off the brick the loops run against the
+# simulator and latencies are simulated ev3dev time; under pybricks-micropython
+# the same cases run on the robot with real timings
+#
+# alloc is bytes allocated per iteration on MicroPython (gc.mem_alloc with the
+# collector off). CPython frees eagerly, so there it is the transient heap peak
+# per iteration from tracemalloc, which still moves when something starts
+# allocating in a hot loop
+
+import gc
+import json
+
+try:
+  import sim
+  from sim.run import load
+  SIMULATED = True
+except ImportError:
+  SIMULATED = False
+
+ITERATIONS = 400
+BASELINE = 'bench/baseline.json'
+# relative slack before a change counts as a regression
+TOLERANCE = 0.05
+
+HUGE = 1000000
+
+
+def paced(pid, period, call):
+  # run a case in timed mode at a fixed loop period (ms)
+  pid.period = period
+  call()
+
+# (name, start pose on the default field, call)
+CASES = [
+  ('PID_LineTrack.move', (665, 1040, -90),
+   lambda m: m.LineTrack.move(m.colRight, 60, m.Degrees(m.rightMotor, HUGE), side = -1)),
+  ('PID_LineTrack.move target', (665, 1040, -90),
+   lambda m: m.LineTrack.move(m.colRight, 60, m.Degrees(m.rightMotor, HUGE), side = -1, target = HUGE)),
+  ('PID_LineTrack.move 2ms', (665, 1040, -90),
+   lambda m: paced(m.LineTrack, 2, lambda: m.LineTrack.move(m.colRight, 60, m.Degrees(m.rightMotor, HUGE), side = -1))),
+  ('PID_GyroStraight.move', (600, 1040, -90),
+   lambda m: m.GyroStraight.move(50, m.Degrees(m.rightMotor, HUGE))),
+  ('PID_GyroStraightDegrees.move', (600, 1040, -90),
+   lambda m: m.GyroStraightDeg.move(60, HUGE)),
+  ('PID_GyroTurn.turn', (600, 750, -90),
+   lambda m: m.GyroTurn.turn(89)),
+  ('PID_SingleMotorTurn', (600, 750, -90),
+   lambda m: m.PID_SingleMotorTurn(m.base, m.gyro, 89, 1, 0)),
+  ('PID_LineSquare', (600, 975, -90),
+   lambda m: m.PID_LineSquare(m.base, direction = -1)),
+]
+
+
+class _Done(Exception):
+  pass
+
+
+class Recorder:
+  def __init__(self, base, clock, count, heap = None):
+    self.run = self.record
+    self._run = base.run
+    self._clock = clock
+    self._heap = heap
+    self.count = count
+    self.stamps = [0] * (count + 1)
+    self.peaks = [0] * (count + 1) if heap is not None else None
+    self.n = 0
+
+  def record(self, leftSpeed, rightSpeed):
+    n = self.n
+    self.stamps[n] = self._clock()
+    if self._heap is not None:
+      current, peak = self._heap.get_traced_memory()
+      self.peaks[n] = peak - current
+      self._heap.reset_peak()
+    self.n = n + 1
+    if n >= self.count:
+      raise _Done()
+    self._run(leftSpeed, rightSpeed)
+
+
+def percentile(values, p):
+  values = sorted(values)
+  if not values:
+    return 0
+  return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def measure(name, start, call, iterations = ITERATIONS):
+  if SIMULATED:
+    import contextlib
+    import io
+    import time
+    import tracemalloc
+    world = sim.World(start = start)
+    # main.py prints the battery voltage on import
+    with contextlib.redirect_stdout(io.StringIO()):
+      mission = load(world)
+    clock = lambda: world.now * 1000
+    heap = tracemalloc
+  else:
+    import time
+    mission = __import__('main')
+    clock = time.ticks_us
+    heap = None
+
+  base = mission.base
+  recorder = Recorder(base, clock, iterations, heap)
+  base.run = recorder.run
+  gc.collect()
+  if heap is not None:
+    heap.start()
+    heap.reset_peak()
+  else:
+    gc.disable()
+    alloc = gc.mem_alloc()
+  host = time.perf_counter() if SIMULATED else 0
+  try:
+    call(mission)
+  except _Done:
+    pass
+  if SIMULATED:
+    host = time.perf_counter() - host
+  if heap is not None:
+    heap.stop()
+  else:
+    alloc = gc.mem_alloc() - alloc
+    gc.enable()
+  del base.run
+  base.release()
+  base.hold()
+
+  n = recorder.n
+  stamps = recorder.stamps[:n]
+  latencies = [stamps[i + 1] - stamps[i] for i in range(n - 1)]
+  total = stamps[-1] - stamps[0] if n > 1 else 0
+  result = {
+    'iterations': n,
+    'rate': (n - 1) * 1000000 / total if total else 0,
+    'p50': percentile(latencies, 50),
+    'p90': percentile(latencies, 90),
+    'p99': percentile(latencies, 99),
+    'max': max(latencies) if latencies else 0,
+  }
+  if heap is not None:
+    peaks = recorder.peaks[1:n]
+    result['alloc'] = sum(peaks) / len(peaks) if peaks else 0
+    result['host'] = n / host if host else 0
+  else:
+    result['alloc'] = alloc / n if n else 0
+  return result
+
+
+def compare(name, result, baseline, tolerance = TOLERANCE):
+  # list of regressions against the stored numbers for this case
+  old = baseline.get(name)
+  if old is None:
+    return ['no baseline']
+  problems = []
+  if result['rate'] < old['rate'] * (1 - tolerance):
+    problems.append('rate %.0f -> %.0f it/s' % (old['rate'], result['rate']))
+  if result['p99'] > old['p99'] * (1 + tolerance):
+    problems.append('p99 %.0f -> %.0f us' % (old['p99'], result['p99']))
+  if result['alloc'] > old['alloc'] * (1 + tolerance) + 16:
+    problems.append('alloc %.0f -> %.0f B/it' % (old['alloc'], result['alloc']))
+  return problems
+
+
+def main(argv = None):
+  import argparse
+  parser = argparse.ArgumentParser(description = 'control-loop rate benchmarks')
+  parser.add_argument('filter', nargs = '?', default = '', help = 'only run cases containing this')
+  parser.add_argument('--iterations', type = int, default = ITERATIONS)
+  parser.add_argument('--baseline', default = BASELINE)
+  parser.add_argument('--save', action = 'store_true', help = 'write the results as the new baseline')
+  parser.add_argument('--tolerance', type = float, default = TOLERANCE)
+  args = parser.parse_args(argv)
+
+  try:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+  except OSError:
+    baseline = {}
+
+  results = {}
+  failed = False
+  print('%-30s %6s %8s %7s %7s %7s %7s %8s' % ('case', 'iters', 'it/s', 'p50us', 'p90us', 'p99us', 'maxus', 'alloc B'))
+  for name, start, call in CASES:
+    if args.filter not in name:
+      continue
+    result = measure(name, start, call, args.iterations)
+    results[name] = result
+    line = '%-30s %6d %8.0f %7.0f %7.0f %7.0f %7.0f %8.0f' % (
+      name, result['iterations'], result['rate'], result['p50'], result['p90'],
+      result['p99'], result['max'], result['alloc'])
+    if not args.save:
+      problems = compare(name, result, baseline, args.tolerance)
+      if problems and problems != ['no baseline']:
+        failed = True
+      if problems:
+        line += '  ' + ', '.join(problems)
+    print(line)
+
+  if args.save:
+    baseline.update({name: {key: round(result[key], 1) for key in ('rate', 'p50', 'p99', 'alloc')}
+                     for name, result in results.items()})
+    with open(args.baseline, 'w') as f:
+      json.dump(baseline, f, indent = 2, sort_keys = True)
+      f.write('\n')
+    print('saved', args.baseline)
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  raise SystemExit(main())
@@ -0,0 +1,67 @@
+# leg time and accuracy, Python move loops against the firmware DriveBase
+#
+#   python -m bench.native                 # simulator, both backends
+#   python -m bench.native --jitter 0.5    # with call-cost jitter
+#
+# each leg runs once through the Python PID loop and once with native =
+# True from the same start, reporting the leg time, where the right encoder
+# stopped against its target and the true heading error at the end (the
+# simulated robot's, not the gyro's), so it runs off the brick only
+
+import contextlib
+import io
+import math
+
+import sim
+from sim.run import load
+
+# (name, start pose, target encoder deg or None, turn deg or None, speed)
+LEGS = [
+  ('straight 600 @60', (300, 570, 0), 600, None, 60),
+  ('straight 1200 @60', (300, 570, 0), 1200, None, 60),
+  ('straight 1200 @90', (300, 570, 0), 1200, None, 90),
+  ('reverse 800 @60', (1300, 570, 0), -800, None, -60),
+  ('turn 90', (1180, 570, 0), None, 90, None),
+  ('turn -90', (1180, 570, 0), None, -90, None),
+  ('turn 180', (1180, 570, 0), None, 180, None),
+]
+
+
+def leg(name, start, target, turn, speed, native, jitter = 0.0, seed = 0):
+  # (seconds, encoder error deg, heading error deg)
+  world = sim.World(start = start, jitter = jitter, seed = seed, limit = 30000)
+  with contextlib.redirect_stdout(io.StringIO()):
+    m = load(world)
+  m.base.reset()
+  begin = world.now
+  if turn is None:
+    m.GyroStraightDeg.move(speed, target, native = native)
+    m.base.hold()
+    error = m.rightMotor.angle() - target
+    goal = start[2]
+  else:
+    m.GyroTurn.turn(turn, native = native)
+    error = 0
+    goal = start[2] + turn
+  seconds = (world.now - begin) / 1000
+  heading = (math.degrees(world.heading) - goal + 180) % 360 - 180
+  return seconds, error, heading
+
+
+def main(argv = None):
+  import argparse
+  parser = argparse.ArgumentParser(description = 'Python loops against the native DriveBase')
+  parser.add_argument('--jitter', type = float, default = 0.0)
+  parser.add_argument('--seed', type = int, default = 0)
+  args = parser.parse_args(argv)
+
+  print('%-20s %8s %8s %8s   %8s %8s %8s' % ('leg', 'py s', 'py enc', 'py hdg', 'fw s', 'fw enc', 'fw hdg'))
+  for name, start, target, turn, speed in LEGS:
+    python = leg(name, start, target, turn, speed, False, args.jitter, args.seed)
+    native = leg(name, start, target, turn, speed, True, args.jitter, args.seed)
+    print('%-20s %8.3f %+8.1f %+8.1f   %8.3f %+8.1f %+8.1f' % ((name,) + python + native))
+  return 0
+
+
+if __name__ == '__main__':
+  raise SystemExit(main())
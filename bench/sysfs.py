@@ -0,0 +1,115 @@
+# read rates of the sysfs fast path against pybricks
+#
+#   python -m bench.sysfs                  # fake sysfs tree in a temp dir
+#   python -m bench.sysfs --root /sys/class
+#
+# for each reading the loops poll (encoder angle, reflection) times N reads
+# through pybricks, through a plain open/read/int per read (what a naive
+# ev3dev script does) and through sysfs.Attribute, reporting reads per second
+# and bytes allocated per read. off the brick the pybricks column is the
+# simulator stand-in and the files are ordinary files, so only the two file
+# paths compare meaningfully there; on the brick all three are real
+
+import gc
+import time
+
+try:
+  import sim
+  SIMULATED = True
+except ImportError:
+  SIMULATED = False
+
+import sysfs
+
+READS = 5000
+
+
+def fakeTree(root):
+  # minimal ev3dev layout: drive motors on outB/outC, line sensors on in3/in4
+  import os
+  devices = (('tacho-motor', 'motor0', 'ev3-ports:outB', {'position': '-1234\n', 'speed': '0\n'}),
+             ('tacho-motor', 'motor1', 'ev3-ports:outC', {'position': '5678\n', 'speed': '512\n'}),
+             ('lego-sensor', 'sensor0', 'ev3-ports:in3', {'mode': 'COL-REFLECT\n', 'value0': '45\n', 'value1': '0\n', 'value2': '0\n'}),
+             ('lego-sensor', 'sensor1', 'ev3-ports:in4', {'mode': 'COL-REFLECT\n', 'value0': '62\n', 'value1': '0\n', 'value2': '0\n'}))
+  for kind, name, address, attributes in devices:
+    path = os.path.join(root, kind, name)
+    os.makedirs(path)
+    attributes = dict(attributes, address = address + '\n')
+    for attribute, value in attributes.items():
+      with open(os.path.join(path, attribute), 'w') as f:
+        f.write(value)
+  return root
+
+
+def naive(path):
+  def read():
+    with open(path) as f:
+      return int(f.read())
+  return read
+
+
+def rate(read, reads = READS):
+  # (reads per second, bytes allocated per read)
+  if SIMULATED:
+    import tracemalloc
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    host = time.perf_counter()
+    for i in range(reads):
+      read()
+    host = time.perf_counter() - host
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return reads / host, peak / reads
+  gc.collect()
+  gc.disable()
+  alloc = gc.mem_alloc()
+  start = time.ticks_us()
+  for i in range(reads):
+    read()
+  elapsed = time.ticks_diff(time.ticks_us(), start)
+  alloc = gc.mem_alloc() - alloc
+  gc.enable()
+  return reads * 1000000 / elapsed, alloc / reads
+
+
+def main(argv = None):
+  import argparse
+  parser = argparse.ArgumentParser(description = 'sysfs fast path read rates')
+  parser.add_argument('--root', help = 'sysfs class directory, default a fake tree')
+  parser.add_argument('--reads', type = int, default = READS)
+  args = parser.parse_args(argv)
+
+  temp = None
+  root = args.root
+  if root is None:
+    import tempfile
+    temp = tempfile.TemporaryDirectory()
+    root = fakeTree(temp.name)
+
+  from pybricks.ev3devices import Motor, ColorSensor
+  from pybricks.parameters import Port
+  motorPath = sysfs.find('tacho-motor', 'outC', root)
+  sensorPath = sysfs.find('lego-sensor', 'in4', root)
+  motor = Motor(Port.C)
+  sensor = ColorSensor(Port.S4)
+  fast = sysfs.SysfsMotor(motorPath)
+  color = sysfs.SysfsColor(sensorPath)
+  color.reflection()
+  cases = (('angle pybricks', motor.angle),
+           ('angle open/read', naive(motorPath + '/position')),
+           ('angle sysfs', fast.angle),
+           ('reflection pybricks', sensor.reflection),
+           ('reflection open/read', naive(sensorPath + '/value0')),
+           ('reflection sysfs', color.reflection))
+  print('%-22s %10s %8s' % ('read', 'reads/s', 'alloc B'))
+  for name, read in cases:
+    reads, alloc = rate(read, args.reads)
+    print('%-22s %10.0f %8.1f' % (name, reads, alloc))
+  if temp is not None:
+    temp.cleanup()
+  return 0
+
+
+if __name__ == '__main__':
+  raise SystemExit(main())
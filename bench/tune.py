@@ -0,0 +1,237 @@
+# offline gain tuning for the controllers in pid.py
+#
+#   python -m bench.tune GyroTurn                      # grid around the main.py gains
+#   python -m bench.tune GyroStraight --random 200     # log-uniform random search
+#   python -m bench.tune LineTrack --replay trace.bin --gains 0.25 0.001 10
+#   python -m bench.tune LineTrackRamp --check ramp.bin  # replay matches the loop
+#
+# a scenario runs one move from main.py against the simulator with the gains
+# under test and scores the telemetry trace: settle is how long until the
+# error stays within the tolerance, overshoot how far it swings past zero and
+# path error the mean absolute error over the move. candidates are spread
+# over a process pool, every evaluation builds its own world. LineTrack
+# candidates are the gains of its speed schedule (lineTrackSchedule), as
+# passed to PID_LineTrack, not gains fixed for the move
+#
+# --replay feeds the errors of a trace recorded on the brick (or by
+# sim.run --telemetry) through PID.update with other gains and reports how
+# the corrections would have changed, without a plant. only the rows of the
+# scenario's controller (or --controller) are fed, restarted at the rows
+# where the loop reset it, and LineTrack's gains go through its speed
+# schedule at the recorded speed. --check records a scenario with the
+# current gains and replays it with them, which has to give back the
+# recorded corrections (LineTrackRamp covers a move whose speed ramps)
+
+import contextlib
+import io
+import itertools
+import math
+import random
+
+import sim
+from sim.run import load
+from telemetry import Telemetry, load as loadTrace, select, START, START_INTEGRAL, START_NEW
+
+# ms of settle time one degree (or reflection point) of overshoot / mean error
+# is worth
+OVERSHOOT_WEIGHT = 40
+PATH_WEIGHT = 20
+# simulated ms before a candidate counts as failed
+LIMIT = 15000
+# multipliers of the current gains tried by the grid search
+GRID = (0.5, 0.75, 1, 1.5, 2)
+
+# name -> (start pose, settle tolerance, current gains, call(m, kp, ki, kd))
+SCENARIOS = {
+  'GyroTurn': ((600, 750, -90), 1,
+               lambda m: (m.GyroTurn.kp, m.GyroTurn.ki, m.GyroTurn.kd),
+               lambda m, kp, ki, kd: m.GyroTurn.turn(90, kp, ki, kd)),
+  'GyroStraight': ((600, 1040, -90), 1,
+                   lambda m: (m.GyroStraight.kp, m.GyroStraight.ki, m.GyroStraight.kd),
+                   lambda m, kp, ki, kd: m.GyroStraight.move(50, m.Degrees(m.rightMotor, 1500), kp, ki, kd, target = 10)),
+  'LineTrack': ((665, 1040, -80), 8,
+                lambda m: (m.LineTrack.kp, m.LineTrack.ki, m.LineTrack.kd),
+                lambda m, kp, ki, kd: m.LineTrack.move(m.colRight, 60, m.Degrees(m.rightMotor, 1400), side = -1,
+                                                       schedule = m.lineTrackSchedule(kp, ki, kd))),
+  # accelerating to a target, so the schedule's speed changes every tick
+  'LineTrackRamp': ((665, 1040, -80), 8,
+                    lambda m: (m.LineTrack.kp, m.LineTrack.ki, m.LineTrack.kd),
+                    lambda m, kp, ki, kd: m.LineTrack.move(m.colRight, 80, m.Degrees(m.rightMotor, 1400), side = -1,
+                                                           target = 1400, accel = True,
+                                                           schedule = m.lineTrackSchedule(kp, ki, kd))),
+  'SingleMotorTurn': ((600, 750, -90), 1,
+                      lambda m: (1.3, 0.005, 3),
+                      lambda m, kp, ki, kd: m.PID_SingleMotorTurn(m.base, m.gyro, 45, 1, 0, kp = kp, ki = ki, kd = kd)),
+}
+
+
+# controller of a scenario not named after it
+CONTROLLERS = {'LineTrackRamp': 'PID_LineTrack'}
+
+
+def controllerOf(name):
+  return CONTROLLERS.get(name, 'PID_' + name)
+
+
+def score(rows, tolerance):
+  # (score, settle ms, overshoot, path error) of a trace, lower is better
+  if not rows:
+    return float('inf'), 0, 0, 0
+  start = rows[0][0]
+  sign = 1 if rows[0][1] >= 0 else -1
+  settle = 0
+  overshoot = 0
+  total = 0
+  for row in rows:
+    time, error = row[0], row[1]
+    if abs(error) > tolerance:
+      settle = time - start
+    if -sign * error > overshoot:
+      overshoot = -sign * error
+    total += abs(error)
+  path = total / len(rows)
+  return settle + OVERSHOOT_WEIGHT * overshoot + PATH_WEIGHT * path, settle, overshoot, path
+
+
+def evaluate(name, gains):
+  # run the scenario with the given gains, returns (gains, score tuple)
+  start, tolerance, current, call = SCENARIOS[name]
+  world = sim.World(start = start)
+  with contextlib.redirect_stdout(io.StringIO()):
+    mission = load(world)
+  telemetry = Telemetry(LIMIT)
+  world.limit = world.now + LIMIT
+  try:
+    # attach after load so only the scenario's move is recorded
+    telemetry.attach(mission.base, mission.LineTrack, mission.GyroStraight,
+                     mission.GyroStraightDeg, mission.GyroTurn)
+    call(mission, *gains)
+  except sim.SimTimeout:
+    return gains, (float('inf'), LIMIT, 0, 0)
+  return gains, score(list(telemetry.rows()), tolerance)
+
+
+def _evaluate(args):
+  return evaluate(*args)
+
+
+def current(name):
+  world = sim.World(start = SCENARIOS[name][0])
+  with contextlib.redirect_stdout(io.StringIO()):
+    mission = load(world)
+  return SCENARIOS[name][2](mission)
+
+
+def grid(gains, factors = GRID):
+  return [tuple(g * f for g, f in zip(gains, combo)) for combo in itertools.product(factors, repeat = 3)]
+
+
+def randomGains(gains, count, spread = 4, seed = 0):
+  # log-uniform between gains / spread and gains * spread
+  rng = random.Random(seed)
+  span = math.log(spread)
+  return [tuple(g * math.exp(rng.uniform(-span, span)) for g in gains) for _ in range(count)]
+
+
+def search(name, candidates, jobs = None):
+  # evaluate every candidate in a process pool, best first
+  from multiprocessing import Pool
+  with Pool(jobs) as pool:
+    results = pool.map(_evaluate, [(name, gains) for gains in candidates])
+  return sorted(results, key = lambda r: r[1][0])
+
+
+def replay(path, controller, kp, ki, kd, modded_integral = True):
+  # the controller's recorded rows with the correction the given gains would
+  # have produced
+  from pid import PID, lineTrackSchedule
+  fields, rows, names = loadTrace(path)
+  pid = PID(kp, ki, kd)
+  schedule = lineTrackSchedule(kp, ki, kd) if controller == 'PID_LineTrack' else None
+  gains = (kp, ki, kd)
+  replayed = []
+  for row in select(rows, names, controller):
+    start = int(row[START])
+    if start & START_NEW:
+      pid.lastError = 0
+    if start & START_INTEGRAL:
+      pid.resetIntegral()
+    if schedule is not None:
+      # the loop looks its gains up at the speed it runs the tick at
+      gains = schedule.gains((row[3] + row[4]) / 2)
+    pid.update(row[1], gains[0], gains[1], gains[2], modded_integral = modded_integral)
+    replayed.append((row, pid.correction))
+  return replayed
+
+
+def check(name, path):
+  # record the scenario with the current gains to path and replay it with
+  # them, returns (rows, largest difference from the recorded corrections)
+  start, tolerance, current, call = SCENARIOS[name]
+  world = sim.World(start = start)
+  with contextlib.redirect_stdout(io.StringIO()):
+    mission = load(world)
+  gains = current(mission)
+  telemetry = Telemetry(LIMIT)
+  world.limit = world.now + LIMIT
+  telemetry.attach(mission.base, mission.LineTrack, mission.GyroStraight,
+                   mission.GyroStraightDeg, mission.GyroTurn)
+  call(mission, *gains)
+  telemetry.save(path)
+  replayed = replay(path, controllerOf(name), *gains)
+  return len(replayed), max([abs(c - row[2]) for row, c in replayed] + [0])
+
+
+def main(argv = None):
+  import argparse
+  parser = argparse.ArgumentParser(description = 'offline gain tuning')
+  parser.add_argument('scenario', nargs = '?', default = 'GyroTurn', help = ', '.join(SCENARIOS))
+  parser.add_argument('--random', type = int, metavar = 'N', help = 'random search with N candidates instead of the grid')
+  parser.add_argument('--seed', type = int, default = 0)
+  parser.add_argument('--jobs', type = int, help = 'worker processes, default one per cpu')
+  parser.add_argument('--top', type = int, default = 10)
+  parser.add_argument('--gains', nargs = 3, type = float, metavar = ('KP', 'KI', 'KD'),
+                      help = 'gains to search around (default the ones in main.py) or to replay with')
+  parser.add_argument('--replay', metavar = 'TRACE', help = 'replay a telemetry trace with --gains')
+  parser.add_argument('--controller', help = 'class name of the controller to replay, default PID_<scenario>')
+  parser.add_argument('--check', metavar = 'TRACE', help = 'record the scenario to TRACE with the current gains, '
+                      'replay it and exit')
+  args = parser.parse_args(argv)
+
+  if args.check:
+    rows, worst = check(args.scenario, args.check)
+    print('%s: %d rows replayed, max correction difference %.6f' % (args.scenario, rows, worst))
+    return 0 if worst < 1e-3 else 1
+
+  if args.replay:
+    if not args.gains:
+      parser.error('--replay needs --gains')
+    kp, ki, kd = args.gains
+    controller = args.controller or controllerOf(args.scenario)
+    replayed = replay(args.replay, controller, kp, ki, kd)
+    if not replayed:
+      print('no %s rows in the trace' % controller)
+      return 1
+    diff = [c - row[2] for row, c in replayed]
+    saturated = len([1 for row, c in replayed if abs((row[3] + row[4]) / 2) + abs(c) > 100])
+    print('%d rows, correction rms change %.3f, peak %.3f (recorded %.3f), %d ticks past 100%%' % (
+      len(replayed), math.sqrt(sum([d * d for d in diff]) / len(diff)),
+      max([abs(c) for row, c in replayed]), max([abs(row[2]) for row, c in replayed]), saturated))
+    return 0
+
+  name = args.scenario
+  gains = tuple(args.gains) if args.gains else current(name)
+  candidates = randomGains(gains, args.random, seed = args.seed) if args.random else grid(gains)
+  if gains not in candidates:
+    candidates.insert(0, gains)
+  baseline = evaluate(name, gains)[1]
+  results = search(name, candidates, args.jobs)
+  print('%s: %d candidates, current %.4g/%.4g/%.4g scores %.0f' % (name, len(candidates), gains[0], gains[1], gains[2], baseline[0]))
+  print('%10s %10s %10s %8s %8s %9s %8s' % ('kp', 'ki', 'kd', 'score', 'settle', 'overshoot', 'path'))
+  for (kp, ki, kd), (total, settle, overshoot, path) in results[:args.top]:
+    print('%10.4g %10.4g %10.4g %8.0f %8.0f %9.2f %8.2f' % (kp, ki, kd, total, settle, overshoot, path))
+  return 0
+
+
+if __name__ == '__main__':
+  raise SystemExit(main())
@@ -0,0 +1,222 @@
+# learned stopping distances and overshoot reports
+#
+# a move checks its stop condition once per loop iteration and the robot
+# keeps going while the brake takes hold, so stopping when the encoder
+# reaches the target lands past it. the Brake condition stops the loop as
+# soon as the predicted stopping point reaches the target instead and holds
+# the motors there and then. every stop through the base (Base.hold,
+# Base.stop and Brake) is left pending here; the landing position is read
+# once the motor has read at rest rest_polls times in a row, settle_poll ms
+# or more apart. poll() takes one of those readings and never waits: the
+# base polls on every tick and at Base.reset(), which rebases the pending
+# stop to the zeroed encoder instead of dropping it, until the wheels are
+# commanded again (Base.run, a native move), when a stop not at rest yet is
+# discarded, or the move's travel would count as stopping distance. a move
+# run with brake = True waits for its own stop to settle (finish()), so
+# every Brake stop is learned from at the cost of the settling time, and
+# report() and save() wait for the last one. read stops are kept in stops
+# as (kind, target, commanded speed, speed, voltage, final angle,
+# overshoot), target None for a plain hold or stop. Base.run_target is left
+# out: the firmware ramps it down to its target itself, so there is no stop
+# from speed to learn from
+#
+#   base.braking = braking.load()
+#   base.braking.voltage = ev3.battery.voltage
+#   GyroStraightDeg.move(90, 600, brake = True)
+#   base.braking.report()
+#   base.braking.save()
+#
+# the distance travelled after the stop command is latency * v + v^2 /
+# (2 * decel) for v in deg/s times a ratio learned per kind of stop and
+# speed band: each band keeps decaying least squares sums of the measured
+# ratio against the battery voltage, so the fit follows the battery as it
+# sags. the sums are the persisted table, a few hundred bytes of json.
+# a move fetches the ratios for the current voltage once at its start
+
+import json
+
+from pybricks.tools import wait, StopWatch
+
+PATH = 'braking.json'
+# s between the check and the hold taking effect, deg/s^2 of braking
+LATENCY = 0.005
+DECEL = 40000
+# deg/s per speed band, bands
+BAND = 100
+BANDS = 16
+# weight kept by the old stops on each new one
+FORGET = 0.9
+# ratio used before a band has two stops
+RATIO = 1.0
+MIN_RATIO = 0.05
+# V of spread before the voltage fit is trusted over the band's mean
+MIN_SPREAD = 0.05
+# ms finish() waits for the motor to come to rest before the stop is
+# dropped, least ms between rest checks, deg/s that counts as rest and the
+# checks in a row it takes (a hold swinging back passes through 0)
+SETTLE = 500
+SETTLE_POLL = 5
+REST = 5
+REST_POLLS = 4
+
+
+class Braking:
+  def __init__(self, data = None, latency = LATENCY, decel = DECEL):
+    data = data if data is not None else {}
+    self.latency = data.get('latency', latency)
+    self.decel = data.get('decel', decel)
+    # kind -> [[n, sum v, sum r, sum v^2, sum v r] per band], v in V
+    self.table = data.get('table', {})
+    # callable giving the battery voltage in mV, None when unknown
+    self.voltage = None
+    self.ratios = {}
+    self.pending = None
+    # rest checks in a row of the pending stop, ms of the last one
+    self.still = 0
+    self.polled = 0
+    self.clock = StopWatch()
+    self.latchTick = None
+    self.stops = []
+
+  def physics(self, speed):
+    v = abs(speed)
+    return v * self.latency + v * v / (2 * self.decel)
+
+  def ratio(self, kind, band, volts):
+    sums = self.table.get(kind)
+    if sums is None or sums[band][0] < 2:
+      return RATIO
+    n, sv, sr, svv, svr = sums[band]
+    mean = sr / n
+    spread = svv / n - (sv / n) ** 2
+    if volts is None or spread < MIN_SPREAD ** 2:
+      return max(mean, MIN_RATIO)
+    slope = (svr / n - sv / n * mean) / spread
+    return max(mean + slope * (volts - sv / n), MIN_RATIO)
+
+  def volts(self):
+    return self.voltage() / 1000 if self.voltage is not None else None
+
+  def start(self, kind = 'brake'):
+    # fit the bands for the current voltage, at the start of a move
+    volts = self.volts()
+    self.ratios[kind] = [self.ratio(kind, band, volts) for band in range(BANDS)]
+
+  def distance(self, speed, kind = 'brake'):
+    # deg travelled after a stop issued at speed (deg/s)
+    ratios = self.ratios.get(kind)
+    if ratios is None:
+      self.start(kind)
+      ratios = self.ratios[kind]
+    band = int(abs(speed) / BAND)
+    return self.physics(speed) * ratios[band if band < BANDS else BANDS - 1]
+
+  def begin(self, kind, motor, target = None, commanded = 0, forward = True):
+    # a stop command has just been issued, the last one is read if it had
+    # settled
+    self.poll()
+    self.pending = (kind, motor, target, motor.angle(), commanded, motor.speed(), self.volts(), forward)
+    self.still = 0
+
+  def latch(self, base, motor, target, angle, speed, forward = True):
+    # Brake reached: hold now, measure where it lands later. replaces the
+    # plain hold Base.hold() leaves pending, and the next Base.hold() in
+    # the same tick (the move's own) keeps this one
+    base.hold()
+    self.pending = ('brake', motor, target, angle, base.commanded, speed, self.volts(), forward)
+    self.still = 0
+    self.latchTick = base.tick
+
+  def discard(self):
+    # the robot moves again before the pending stop was read
+    self.pending = None
+
+  def rebase(self):
+    # the pending stop's encoder is about to be zeroed, keep its angles
+    # relative to where the motor is now
+    if self.pending is None:
+      return
+    kind, motor, target, angle, commanded, speed, volts, forward = self.pending
+    offset = getattr(motor, 'reader', motor).angle()
+    self.pending = (kind, motor, target - offset if target is not None else None, angle - offset,
+                    commanded, speed, volts, forward)
+
+  def poll(self):
+    # one rest check of the pending stop, never waits. the stop is recorded
+    # (and returned) on the rest_polls-th check at rest in a row, checks
+    # closer than settle_poll ms to the last one are skipped
+    if self.pending is None:
+      return None
+    now = self.clock.time()
+    if self.still and now - self.polled < SETTLE_POLL:
+      return None
+    self.polled = now
+    # live readings, past a sampled motor's tick cache
+    motor = self.pending[1]
+    reader = getattr(motor, 'reader', motor)
+    if abs(reader.speed()) > REST:
+      self.still = 0
+      return None
+    self.still += 1
+    if self.still < REST_POLLS:
+      return None
+    kind, motor, target, angle, commanded, speed, volts, forward = self.pending
+    self.pending = None
+    final = reader.angle()
+    polarity = 1 if forward else -1
+    travelled = max((final - angle) * polarity, 0)
+    overshoot = (final - target) * polarity if target is not None else travelled
+    self.record(kind, speed, volts, travelled)
+    stop = (kind, target, commanded, speed, volts, final, overshoot)
+    self.stops.append(stop)
+    return stop
+
+  def finish(self, settle = SETTLE):
+    # poll the pending stop until it is read, waiting up to settle ms for
+    # it. a stop that hasn't settled by then is dropped
+    waited = 0
+    while self.pending is not None:
+      stop = self.poll()
+      if stop is not None:
+        return stop
+      if waited >= settle:
+        self.pending = None
+        return None
+      wait(SETTLE_POLL)
+      waited += SETTLE_POLL
+    return None
+
+  def record(self, kind, speed, volts, travelled):
+    predicted = self.physics(speed)
+    if predicted < 1:
+      return
+    sums = self.table.get(kind)
+    if sums is None:
+      sums = self.table[kind] = [[0, 0, 0, 0, 0] for band in range(BANDS)]
+    band = int(abs(speed) / BAND)
+    row = sums[band if band < BANDS else BANDS - 1]
+    r = travelled / predicted
+    v = volts if volts is not None else 0
+    for i, x in enumerate((1, v, r, v * v, v * r)):
+      row[i] = row[i] * FORGET + x
+    self.ratios.pop(kind, None)
+
+  def report(self):
+    self.finish()
+    for kind, target, commanded, speed, volts, final, overshoot in self.stops:
+      print('%-6s %6s at %5d deg/s: %6d, overshoot %+d' % (kind, target, speed, final, overshoot))
+    return self.stops
+
+  def save(self, path = PATH):
+    self.finish()
+    with open(path, 'w') as f:
+      f.write(json.dumps({'latency': self.latency, 'decel': self.decel, 'table': self.table}))
+
+
+def load(path = PATH):
+  # the saved model, or an untrained one if there is none
+  try:
+    with open(path) as f:
+      return Braking(json.loads(f.read()))
+  except (OSError, ValueError):
+    return Braking()
@@ -0,0 +1,190 @@
+# sensor calibration profile
+#
+# black and white references for colLeft and colRight, indicator samples for
+# ev3Col and the named reflection thresholds live in a small json file on the
+# brick, loaded at startup. once applied, the base's colour sensors read 0 on
+# black and 100 on white, so the thresholds mean the same under any lighting.
+# without a file the references are 0 and 100, readings stay raw and the
+# thresholds are the ones the mission was tuned with. those were tuned on
+# raw readings, so the profile converts them with the references it has
+# (each on the average of the sensors it is used with) and saves them in
+# calibrated units, which later calibrations keep. the profile also keeps
+# the drive's top speed from a full-duty run and the voltage it ran at, for
+# power.Power
+#
+#   calibrate(ev3, base, ev3Col)        # on the mat, follow the screen
+#   profile = load()
+#   profile.apply(base)
+#   houseColors = profile.colorTable()
+#   power = Power(ev3.battery, profile.power())
+
+import json
+
+from pybricks.parameters import Button, Color
+from pybricks.tools import wait
+from colors import rules, calibrated
+
+PATH = 'calibration.json'
+# readings averaged per reference
+SAMPLES = 20
+
+# reflection thresholds by name, in the raw readings the mission was tuned
+# with
+THRESHOLDS = {
+  'lineTrack': 45,
+  'lineTrackSlow': 40,
+  'lineSquareLeft': 40,
+  'lineSquareRight': 45,
+  'lineStop': 31,
+}
+# the sensors a threshold is used with, both line sensors if not listed
+SENSORS = ('colLeft', 'colRight')
+THRESHOLD_SENSORS = {
+  'lineSquareLeft': ('colLeft',),
+  'lineSquareRight': ('colRight',),
+}
+
+# indicator colours sampled on ev3Col
+INDICATORS = (('YELLOW', Color.YELLOW), ('BLUE', Color.BLUE), ('GREEN', Color.GREEN))
+# raw rgb sum above the brightest 'nothing' sample before something counts
+# as present, and again before it is classified
+CLEAR_MARGIN = 5
+MINIMUM_MARGIN = 5
+# ms at full duty before and while the drive's top speed is measured
+SPIN_UP = 500
+MEASURE = 200
+
+
+class Calibration:
+  def __init__(self, data = None):
+    self.data = data if data is not None else {}
+    self.update()
+
+  def update(self):
+    # the tuned thresholds for the current references, then the saved ones
+    self.thresholds = {}
+    for name, raw in THRESHOLDS.items():
+      self.thresholds[name] = self.convert(name, raw)
+    self.thresholds.update(self.data.get('thresholds', {}))
+
+  def reference(self, name):
+    # (black, white) raw reflection of a colour sensor
+    sensor = self.data.get(name, {})
+    return sensor.get('black', 0), sensor.get('white', 100)
+
+  def convert(self, name, raw):
+    # a raw reflection threshold in calibrated units
+    values = []
+    for sensor in THRESHOLD_SENSORS.get(name, SENSORS):
+      black, white = self.reference(sensor)
+      values.append((raw - black) * 100 / (white - black))
+    return sum(values) / len(values)
+
+  def apply(self, base):
+    for name in ('colLeft', 'colRight'):
+      black, white = self.reference(name)
+      getattr(base, name).calibrate(black, white)
+    base.thresholds = self.thresholds
+
+  def colorTable(self):
+    # lookup table for ev3Col, the original rules until indicators are sampled
+    samples = self.data.get('ev3Col')
+    if not samples:
+      return rules()
+    clear = max([sum(rgb) for rgb in samples.get('nothing', [(0, 0, 0)])]) + CLEAR_MARGIN
+    references = {}
+    for name, color in INDICATORS:
+      if samples.get(name):
+        references[color] = samples[name]
+    return calibrated(references, minimum = clear + MINIMUM_MARGIN, clear = clear)
+
+  def power(self):
+    # {'top': deg/s, 'voltage': mV} of the full-duty run, None if not measured
+    return self.data.get('power')
+
+  def save(self, path = PATH):
+    self.data['thresholds'] = self.thresholds
+    with open(path, 'w') as f:
+      f.write(json.dumps(self.data))
+
+
+def load(path = PATH):
+  # the saved profile, or the defaults if there is none
+  try:
+    with open(path) as f:
+      return Calibration(json.loads(f.read()))
+  except (OSError, ValueError):
+    return Calibration()
+
+
+def _press(ev3, prompt):
+  ev3.screen.clear()
+  ev3.screen.print(prompt)
+  ev3.screen.print('press centre')
+  while Button.CENTER not in ev3.buttons.pressed():
+    wait(10)
+  while Button.CENTER in ev3.buttons.pressed():
+    wait(10)
+
+
+def _reflection(sensor):
+  total = 0
+  for i in range(SAMPLES):
+    total += sensor.reflection()
+    wait(5)
+  return total / SAMPLES
+
+
+def _rgb(ev3Col):
+  readings = []
+  for i in range(SAMPLES):
+    readings.append(list(ev3Col.read('RGB-RAW')))
+    wait(5)
+  return readings
+
+
+def _top(ev3, base):
+  # both drive motors at full duty, mean speed and voltage once up to speed
+  motors = (base.leftMotor.motor, base.rightMotor.motor)
+  for motor in motors:
+    motor.dc(100)
+  wait(SPIN_UP)
+  speed = 0
+  voltage = 0
+  n = MEASURE // 10
+  for i in range(n):
+    speed += (abs(motors[0].speed()) + abs(motors[1].speed())) / 2
+    voltage += ev3.battery.voltage()
+    wait(10)
+  for motor in motors:
+    motor.hold()
+  return {'top': speed / n, 'voltage': voltage / n}
+
+
+def calibrate(ev3, base, ev3Col, path = PATH, profile = None):
+  # sample every reference with the robot placed by hand, then save. raw
+  # readings go straight to the devices, past the base's calibration
+  if profile is None:
+    profile = load(path)
+  data = profile.data
+  for reference in ('white', 'black'):
+    _press(ev3, 'line sensors on ' + reference)
+    for name in ('colLeft', 'colRight'):
+      data.setdefault(name, {})[reference] = _reflection(getattr(base, name).sensor)
+    ev3.speaker.beep()
+  # tuned thresholds not saved yet convert with the new references
+  profile.update()
+  samples = data.setdefault('ev3Col', {})
+  _press(ev3, 'ev3Col at nothing')
+  samples['nothing'] = _rgb(ev3Col)
+  ev3.speaker.beep()
+  for name, color in INDICATORS:
+    _press(ev3, 'ev3Col at ' + name.lower())
+    samples[name] = _rgb(ev3Col)
+    ev3.speaker.beep()
+  _press(ev3, 'clear path ahead')
+  data['power'] = _top(ev3, base)
+  ev3.speaker.beep()
+  profile.save(path)
+  profile.apply(base)
+  return profile
@@ -0,0 +1,237 @@
+# rgb classification by table lookup
+#
+# every raw (r, g, b) cell maps to a code: NOTHING below the presence
+# threshold, UNKNOWN when something is there but no colour matched, else a
+# colour, and the result matches classifying the reading itself. readings
+# are quantised like floats: the brightest channel picks an exponent, the
+# shift that brings every channel under 1 << bits, and each exponent has
+# its own bytearray of cells 1 << shift wide (32 KB at 5 bits). below 32 a
+# cell is one reading. a coarser cell whose corners all classify alike
+# keeps that code, one that spans a decision boundary is marked ambiguous
+# and its readings go to the classifier one by one, so the scan loop pays
+# one index per sample away from the boundaries and the table is exact
+# (checked against rules() and calibrated() for every reading below 128,
+# where about a tenth of the readings fall back). fill() builds the tables
+# up to the dim indicator range at startup; brighter cells are classified
+# the first time they are read. one table per sensor, each
+# with its own thresholds, built from the rules scanHouseEV3 used or from
+# calibration samples. IndicatorDetector votes over every reading of an
+# indicator instead of trusting the first one
+#
+#   houseColors = rules()
+#   code = houseColors.code(*ev3Col.read('RGB-RAW'))
+#   if code > UNKNOWN:
+#     house.append(houseColors.colors[code])
+
+from pybricks.parameters import Color
+
+NOTHING = 0
+UNKNOWN = 1
+# not classified yet, spans a decision boundary
+_UNSET = 255
+_AMBIGUOUS = 254
+# bits per channel of a table, largest raw reading, brightest reading fill()
+# prepares for
+BITS = 5
+RAW_MAX = 1023
+FILL_MAX = 127
+
+
+class ColorTable:
+  def __init__(self, classify, colors, bits = BITS):
+    # classify(r, g, b) returns NOTHING, UNKNOWN or UNKNOWN + 1 + an index
+    # into colors. readings are quantised into bits bits per channel by the
+    # shift of their exponent
+    self.classify = classify
+    self.colors = (None, None) + tuple(colors)
+    self.bits = bits
+    self.bits2 = 2 * bits
+    # exponent -> table, allocated on first use
+    self.tables = {}
+    # r | g | b -> exponent
+    self.exponents = bytearray(RAW_MAX + 1)
+    for v in range(RAW_MAX + 1):
+      shift = 0
+      while v >> shift >> bits:
+        shift += 1
+      self.exponents[v] = shift
+
+  def code(self, r, g, b):
+    v = r | g | b
+    if v > RAW_MAX:
+      r = r if r < RAW_MAX else RAW_MAX
+      g = g if g < RAW_MAX else RAW_MAX
+      b = b if b < RAW_MAX else RAW_MAX
+      v = r | g | b
+    shift = self.exponents[v]
+    table = self.tables.get(shift)
+    if table is None:
+      table = self.tables[shift] = bytearray([_UNSET]) * (1 << 3 * self.bits)
+    i = ((r >> shift) << self.bits2) | ((g >> shift) << self.bits) | (b >> shift)
+    code = table[i]
+    if code >= _AMBIGUOUS:
+      if code == _UNSET:
+        code = table[i] = self.cell(r >> shift, g >> shift, b >> shift, shift)
+      if code == _AMBIGUOUS:
+        return self.classify(r, g, b)
+    return code
+
+  def cell(self, r, g, b, shift):
+    # code of cell (r, g, b) of the shift table, _AMBIGUOUS unless every
+    # corner of the cell classifies alike
+    if shift == 0:
+      return self.classify(r, g, b)
+    w = 1 << shift
+    code = self.classify(r * w, g * w, b * w)
+    for dr in (0, w):
+      for dg in (0, w):
+        for db in (0, w):
+          if self.classify(r * w + dr, g * w + dg, b * w + db) != code:
+            return _AMBIGUOUS
+    return code
+
+  def color(self, r, g, b):
+    # Color, or None for nothing or no match
+    return self.colors[self.code(r, g, b)]
+
+  def fill(self, brightest = FILL_MAX):
+    # build the tables readings up to brightest use, e.g. at startup. the
+    # corners are shared between cells, so a coarse table takes one
+    # classification per corner rather than eight per cell
+    bits = self.bits
+    bits2 = self.bits2
+    n = 1 << bits
+    classify = self.classify
+    for shift in range(self.exponents[min(brightest, RAW_MAX)] + 1):
+      table = self.tables[shift] = bytearray([_UNSET]) * (1 << 3 * bits)
+      if shift == 0:
+        for r in range(n):
+          for g in range(n):
+            for b in range(n):
+              table[(r << bits2) | (g << bits) | b] = classify(r, g, b)
+        continue
+      w = 1 << shift
+      m = n + 1
+      corners = bytearray(m * m * m)
+      for r in range(m):
+        for g in range(m):
+          for b in range(m):
+            corners[(r * m + g) * m + b] = classify(r * w, g * w, b * w)
+      for r in range(n):
+        for g in range(n):
+          for b in range(n):
+            j = (r * m + g) * m + b
+            code = corners[j]
+            if (corners[j + 1] != code or corners[j + m] != code or corners[j + m + 1] != code
+                or corners[j + m * m] != code or corners[j + m * m + 1] != code
+                or corners[j + m * m + m] != code or corners[j + m * m + m + 1] != code):
+              code = _AMBIGUOUS
+            table[(r << bits2) | (g << bits) | b] = code
+
+
+def rules(minimum = 20, margin = 3, clear = 15, bits = BITS):
+  # the original thresholds: an indicator is present above clear, classified
+  # from minimum when one channel leads the other two by margin
+  def classify(r, g, b):
+    total = r + g + b
+    if total >= minimum:
+      if r - b >= margin and r - g >= margin:
+        return UNKNOWN + 1
+      if b - r >= margin and b - g >= margin:
+        return UNKNOWN + 2
+      if g - r >= margin and g - b >= margin:
+        return UNKNOWN + 3
+    return UNKNOWN if total > clear else NOTHING
+  return ColorTable(classify, (Color.YELLOW, Color.BLUE, Color.GREEN), bits)
+
+
+def calibrated(samples, minimum = 20, clear = 15, spread = 0.08, bits = BITS):
+  # samples {Color: [(r, g, b), ...]} read over each indicator. a reading is
+  # the colour with the nearest mean chromaticity (r, g share of the total)
+  # if it is within spread, so brightness changes with distance don't matter
+  colors = []
+  centres = []
+  for color, readings in samples.items():
+    cr = cg = 0
+    for r, g, b in readings:
+      total = (r + g + b) or 1
+      cr += r / total
+      cg += g / total
+    colors.append(color)
+    centres.append((cr / len(readings), cg / len(readings)))
+
+  def classify(r, g, b):
+    total = r + g + b
+    if total <= clear:
+      return NOTHING
+    if total < minimum:
+      return UNKNOWN
+    best = UNKNOWN
+    nearest = spread * spread
+    for i, (cr, cg) in enumerate(centres):
+      d = (r / total - cr) ** 2 + (g / total - cg) ** 2
+      if d < nearest:
+        nearest = d
+        best = UNKNOWN + 1 + i
+    return best
+  return ColorTable(classify, colors, bits)
+
+
+class IndicatorDetector:
+  # streaming detection of indicators passing under a sensor. every code
+  # between the first reading above NOTHING and gap readings of NOTHING counts
+  # as one indicator; the colour with most votes wins if it has at least
+  # votes of them, with confidence its share of the indicator's readings and
+  # position the encoder angle at its centre
+  #
+  #   detector = IndicatorDetector(houseColors)
+  #   detection = detector.update(houseColors.code(r, g, b), rightMotor.angle())
+  #   if detection is not None:
+  #     color, confidence, position = detection
+  def __init__(self, table, votes = 2, gap = 2):
+    self.colors = table.colors
+    self.votes = votes
+    self.gap = gap
+    self.counts = [0] * len(self.colors)
+    self.reset()
+
+  def reset(self):
+    counts = self.counts
+    for i in range(len(counts)):
+      counts[i] = 0
+    self.samples = 0
+    self.clear = 0
+    self.start = None
+    self.end = None
+
+  def update(self, code, position):
+    # returns (color, confidence, position) once an indicator has been passed
+    if code == NOTHING:
+      if self.start is None:
+        return None
+      self.clear += 1
+      if self.clear < self.gap:
+        return None
+      return self.finish()
+    if self.start is None:
+      self.start = position
+    self.end = position
+    self.clear = 0
+    self.samples += 1
+    self.counts[code] += 1
+    return None
+
+  def finish(self):
+    # close the indicator under the sensor, if any, and report it
+    if self.start is None:
+      return None
+    counts = self.counts
+    best = UNKNOWN + 1
+    for i in range(UNKNOWN + 2, len(counts)):
+      if counts[i] > counts[best]:
+        best = i
+    detection = None
+    if best < len(counts) and counts[best] >= self.votes:
+      detection = (self.colors[best], counts[best] / self.samples, (self.start + self.end) / 2)
+    self.reset()
+    return detection
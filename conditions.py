@@ -0,0 +1,260 @@
+# declarative stop conditions for the move loops
+#
+# a condition is a callable that returns True while the loop should keep
+# going, so it drops in wherever a lambda was passed, but it describes *when
+# to stop* and can be printed, combined and inspected. read through the
+# sampled devices on Base (base.rightMotor, base.colLeft, ...) so each check
+# is served from the tick's cached reading
+#
+#   LineTrack.move(colRight, 50, Degrees(rightMotor, 355), side = -1)
+#   GyroStraight.move(30, ColorIs(colLeft, Color.BLACK) | ColorIs(colRight, Color.BLACK))
+
+import math
+
+
+def _name(device):
+  return getattr(device, 'name', None) or type(device).__name__
+
+
+class Condition:
+  def __call__(self):
+    # True while the stop condition has not been reached
+    return True
+
+  def reached(self):
+    return not self()
+
+  def __and__(self, other):
+    return All(self, other)
+
+  def __or__(self, other):
+    return Any(self, other)
+
+
+class Never(Condition):
+  def __repr__(self):
+    return 'Never()'
+
+
+class Degrees(Condition):
+  # encoder reached target; counts up for target >= 0 and down below zero,
+  # like PID_GyroStraightDegrees
+  def __init__(self, motor, target):
+    self.motor = motor
+    self.target = target
+    self.forward = target >= 0
+
+  def __call__(self):
+    if self.forward:
+      return self.motor.angle() < self.target
+    return self.motor.angle() > self.target
+
+  def __repr__(self):
+    return 'Degrees(%s, %d)' % (_name(self.motor), self.target)
+
+
+class Brake(Condition):
+  # Degrees that stops early by the predicted stopping distance at the
+  # motor's current speed and holds the base right away, see braking.py
+  def __init__(self, base, motor, target):
+    self.base = base
+    self.motor = motor
+    self.target = target
+    self.forward = target >= 0
+    # the braking model for this battery voltage, fitted once per move
+    base.braking.start()
+
+  def __call__(self):
+    angle = self.motor.angle()
+    remaining = self.target - angle if self.forward else angle - self.target
+    speed = self.motor.speed()
+    if remaining > self.base.braking.distance(speed):
+      return True
+    self.base.braking.latch(self.base, self.motor, self.target, angle, speed, self.forward)
+    return False
+
+  def __repr__(self):
+    return 'Brake(%s, %d)' % (_name(self.motor), self.target)
+
+
+class ColorIs(Condition):
+  def __init__(self, sensor, color):
+    self.sensor = sensor
+    self.color = color
+
+  def __call__(self):
+    return self.sensor.color() != self.color
+
+  def __repr__(self):
+    return 'ColorIs(%s, %s)' % (_name(self.sensor), self.color)
+
+
+class ReflectionBelow(Condition):
+  def __init__(self, sensor, threshold):
+    self.sensor = sensor
+    self.threshold = threshold
+
+  def __call__(self):
+    return self.sensor.reflection() >= self.threshold
+
+  def __repr__(self):
+    return 'ReflectionBelow(%s, %d)' % (_name(self.sensor), self.threshold)
+
+
+class ReflectionAbove(Condition):
+  def __init__(self, sensor, threshold):
+    self.sensor = sensor
+    self.threshold = threshold
+
+  def __call__(self):
+    return self.sensor.reflection() <= self.threshold
+
+  def __repr__(self):
+    return 'ReflectionAbove(%s, %d)' % (_name(self.sensor), self.threshold)
+
+
+class Crossings(Condition):
+  # edge detector on the reflection, stops once count lines have been
+  # crossed (the sensor came off the dark side of the edge count times).
+  # dark and light are split with hysteresis around threshold so noise on
+  # an edge gives one event, and each event is kept in edges as
+  # (DARK or LIGHT, encoder position) with the position interpolated
+  # between the two samples around the threshold. with after, the move runs
+  # on until the encoder is that many degrees past the last edge, so it stops
+  # at the same place whatever the loop rate
+  #
+  #   LineTrack.move(colLeft, 80, Crossings(colRight, rightMotor, 2))
+  #   GyroStraight.move(40, Crossings(colLeft, rightMotor, 1, after = 30))
+  DARK = 0
+  LIGHT = 1
+
+  def __init__(self, sensor, motor, count = 1, threshold = 45, hysteresis = 8, edge = LIGHT, after = None):
+    self.sensor = sensor
+    self.motor = motor
+    self.count = count
+    self.threshold = threshold
+    self.low = threshold - hysteresis
+    self.high = threshold + hysteresis
+    self.edge = edge
+    self.after = after
+    self.reset()
+
+  def reset(self):
+    self.state = None
+    self.edges = []
+    self.seen = 0
+    self.last = None
+    self.crossing = None
+    self.start = None
+    self.stopAt = None
+
+  def __call__(self):
+    value = self.sensor.reflection()
+    position = self.motor.angle()
+    if self.stopAt is not None:
+      return position < self.stopAt if self.forward else position > self.stopAt
+    if self.start is None:
+      self.start = position
+    last = self.last
+    if last is not None and (last[0] < self.threshold) != (value < self.threshold):
+      # encoder position where the reflection crossed threshold
+      self.crossing = last[1] + (position - last[1]) * (self.threshold - last[0]) / (value - last[0])
+    self.last = (value, position)
+    state = self.state
+    if value < self.low:
+      state = self.DARK
+    elif value > self.high:
+      state = self.LIGHT
+    if state != self.state:
+      if self.state is not None:
+        self.edges.append((state, self.crossing if self.crossing is not None else position))
+        if state == self.edge:
+          self.seen += 1
+      self.state = state
+    if self.seen < self.count:
+      return True
+    if self.after is None:
+      return False
+    self.forward = position >= self.start
+    edge = self.edges[-1][1]
+    self.stopAt = edge + self.after if self.forward else edge - self.after
+    return position < self.stopAt if self.forward else position > self.stopAt
+
+  def __repr__(self):
+    return 'Crossings(%s, %d, %d)' % (_name(self.sensor), self.count, self.threshold)
+
+
+class GyroWithin(Condition):
+  def __init__(self, gyro, target, tolerance = 0):
+    self.gyro = gyro
+    self.target = target
+    self.tolerance = tolerance
+
+  def __call__(self):
+    return abs(self.gyro.angle() - self.target) > self.tolerance
+
+  def __repr__(self):
+    return 'GyroWithin(%s, %d, %d)' % (_name(self.gyro), self.target, self.tolerance)
+
+
+class Stopped(Condition):
+  # motor speed reads zero
+  def __init__(self, motor):
+    self.motor = motor
+
+  def __call__(self):
+    return self.motor.speed() != 0
+
+  def __repr__(self):
+    return 'Stopped(%s)' % _name(self.motor)
+
+
+class Reached(Condition):
+  # the odometry pose has reached x, y: the point is no longer ahead (or,
+  # reversing, behind) along the current heading
+  def __init__(self, odometry, x, y, forward = True):
+    self.odometry = odometry
+    self.x = x
+    self.y = y
+    self.forward = forward
+
+  def __call__(self):
+    odometry = self.odometry
+    heading = math.radians(odometry.heading)
+    along = (self.x - odometry.x) * math.cos(heading) + (self.y - odometry.y) * math.sin(heading)
+    return along > 0 if self.forward else along < 0
+
+  def __repr__(self):
+    return 'Reached(%d, %d)' % (self.x, self.y)
+
+
+class All(Condition):
+  # stops once every condition has been reached in the same tick
+  def __init__(self, *conditions):
+    self.conditions = conditions
+
+  def __call__(self):
+    for condition in self.conditions:
+      if condition():
+        return True
+    return False
+
+  def __repr__(self):
+    return 'All(%s)' % ', '.join([repr(c) for c in self.conditions])
+
+
+class Any(Condition):
+  # stops on the first condition reached, remembered in fired
+  def __init__(self, *conditions):
+    self.conditions = conditions
+    self.fired = None
+
+  def __call__(self):
+    for condition in self.conditions:
+      if not condition():
+        self.fired = condition
+        return False
+    return True
+
+  def __repr__(self):
+    return 'Any(%s)' % ', '.join([repr(c) for c in self.conditions])
@@ -1,3 +1,5 @@
+import math
+
 from pybricks.hubs import EV3Brick
 from pybricks.ev3devices import (Motor, ColorSensor, GyroSensor)
 from pybricks.parameters import Port, Stop, Direction, Button, Color
@@ -5,6 +7,10 @@ from pybricks.tools import wait, StopWatch, DataLog
 from pybricks.robotics import DriveBase
 from pybricks.media.ev3dev import SoundFile, ImageFile
 from pybricks.iodevices import Ev3devSensor
+from tasks import scheduler, sleep
+from calibration import THRESHOLDS
+from braking import Braking
+from telemetry import NAN
 
 
 
@@ -12,13 +18,20 @@ from pybricks.iodevices import Ev3devSensor
 def CorrectSpeed(x):
   return (x/100) * 1400 
 
+# drive geometry (mm) shared by everything that turns encoder degrees into
+# distance
+WHEEL_DIAMETER = 62.4
+AXLE_TRACK = 160
+MM_PER_DEG = math.pi * WHEEL_DIAMETER / 360
+
 
 
 class Claw:
   def __init__(self, port: Port):
     self.motor = Motor(port)
     self.motor.control.limits(1500)
-
+    # Power scaling duty for the battery while attached
+    self.power = None
   
   def run_angle(self, speed, angle, wait = True):
     self.motor.reset_angle(0)
@@ -28,6 +41,9 @@ class Claw:
     self.motor.run_time(CorrectSpeed(speed), time, wait = wait)    
   
   def dc(self, dir = 1, speed = 50):
+    if self.power is not None:
+      self.power.read()
+      speed = max(-100, min(speed / self.power.factor, 100))
     self.motor.dc(speed * dir)
     
   def hold(self):
@@ -35,6 +51,11 @@ class Claw:
     
   def reset(self):
     self.motor.reset_angle(0)
+    
+  def moving(self):
+    # task that finishes when the current run_* command is done
+    while not self.motor.control.done():
+      yield
   
   def measureAngleRange(self, moveTime):
     results = []
@@ -90,10 +111,13 @@ class FrontClaw(Claw):
   def solar(self, wait = True):
     self.run_target(80, 475, wait = wait)
     
-  def defaultPos(self):
+  def defaultPosTask(self):
     self.dc()
-    wait(1500)
+    yield from sleep(1500)
     self.run_target(-50, self.closeDist, wait=False)
+    
+  def defaultPos(self):
+    scheduler.run(self.defaultPosTask())
 
     # self.run_target(100 * dir, deg)
     # self.hold()
@@ -111,57 +135,283 @@ class BackClaw(Claw):
   def mid(self):
     self.run_target(-50, -180)
     
+  def defaultPosTask(self):
+    self.run_time(100, 1000, wait = False)
+    yield from self.moving()
+    self.run_target(-50, -185, wait = False)
+    yield from self.moving()
+    yield from sleep(100)
+    self.run_target(50, 40, wait = False)
+    yield from self.moving()
+    
   def defaultPos(self):
-    self.run_time(100, 1000)
-    self.run_target(-50, -185)
-    wait(100)
-    self.run_target(50, 40)
+    scheduler.run(self.defaultPosTask())
+
+ 
+ 
+# per-tick read cache: inside a move loop every consumer (the controller, the
+# deceleration check, the caller's stop condition) reads the same device
+# value once per iteration. Base.sample() starts a tick, Base.release() ends
+# sampling and reads go straight to the device again
+
+class SampledMotor:
+  def __init__(self, motor: Motor, base, name = None):
+    self.motor = motor
+    self.base = base
+    self.name = name
+    self.angleTick = -1
+    self.speedTick = -1
+    self.lastAngle = 0
+    self.lastSpeed = 0
+    # readings come from reader, the motor unless a faster backend is
+    # attached (sysfs.attach)
+    self.reader = motor
+    # commands skip the wrapper entirely
+    self.run = motor.run
+    self.hold = motor.hold
+    self.brake = motor.brake
+    self.stop = motor.stop
+    self.dc = motor.dc
+    self.run_target = motor.run_target
+    self.run_time = motor.run_time
+    self.run_angle = motor.run_angle
+    
+  def angle(self):
+    base = self.base
+    if base.sampling:
+      if self.angleTick != base.tick:
+        self.lastAngle = self.reader.angle()
+        self.angleTick = base.tick
+      return self.lastAngle
+    return self.reader.angle()
+  
+  def speed(self):
+    base = self.base
+    if base.sampling:
+      if self.speedTick != base.tick:
+        self.lastSpeed = self.reader.speed()
+        self.speedTick = base.tick
+      return self.lastSpeed
+    return self.reader.speed()
+  
+  def reset_angle(self, angle = 0):
+    if self.base.odometry is not None:
+      self.base.odometry.encoderReset(self, angle)
+    self.angleTick = -1
+    self.motor.reset_angle(angle)
+    if self.reader is not self.motor:
+      self.reader.reset_angle(angle)
+    
+  def __getattr__(self, name):
+    return getattr(self.motor, name)
+
+
+class SampledGyro:
+  def __init__(self, gyro: GyroSensor, base, name = None):
+    self.gyro = gyro
+    self.base = base
+    self.name = name
+    self.angleTick = -1
+    self.lastAngle = 0
+    
+  def angle(self):
+    base = self.base
+    if base.sampling:
+      if self.angleTick != base.tick:
+        self.lastAngle = self.gyro.angle()
+        self.angleTick = base.tick
+      return self.lastAngle
+    return self.gyro.angle()
+  
+  def reset_angle(self, angle):
+    if self.base.odometry is not None:
+      self.base.odometry.gyroReset(angle)
+    self.angleTick = -1
+    self.gyro.reset_angle(angle)
+    
+  def __getattr__(self, name):
+    return getattr(self.gyro, name)
+
+
+class SampledColor:
+  def __init__(self, sensor: ColorSensor, base, name = None):
+    self.sensor = sensor
+    self.base = base
+    self.name = name
+    self.reflectionTick = -1
+    self.colorTick = -1
+    self.lastReflection = 0
+    self.lastColor = None
+    # readings come from reader, see SampledMotor
+    self.reader = sensor
+    # reflection() is (raw - black) * gain, raw until calibrated
+    self.black = 0
+    self.gain = 1
+    
+  def calibrate(self, black, white):
+    # black reads 0 and white 100 from now on
+    self.black = black
+    self.gain = 100 / (white - black) if white != black else 1
+    self.reflectionTick = -1
+    
+  def reflection(self):
+    base = self.base
+    if base.sampling:
+      if self.reflectionTick != base.tick:
+        self.lastReflection = (self.reader.reflection() - self.black) * self.gain
+        self.reflectionTick = base.tick
+      return self.lastReflection
+    return (self.reader.reflection() - self.black) * self.gain
+  
+  def color(self):
+    base = self.base
+    if base.sampling:
+      if self.colorTick != base.tick:
+        self.lastColor = self.reader.color()
+        self.colorTick = base.tick
+      return self.lastColor
+    return self.reader.color()
+    
+  def __getattr__(self, name):
+    # anything else goes to pybricks, which may switch the sensor's mode
+    # under a sysfs reader
+    reader = self.__dict__.get('reader')
+    if reader is not None and reader is not self.sensor:
+      reader.current = None
+    return getattr(self.sensor, name)
 
  
 class Base:
   def __init__(self, 
-               leftMotor: motor, 
-               rightMotor: motor, 
+               leftMotor: Motor, 
+               rightMotor: Motor, 
                colLeft: ColorSensor, 
                colRight: ColorSensor, 
-               frontClaw: motor, 
-               backClaw: motor):
+               frontClaw: FrontClaw, 
+               backClaw: BackClaw,
+               gyro: GyroSensor = None):
     
-    self.leftMotor = leftMotor
-    self.rightMotor = rightMotor
-    self.colLeft = colLeft
-    self.colRight = colRight
+    self.tick = 0
+    self.sampling = False
+    self.leftMotor = SampledMotor(leftMotor, self, 'leftMotor')
+    self.rightMotor = SampledMotor(rightMotor, self, 'rightMotor')
+    self.colLeft = SampledColor(colLeft, self, 'colLeft')
+    self.colRight = SampledColor(colRight, self, 'colRight')
+    self.gyro = SampledGyro(gyro, self, 'gyro') if gyro is not None else None
     self.clock = StopWatch()
     self.frontClaw = frontClaw
     self.backClaw = backClaw
+    # background tasks advance once per tick
+    self.tasks = scheduler
+    # Telemetry recording every run() while attached
+    self.telemetry = None
+    # named reflection thresholds, replaced by Calibration.apply
+    self.thresholds = dict(THRESHOLDS)
+    # Odometry updated by every run() while attached
+    self.odometry = None
+    # stopping distance model and overshoot reports for every stop,
+    # replaced by braking.load()
+    self.braking = Braking()
+    # last speed (percent) run() gave the right motor
+    self.commanded = 0
+    # Power scaling run() for the battery's sag while attached
+    self.power = None
+    # NativeDrive for moves run with native = True
+    self.native = None
+    
+  def sample(self):
+    # start a new tick, returns True so loops can use `while base.sample() and ...`
+    if self.braking.pending is not None:
+      # a rest check of the last stop before the wheels are commanded
+      self.braking.poll()
+    self.tick += 1
+    self.sampling = True
+    if self.tasks.pending:
+      self.tasks.step()
+    return True
+  
+  def release(self):
+    self.sampling = False
     
   def stop(self):
     self.leftMotor.brake()
     self.rightMotor.brake()
+    self.braking.begin('stop', self.rightMotor, commanded = self.commanded, forward = self.commanded >= 0)
   
   def hold(self):
+    if self.braking.latchTick == self.tick:
+      # a Brake stop already holds where it latched, later holds are real
+      self.braking.latchTick = None
+      return
     self.leftMotor.hold()
     self.rightMotor.hold()
+    self.braking.begin('hold', self.rightMotor, commanded = self.commanded, forward = self.commanded >= 0)
     wait(10)
     
   def move(self, speed, condition):
-    while condition():
+    while self.sample() and condition():
       self.run(speed, speed)
+    self.release()
     
   def reset(self):
+    # the pending stop is checked and kept across the zeroing, never waited
+    # for
+    self.braking.poll()
+    self.braking.rebase()
     self.leftMotor.reset_angle(0)
     self.rightMotor.reset_angle(0)
   
   def run(self, leftSpeed: float, rightSpeed: float):
-    self.leftMotor.run(CorrectSpeed(leftSpeed))
-    self.rightMotor.run(CorrectSpeed(rightSpeed))
+    if self.braking.pending is not None:
+      # moving again, an unread stop would record this move's travel
+      self.braking.discard()
+    power = self.power
+    if power is None:
+      self.leftMotor.run(CorrectSpeed(leftSpeed))
+      self.rightMotor.run(CorrectSpeed(rightSpeed))
+    else:
+      if self.tick >= power.next:
+        power.update(self.tick)
+      left = CorrectSpeed(leftSpeed)
+      right = CorrectSpeed(rightSpeed)
+      # above what the wheels reach now both slow together, keeping the
+      # ratio, by at most the measured loss
+      scale = power.scale(max(abs(left), abs(right)))
+      if scale != 1:
+        left *= scale
+        right *= scale
+      self.leftMotor.run(left)
+      self.rightMotor.run(right)
+    self.commanded = rightSpeed
+    if self.odometry is not None:
+      self.odometry.update()
+    if self.telemetry is not None:
+      # this tick's sampled readings, recording never reads a device
+      motor = self.rightMotor
+      gyro = self.gyro
+      self.telemetry.record(leftSpeed, rightSpeed,
+                            motor.lastAngle if motor.angleTick == self.tick else NAN,
+                            gyro.lastAngle if gyro is not None and gyro.angleTick == self.tick else NAN)
+  
+  def track(self, leftSpeed: float, rightSpeed: float):
+    # what run() does after commanding the motors, for a loop that drives
+    # them some other way (NativeDrive)
+    if self.braking.pending is not None:
+      self.braking.discard()
+    self.commanded = rightSpeed
+    if self.odometry is not None:
+      self.odometry.update()
+    if self.telemetry is not None:
+      self.telemetry.record(leftSpeed, rightSpeed, self.rightMotor.angle(),
+                            self.gyro.angle() if self.gyro is not None else NAN)
     
 
   def run_time(self, speed: float, time: int):
     # time in seconds
     start = self.clock.time()
-    while self.clock.time() - start < time:
+    while self.sample() and self.clock.time() - start < time:
       self.run(speed, speed)
+    self.release()
     self.stop()
     
   def run_target(self, speed, angle, stop = Stop.HOLD):
@@ -12,6 +12,18 @@ import math, time
 import sys
 from helper import *
 from pid import *
+from conditions import *
+from motion import MotionProfile
+from timeline import Timeline
+from colors import IndicatorDetector
+import calibration
+import braking
+from telemetry import Telemetry
+from odometry import Odometry
+from power import Power
+from native import NativeDrive
+from planner import Planner, FieldMap, follow
+from strategy import Strategy, plannerLegs
 
 # declare global variables
 Houses = [[], [], []]
@@ -45,18 +57,44 @@ gyro = GyroSensor(Port.S2)
 colLeft = ColorSensor(Port.S3)
 colRight = ColorSensor(Port.S4)
 
-base = Base(leftMotor, rightMotor, colLeft, colRight, frontClaw, backClaw)
+base = Base(leftMotor, rightMotor, colLeft, colRight, frontClaw, backClaw, gyro)
+# read through base so stop conditions share the per-tick sensor cache
+leftMotor, rightMotor = base.leftMotor, base.rightMotor
+colLeft, colRight, gyro = base.colLeft, base.colRight, base.gyro
+
+# sensor references and thresholds from calibration.json, run
+# calibration.calibrate(ev3, base, ev3Col) on the mat to record them
+calibrationProfile = calibration.load()
+calibrationProfile.apply(base)
+thresholds = calibrationProfile.thresholds
+# rgb lookup and thresholds for house indicators on ev3Col, built for the
+# indicator range before the start so the scan loop only indexes it
+houseColors = calibrationProfile.colorTable()
+houseColors.fill()
+# encoder deg past a line's interpolated light edge where the old
+# ColorIs(..., Color.WHITE) checks stopped, so Crossings stops there too
+crossingAfter = 5
+# stopping distances learned over earlier runs, saved again after this one
+base.braking = braking.load()
+# measured top speed against the battery's sag, voltage read every few
+# hundred ticks
+power = Power(ev3.battery, calibrationProfile.power())
+power.attach(base)
+base.braking.voltage = power.read
 
 # set up defaults for PID functions
 # old: 0.16, 0.0001, 17
-LineTrack = PID_LineTrack(base, 0.21, 0.0013, 12, 45)
+LineTrack = PID_LineTrack(base, 0.21, 0.0013, 12, thresholds['lineTrack'])
 GyroStraight = PID_GyroStraight(base, 1.2, 0.005, 20, gyro)
 GyroStraightDeg = PID_GyroStraightDegrees(base, 1.2, 0.005, 20, gyro)
 GyroTurn = PID_GyroTurn(base, 0.9, 0.015, 5, gyro) 
+Arc = PID_Arc(base, 1.2, 0.005, 20, gyro)
+# firmware DriveBase for moves run with native = True
+NativeDrive(base).attach()
 #GyroTurn = PID_GyroTurn(base, 1, 0, 0)
 # battery alert
-print(ev3.battery.voltage())
-if ev3.battery.voltage() <= 8050:
+print(power.voltage)
+if power.voltage <= 8050:
   print('LOW BATTERY')
   ev3.speaker.beep()
   #sys.exit()
@@ -73,7 +111,7 @@ def print_degrees():
     print(rightMotor.angle())
 
 def debug_LineSquare():
-  GyroStraight.move(-50, lambda: colLeft.color() != Color.WHITE)
+  GyroStraight.move(-50, ColorIs(colLeft, Color.WHITE))
   base.hold()
   start = clock.time()
   PID_LineSquare(base, direction = -1)
@@ -81,7 +119,7 @@ def debug_LineSquare():
   gyro.reset_angle(0)
   base.hold()
   base.reset()
-  GyroStraight.move(50, lambda: rightMotor.angle() < 200)
+  GyroStraight.move(50, Degrees(rightMotor, 200))
   base.stop()
   wait(1000)
 
@@ -93,60 +131,67 @@ def debug_GyroTurn():
     base.hold()
     wait(100)
   
-def scanHouseEV3(house, target = 300):   
+# FieldMap measured on the real mat. planner.py's default map is the
+# simulator's generic field, so travel() and decide() refuse to run until
+# one is set here (in the simulator, fieldMap = FieldMap())
+fieldMap = None
+planner = None
+
+def routePlanner():
+  # the route planner over fieldMap, built on first use
+  global planner
+  if fieldMap is None:
+    raise ValueError('no measured FieldMap, set main.fieldMap before planning routes')
+  if planner is None:
+    planner = Planner(fieldMap)
+  return planner
+
+def travel(goal, speed = 60):
+  # drive to a place in fieldMap by the quickest planned route, needs
+  # Odometry attached to the base
+  planner = routePlanner()
+  follow(planner.plan(base.odometry.pose(), goal), base, GyroTurn, GyroStraightDeg, LineTrack, colRight, speed)
+
+def decide(start = 'start', load = (0, 0, 0), battery = 0, actions = None):
+  # fastest collect/deposit order for what the scanned Houses still need,
+  # (seconds, steps), see strategy.py. leg times from the route planner
+  planner = routePlanner()
+  supply = {'yellow': (Color.YELLOW, numYellow), 'blue': (Color.BLUE, numBlue), 'green': (Color.GREEN, numGreen)}
+  if surplus is not None:
+    supply['surplus'] = (surplus, numSurplus)
+  engine = Strategy(plannerLegs(planner)) if actions is None else Strategy(plannerLegs(planner), actions)
+  return engine.plan(Houses, supply, battery, start, load)
+
+def scanHouseEV3(house, target = 300, maxSpeed = 80, minSpeed = 30):
+  # appends the colour of each indicator passed to house, returns the
+  # detections as (color, confidence, encoder position)
   # initialise pid for gyrostraight
   kp, ki, kd = GyroStraight.kp, GyroStraight.ki, GyroStraight.kd
   gyroPID = PID(kp, ki, kd)
-  speed = 80
-  maxSpeed = 80
-  minSpeed = 30
-  rate = 2 * maxSpeed / (target * 0.04)
-  base.reset()
-  deccel = False
-  while colRight.color() != Color.BLACK and colLeft.color() != Color.BLACK:
-    detected = False
+  detector = IndicatorDetector(houseColors)
+  detections = []
+  base.reset()
+  # slow down to scan speed by the target, then crawl until the line
+  profile = MotionProfile(0, target, maxSpeed, minSpeed, accelerate = False)
+  while base.sample() and colRight.color() != Color.BLACK and colLeft.color() != Color.BLACK:
     gyroPID.update(gyro.angle(), kp, ki, kd)
     angle = base.rightMotor.angle()
-    if abs(abs(angle) - abs(target)) <= 80 * maxSpeed / 40:
-      deccel = True
-      if abs(speed) > minSpeed:
-        speed = (abs(speed) - rate) *  speed/abs(speed) 
-      if speed < minSpeed:
-        speed = minSpeed
-    elif not deccel:
-      speed += rate
-      if speed > maxSpeed:
-        speed = maxSpeed
+    speed = profile.speed(abs(angle))
     
     base.run(speed - gyroPID.correction, speed + gyroPID.correction)
     r, g, b = ev3Col.read('RGB-RAW')
-    if r + g + b >= 20:
-      detected = True     
-      if r - b >= 3 and r - g >= 3:
-        house.append(Color.YELLOW)
-      elif b - r >= 3 and b - g >= 3:
-        house.append(Color.BLUE)
-      elif g - r >= 3 and g - b >= 3:
-        house.append(Color.GREEN) 
-      else:
-        detected = False
-    
-    # once an indicator has been detected, move until nothing is detected
-    if detected:
-      while r + g + b > 15:
-        r, g, b = ev3Col.read('RGB-RAW')
-        gyroPID.update(gyro.angle(), kp, ki, kd)
-        angle = base.rightMotor.angle()
-        if abs(abs(angle) - abs(target)) <= 100 * maxSpeed / 40:
-          
-          if abs(speed) > minSpeed:
-            speed = (abs(speed) - rate) *  speed/abs(speed) 
-          if speed < minSpeed:
-            speed = minSpeed
-
-        base.run(speed - gyroPID.correction, speed + gyroPID.correction)
-      detected = False
-  print(house)
+    detection = detector.update(houseColors.code(r, g, b), angle)
+    if detection is not None:
+      detections.append(detection)
+  base.release()
+  # an indicator still under the sensor at the line
+  detection = detector.finish()
+  if detection is not None:
+    detections.append(detection)
+  for color, confidence, position in detections:
+    house.append(color)
+  print(house, [(round(confidence, 2), int(position)) for color, confidence, position in detections])
+  return detections
 
 def checkSurplus(degrees):
   # reverse for certain amount of degrees to check if surplus is present
@@ -155,12 +200,13 @@ def checkSurplus(degrees):
   gyroPID = PID(kp, ki, kd)
   base.reset()
   detected = False
-  while rightMotor.angle() >= degrees:
+  while base.sample() and rightMotor.angle() >= degrees:
     # r, g, b = ev3Col.read('RGB-RAW')
     gyroPID.update(gyro.angle(), kp, ki, kd)
     base.run(speed - gyroPID.correction, speed + gyroPID.correction)
     if ev3ColSensor.reflection() > 0:
       detected = True
+  base.release()
   base.hold()
   return detected
 
@@ -174,7 +220,7 @@ def collectSurplus(degrees, col):
     # start opening claw
     frontClaw.openUp(wait = False)
     base.reset()
-    LineTrack.move(colLeft, 80, lambda: colRight.color() != Color.BLACK, target = 1200)
+    LineTrack.move(colLeft, 80, ColorIs(colRight, Color.BLACK), target = 1200)
     base.hold()
     base.reset()
 
@@ -188,9 +234,12 @@ def collectSurplus(degrees, col):
     base.hold()
   else:    
     base.reset()
-    frontClaw.openUp()
+    # open the claw while reversing away from the surplus
+    frontClaw.openUp(wait = False)
+    opening = scheduler.spawn(frontClaw.moving())
     GyroStraightDeg.move(-60, -160)
     base.hold()
+    scheduler.join(opening)
     GyroTurn.turn(89)
     base.reset()
     if col == Color.YELLOW:
@@ -231,17 +280,17 @@ def collectSurplus(degrees, col):
 def collectGreen():  
   backClaw.run_time(100, 1000, wait = False)
   base.reset()
-  LineTrack.move(colRight, 50, lambda: colLeft.color() != Color.BLACK, side = -1)
+  LineTrack.move(colRight, 50, ColorIs(colLeft, Color.BLACK), side = -1)
   curr = rightMotor.angle()
-  LineTrack.move(colRight, 40, lambda: rightMotor.angle() < 215 + curr, side = -1, target = 200 + curr, reset_I = False)
+  LineTrack.move(colRight, 40, Degrees(rightMotor, 215 + curr), side = -1, target = 200 + curr, reset_I = False)
   base.hold()
   gyro.reset_angle(0)
 
   
   backClaw.run_angle(50, -192, wait = False)
   GyroTurn.turn(-89)
-  GyroStraight.move(-40, lambda: colRight.color() != Color.WHITE)
-  GyroStraight.move(-40, lambda: colRight.color() != Color.BLACK)
+  GyroStraight.move(-40, ColorIs(colRight, Color.WHITE))
+  GyroStraight.move(-40, ColorIs(colRight, Color.BLACK))
   base.hold()
   # reset claw again
   backClaw.run_time(100, 1000, wait = False)
@@ -254,7 +303,7 @@ def collectGreen():
   GyroTurn.turn(89)
 
   base.reset()
-  LineTrack.move(colRight, 50, lambda: rightMotor.angle() < 355, side = -1, target = 355)
+  LineTrack.move(colRight, 50, Degrees(rightMotor, 355), side = -1, target = 355)
   base.hold()
   GyroTurn.turn(-89)
   backClaw.run_target(60, -192)
@@ -300,7 +349,7 @@ def depositHouse(house, time, houseNum):
           frontClaw.goUp(wait = False, full = True)
         else:
           frontClaw.goUp(full = True)
-        GyroStraight.move(60, lambda: colLeft.color() != Color.RED)
+        GyroStraight.move(60, ColorIs(colLeft, Color.RED))
         base.reset()
         GyroStraightDeg.move(60, 180)
         base.hold()
@@ -364,7 +413,7 @@ def depositHouse(house, time, houseNum):
           frontClaw.goUp(wait = False, full = True)
         else:
           frontClaw.goUp(full = True)
-        GyroStraight.move(60, lambda: colLeft.color() != Color.RED)
+        GyroStraight.move(60, ColorIs(colLeft, Color.RED))
         base.reset()
         GyroStraightDeg.move(70, 80)
         base.hold()
@@ -479,7 +528,8 @@ def depositHouse(house, time, houseNum):
     if houseNum == 1 or houseNum == 2:
       base.reset()
       if not clawDeposit:
-        GyroStraight.move(40, lambda: colLeft.reflection() > 30 or colRight.reflection() > 30)
+        # until both sensors read below the line stop threshold
+        GyroStraight.move(40, ReflectionBelow(colLeft, thresholds['lineStop']) & ReflectionBelow(colRight, thresholds['lineStop']))
   
       curr = rightMotor.angle()
       
@@ -505,8 +555,8 @@ def collectBlue():
   base.hold()
   GyroTurn.turn(-45)
   base.reset()
-  LineTrack.move(colRight, 60, lambda: rightMotor.angle() < 600, side = -1)
-  LineTrack.move(colRight, 30, lambda: colLeft.color() != Color.BLACK, side = -1, reset_I = False)
+  LineTrack.move(colRight, 60, Degrees(rightMotor, 600), side = -1)
+  LineTrack.move(colRight, 30, ColorIs(colLeft, Color.BLACK), side = -1, reset_I = False)
   base.hold()
   wait(50)
   gyro.reset_angle(0)
@@ -544,7 +594,7 @@ def collectBlue():
   
   # collect next 2
   GyroTurn.turn(89)
-  GyroStraight.move(50,  lambda: colRight.color() != Color.BLACK)
+  GyroStraight.move(50,  ColorIs(colRight, Color.BLACK))
   curr = rightMotor.angle() 
   GyroStraightDeg.move(60, 255 + curr)
   base.hold()
@@ -553,7 +603,7 @@ def collectBlue():
   backClaw.run_target(-30, -225)
  
   base.reset()
-  GyroStraight.move(-20, lambda: rightMotor.angle() > -120)
+  GyroStraight.move(-20, Degrees(rightMotor, -120))
   base.hold()
   backClaw.run_target(15, 75)
   GyroTurn.maxSpeed = 40
@@ -567,10 +617,10 @@ def collectYellow():
   
   base.reset()  
   frontClaw.solar(wait = False)
-  LineTrack.move(colLeft, 70, lambda: rightMotor.angle() < 700)
-  LineTrack.move(colLeft, 40, lambda: colRight.color() != Color.BLACK, reset_I = False)
+  LineTrack.move(colLeft, 70, Degrees(rightMotor, 700))
+  LineTrack.move(colLeft, 40, ColorIs(colRight, Color.BLACK), reset_I = False)
   curr = rightMotor.angle()
-  LineTrack.move(colLeft, 40, lambda: rightMotor.angle() < curr + 105, reset_I = False)
+  LineTrack.move(colLeft, 40, Degrees(rightMotor, curr + 105), reset_I = False)
   base.hold()
   GyroTurn.turn(89)
   # push solar panels
@@ -578,15 +628,15 @@ def collectYellow():
   frontClaw.hold()
   
   base.reset()
-  LineTrack.move(colRight, 30, lambda: rightMotor.angle() < 550, threshold = 40)
+  LineTrack.move(colRight, 30, Degrees(rightMotor, 550), threshold = thresholds['lineTrackSlow'])
   base.hold()
   gyro.reset_angle(0)
   wait(10)
-  GyroStraight.move(30, lambda: colLeft.color() != Color.BLACK and colRight.color() != Color.BLACK)
-  GyroStraight.move(30, lambda: colLeft.color() != Color.WHITE and colRight.color() != Color.WHITE)
+  GyroStraight.move(30, ColorIs(colLeft, Color.BLACK) | ColorIs(colRight, Color.BLACK))
+  GyroStraight.move(30, ColorIs(colLeft, Color.WHITE) | ColorIs(colRight, Color.WHITE))
 
   curr = rightMotor.angle()
-  GyroStraight.move(30, lambda: rightMotor.angle() < 80 + curr)
+  GyroStraight.move(30, Degrees(rightMotor, 80 + curr))
   base.hold()
   frontClaw.run_target(60, 570) 
 
@@ -595,13 +645,13 @@ def collectYellow():
   frontClaw.hold()
  
   base.reset()
-  GyroStraight.move(-30, lambda: rightMotor.angle() > -18)
+  GyroStraight.move(-30, Degrees(rightMotor, -18))
   base.hold()
   # track to first 2 yellow and grab with claw
   GyroTurn.turn(-89)
   frontClaw.openUp(wait = False)
   base.reset()
-  LineTrack.move(colRight, 55, lambda: rightMotor.angle() < 500, side = -1)
+  LineTrack.move(colRight, 55, Degrees(rightMotor, 500), side = -1)
   GyroStraightDeg.move(60, 620)
   base.hold()
   GyroTurn.turn(89)
@@ -619,9 +669,9 @@ def collectYellow():
   base.reset()
   frontClaw.goUp(wait = False)
   backClaw.run_time(100, 1200, wait = False)
-  LineTrack.move(colLeft, 60, lambda: colRight.color() != Color.BLACK)
+  LineTrack.move(colLeft, 60, ColorIs(colRight, Color.BLACK))
   curr = rightMotor.angle()
-  LineTrack.move(colLeft, 60, lambda: rightMotor.angle() < 600 + curr, reset_I = False)
+  LineTrack.move(colLeft, 60, Degrees(rightMotor, 600 + curr), reset_I = False)
   #gyro.reset_angle(0)
   GyroStraightDeg.move(60, 730 + curr)
   base.hold()
@@ -645,11 +695,11 @@ def depositBatteryFront(numCube):
   wait(50)
   frontClaw.goDown(-50, -300)
   if numCube == 4:
-    GyroStraight.move(-10, lambda: colRight.color() != Color.BLACK and colLeft.color() != Color.BLACK)
+    GyroStraight.move(-10, ColorIs(colRight, Color.BLACK) | ColorIs(colLeft, Color.BLACK))
     
   else:
 
-    GyroStraight.move(-30, lambda: colRight.color() != Color.BLACK and colLeft.color() != Color.BLACK)
+    GyroStraight.move(-30, ColorIs(colRight, Color.BLACK) | ColorIs(colLeft, Color.BLACK))
     
   base.hold()
 
@@ -688,8 +738,8 @@ def depositBattery(time, extraCol):
   if (time == 1 and extraCol != Color.GREEN and numSurplus == 0 and surplus != Color.GREEN):
     frontClaw.goUp(wait = False)
     base.reset()
-    LineTrack.move(colLeft, 70, lambda: rightMotor.angle() < 400)
-    LineTrack.move(colLeft, 30, lambda: colRight.color() != Color.BLACK, reset_I = False)
+    LineTrack.move(colLeft, 70, Degrees(rightMotor, 400))
+    LineTrack.move(colLeft, 30, ColorIs(colRight, Color.BLACK), reset_I = False)
     base.hold()
     base.reset()
     GyroStraightDeg.move(-40, -70)
@@ -708,8 +758,8 @@ def depositBattery(time, extraCol):
 
         frontClaw.goDown(wait = False)
         
-    LineTrack.move(colLeft, 60, lambda: rightMotor.angle() < 400)
-    LineTrack.move(colLeft, 30, lambda: colRight.color() != Color.BLACK, reset_I = False)
+    LineTrack.move(colLeft, 60, Degrees(rightMotor, 400))
+    LineTrack.move(colLeft, 30, ColorIs(colRight, Color.BLACK), reset_I = False)
     base.hold()
   
     
@@ -753,8 +803,8 @@ def getExtra():
   
 def checkHouse1():
   base.reset()
-  GyroStraight.move(85, lambda: rightMotor.angle() < 200)   
-  LineTrack.move(colRight, 80, lambda: colLeft.color() != Color.BLACK, side = -1)  
+  GyroStraight.move(85, Degrees(rightMotor, 200))   
+  LineTrack.move(colRight, 80, ColorIs(colLeft, Color.BLACK), side = -1)  
   curr = rightMotor.angle()
   GyroStraightDeg.move(60, 320 + curr)
   base.hold()
@@ -777,16 +827,15 @@ def returnHouse1():
     GyroTurn.turn(-89)      
 
   base.reset()
-  LineTrack.move(colRight, 85, lambda: colLeft.color() != Color.BLACK, side = -1)
+  LineTrack.move(colRight, 85, ColorIs(colLeft, Color.BLACK), side = -1)
   curr = rightMotor.angle()
-  LineTrack.move(colRight, 85, lambda: rightMotor.angle() < 1250 + curr, side = -1, target = 1100 + curr, reset_I = False)
+  LineTrack.move(colRight, 85, Degrees(rightMotor, 1250 + curr), side = -1, target = 1100 + curr, reset_I = False)
   base.hold()
 
   depositHouse(Houses[0], 1, 1)
   
   # return to house 2 intersection
-  LineTrack.move(colRight, 80, lambda: colLeft.color() != Color.BLACK, side = -1)
-  LineTrack.move(colRight, 80, lambda: colLeft.color() != Color.WHITE, side = -1, reset_I = False)
+  LineTrack.move(colRight, 80, Crossings(colLeft, rightMotor, 1, thresholds['lineTrack'], after = crossingAfter), side = -1)
 
 def checkHouse2():
   # scan house 2
@@ -803,13 +852,13 @@ def checkHouse2():
       # only raise claw if it hasnt been raised at house 1
       frontClaw.goUp(speed = 30, wait = False)
     if surplus == Color.GREEN and Color.GREEN not in Houses[0] and len(Houses[0]) == 2:
-      LineTrack.move(colRight, 40, lambda: colLeft.color() != Color.BLACK, side = -1)
+      LineTrack.move(colRight, 40, ColorIs(colLeft, Color.BLACK), side = -1)
     else:
-      LineTrack.move(colRight, 70, lambda: colLeft.color() != Color.BLACK, side = -1, reset_I = False)
+      LineTrack.move(colRight, 70, ColorIs(colLeft, Color.BLACK), side = -1, reset_I = False)
       
     curr = rightMotor.angle()
 
-    LineTrack.move(colRight, 40, lambda: rightMotor.angle() < 350 + curr, side = -1, target = 350 + curr, reset_I = False)
+    LineTrack.move(colRight, 40, Degrees(rightMotor, 350 + curr), side = -1, target = 350 + curr, reset_I = False)
     base.hold()
     gyro.reset_angle(0)
     wait(10)
@@ -833,16 +882,16 @@ def checkHouse2():
 def checkHouse3():
   # move to house 3 
   base.reset()
-  LineTrack.move(colLeft, 65, lambda: rightMotor.angle() < 500)
-  LineTrack.move(colLeft, 40, lambda: colRight.color() != Color.BLACK, reset_I = False)
+  LineTrack.move(colLeft, 65, Degrees(rightMotor, 500))
+  LineTrack.move(colLeft, 40, ColorIs(colRight, Color.BLACK), reset_I = False)
 
   curr = rightMotor.angle()
-  LineTrack.move(colLeft, 40, lambda: rightMotor.angle() < 105 + curr, reset_I = False)
+  LineTrack.move(colLeft, 40, Degrees(rightMotor, 105 + curr), reset_I = False)
   base.hold()
   GyroTurn.turn(89)
 
   base.reset()
-  LineTrack.move(colRight, 60, lambda: rightMotor.angle() < 805)
+  LineTrack.move(colRight, 60, Degrees(rightMotor, 805))
   base.hold()  
 
   GyroTurn.turn(-89)
@@ -874,7 +923,7 @@ def checkHouse3():
 def returnBase():
   curr = rightMotor.angle()
   if Color.BLUE in Houses[0] or Color.YELLOW in Houses[0]:
-    LineTrack.move(colLeft, 80, lambda: rightMotor.angle() < 880 + curr, target = 880 + curr)
+    LineTrack.move(colLeft, 80, Degrees(rightMotor, 880 + curr), target = 880 + curr)
     base.hold()
     depositHouse(Houses[0], 2, 1)
    
@@ -888,12 +937,14 @@ def returnBase():
     frontClaw.goUp(wait = False, load = False)
     backClaw.run_time(100, 500, wait = False)
  
-    LineTrack.move(colLeft, 80, lambda: colRight.color() != Color.BLACK)
+    LineTrack.move(colLeft, 80, ColorIs(colRight, Color.BLACK))
     base.hold()
     GyroTurn.turn(-90)
     
 
  
+  # driven outside the move loops, the turn's stop can't be read now
+  base.braking.discard()
   leftMotor.run_time(CorrectSpeed(-92), 2000, wait = False)
   rightMotor.run_time(CorrectSpeed(-100), 2000)
   base.hold()
@@ -985,15 +1036,12 @@ def main():
       PID_SingleMotorTurn(base, gyro, -89, 0, 1)
     
     base.reset()      
-    LineTrack.move(colRight, 70, lambda: rightMotor.angle() < 750, side = -1, target = 700, accel = True)
+    LineTrack.move(colRight, 70, Degrees(rightMotor, 750), side = -1, target = 700, accel = True)
     base.hold()
 
     depositHouse(Houses[1], 2, 2)
     base.reset()
-    LineTrack.move(colLeft, 80, lambda: colRight.color() != Color.BLACK, accel = True)
-    LineTrack.move(colLeft, 80, lambda: colRight.color() != Color.WHITE, reset_I = False)
-    LineTrack.move(colLeft, 80, lambda: colRight.color() != Color.BLACK, reset_I = False)
-    LineTrack.move(colLeft, 80, lambda: colRight.color() != Color.WHITE, reset_I = False)
+    LineTrack.move(colLeft, 80, Crossings(colRight, rightMotor, 2, thresholds['lineTrack'], after = crossingAfter), accel = True)
     
   else:
     if extraCol == Color.BLUE or (surplus == Color.BLUE and numSurplus == 0):
@@ -1001,21 +1049,54 @@ def main():
     else:
       PID_SingleMotorTurn(base, gyro, 89, 1, 0) 
     base.reset()
-    LineTrack.move(colLeft, 80, lambda: colRight.color() != Color.BLACK, accel = True)
-    LineTrack.move(colLeft, 80, lambda: colRight.color() != Color.WHITE, reset_I = False)
+    LineTrack.move(colLeft, 80, Crossings(colRight, rightMotor, 1, thresholds['lineTrack'], after = crossingAfter), accel = True)
   
   # deposit last energy and return to base
   returnBase()
 
-frontClaw.dc(dir = -1)
-wait(2000)
-frontClaw.reset()
-
-# start = clock.time()
-# main()
-# end = clock.time() - start
-# print(end/1000)
-collectYellow()
+# mission phases and primitives timed by profile()
+PHASES = ('main', 'checkHouse1', 'returnHouse1', 'checkHouse2', 'checkHouse3',
+          'checkSurplus', 'collectSurplus', 'collectGreen', 'collectYellow', 'collectBlue',
+          'depositHouse', 'depositBattery', 'depositBatteryFront', 'depositBatteryBack',
+          'returnBase', 'scanHouseEV3', 'PID_SingleMotorTurn', 'PID_AngleOffSet', 'PID_LineSquare')
+PRIMITIVES = (
+  ('GyroTurn', GyroTurn, ('turn',)),
+  ('GyroStraight', GyroStraight, ('move',)),
+  ('GyroStraightDeg', GyroStraightDeg, ('move',)),
+  ('LineTrack', LineTrack, ('move',)),
+  ('base', base, ('hold', 'run_time', 'run_target')),
+  ('frontClaw', frontClaw, ('run_target', 'run_time', 'run_angle')),
+  ('backClaw', backClaw, ('run_target', 'run_time', 'run_angle')),
+)
+
+def profile(entry = 'main', path = None):
+  # run a mission function with every phase and primitive on the timeline,
+  # optionally saved as csv
+  timeline = Timeline()
+  timeline.instrument(globals(), PHASES)
+  for label, obj, names in PRIMITIVES:
+    timeline.instrumentMethods(obj, label, names)
+  try:
+    globals()[entry]()
+  finally:
+    timeline.report()
+    if path is not None:
+      timeline.save(path)
+  return timeline
+
+if __name__ == "__main__":
+  # zero the front claw against its end stop, skipped when imported (sim/)
+  frontClaw.dc(dir = -1)
+  wait(2000)
+  frontClaw.reset()
+
+  # profile('main')
+  # telemetry = Telemetry()
+  # telemetry.attach(base, LineTrack, GyroStraight, GyroStraightDeg, GyroTurn)
+  # Odometry(665, 1040, -90).attach(base)
+  collectYellow()
+  # base.braking.report()
+  base.braking.save()
 
 # FIX COLLECT YELLOW SHENANIGANS
 # STOP PUSHING BLUE WALL
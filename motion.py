@@ -0,0 +1,101 @@
+# speed profiles for distance moves
+#
+# a profile maps encoder position to speed (percent): ramp up from minSpeed
+# after the start, cruise at maxSpeed, ramp down to reach minSpeed exactly at
+# the target and crawl at minSpeed past it. the ramps are precomputed per
+# degree of travel and shared between every move with the same speeds, so a
+# controller only does two table lookups per tick
+#
+#   profile = MotionProfile(0, 500, 60, 35)
+#   speed = profile.speed(abs(rightMotor.angle()))
+
+import math
+
+from helper import CorrectSpeed
+
+# deg/s for one percent of speed
+DEG_PER_PERCENT = CorrectSpeed(1)
+
+# deg/s^2, deg/s^3
+ACCEL = 2000
+JERK = None
+
+_ramps = {}
+
+
+def ramp(minSpeed, maxSpeed, accel = ACCEL, jerk = JERK):
+  # speed (percent) after each degree travelled from minSpeed, until maxSpeed.
+  # constant acceleration (trapezoid) or, with jerk, an S-curve
+  key = (minSpeed, maxSpeed, accel, jerk)
+  table = _ramps.get(key)
+  if table is not None:
+    return table
+
+  v0 = abs(minSpeed) * DEG_PER_PERCENT
+  v1 = abs(maxSpeed) * DEG_PER_PERCENT
+  table = [v0]
+  if jerk is None:
+    s = 1
+    v = v0
+    while v < v1:
+      v = math.sqrt(v0 * v0 + 2 * accel * s)
+      table.append(min(v, v1))
+      s += 1
+  else:
+    # integrate the jerk-limited ramp in time, sampling each whole degree
+    dt = 0.001
+    v = v0
+    a = 0.0
+    s = 0.0
+    mark = 1
+    while v < v1:
+      if v1 - v <= a * a / (2 * jerk):
+        a = max(a - jerk * dt, jerk * dt)
+      else:
+        a = min(a + jerk * dt, accel)
+      v = min(v + a * dt, v1)
+      s += v * dt
+      while s >= mark:
+        table.append(v)
+        mark += 1
+  table = [v / DEG_PER_PERCENT for v in table]
+  _ramps[key] = table
+  return table
+
+
+class MotionProfile:
+  def __init__(self,
+               start,
+               target,
+               maxSpeed,
+               minSpeed,
+               accelerate = True,
+               decelerate = True,
+               accel = ACCEL,
+               jerk = JERK):
+    # start and target are encoder positions, target None for an open-ended
+    # move that never decelerates
+    self.start = abs(start)
+    self.target = abs(target) if target is not None else None
+    self.maxSpeed = abs(maxSpeed)
+    # a slow move never speeds up to the crawl speed
+    self.minSpeed = min(abs(minSpeed), self.maxSpeed)
+    table = ramp(self.minSpeed, self.maxSpeed, accel, jerk)
+    self.up = table if accelerate else []
+    self.down = table if decelerate and target is not None else []
+    self.upLength = len(self.up)
+    self.downLength = len(self.down)
+
+  def speed(self, position):
+    # position is abs(encoder angle), returns the speed magnitude in percent
+    i = int(position - self.start)
+    if i < 0:
+      i = 0
+    if self.target is None:
+      return self.up[i] if i < self.upLength else self.maxSpeed
+    j = int(self.target - position)
+    if j < 0:
+      return self.minSpeed
+    a = self.up[i] if i < self.upLength else self.maxSpeed
+    b = self.down[j] if j < self.downLength else self.maxSpeed
+    return a if a < b else b
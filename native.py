@@ -0,0 +1,102 @@
+# straights and turns run by the firmware's DriveBase
+#
+# the Python move loops send both wheel speeds every iteration, so the
+# correction rate is whatever the interpreter manages. here the firmware
+# DriveBase keeps the wheels synchronised and ramps them on its own, and
+# Python only trims its turn rate from the gyro every period ms, a tick of
+# the base like any move loop (background tasks, odometry and telemetry
+# advance, the condition is checked). the last stretch of a straight and the
+# whole of a turn are blocking firmware moves that end in a hold. the switch
+# is per move, and a native move takes no gains, brake or ramp options:
+#
+#   NativeDrive(base).attach()
+#   GyroStraightDeg.move(80, 1200, native = True)
+#   GyroTurn.turn(90, native = True)
+#
+# speeds are the percent the loops take, targets the right encoder angle
+# like PID_GyroStraightDegrees. afterwards the gyro reads 0 along the new
+# heading after a turn, as with PID_GyroTurn
+
+import math
+
+from pybricks.robotics import DriveBase
+from pybricks.tools import wait
+from helper import CorrectSpeed, WHEEL_DIAMETER, AXLE_TRACK
+from conditions import Never
+
+# ms between gyro corrections, deg/s of turn rate per degree off heading
+PERIOD = 20
+KP = 4
+# encoder degrees left to the firmware's own straight at the end
+FINISH = 120
+# deg/s of turn rate and deg off target the firmware turn is trimmed to
+TURN_RATE = 300
+TOLERANCE = 1
+
+
+class NativeDrive:
+  def __init__(self, base, wheelDiameter = WHEEL_DIAMETER, axleTrack = AXLE_TRACK, period = PERIOD, kp = KP):
+    self.base = base
+    self.drive = DriveBase(base.leftMotor.motor, base.rightMotor.motor, wheelDiameter, axleTrack)
+    self.mmPerDeg = math.pi * wheelDiameter / 360
+    # percent of wheel speed difference per deg/s of turn rate
+    self.spin = axleTrack / wheelDiameter * 100 / 1400
+    self.period = period
+    self.kp = kp
+
+  def attach(self):
+    self.base.native = self
+    return self
+
+  def detach(self):
+    self.base.native = None
+
+  def straight(self, speed, target, heading = 0, finish = FINISH, condition = Never()):
+    # drive until the right encoder reaches target, holding the gyro on
+    # heading, or until condition ends it
+    base = self.base
+    drive = self.drive
+    gyro = base.gyro
+    motor = base.rightMotor
+    degs = abs(CorrectSpeed(speed))
+    if base.power is not None:
+      degs *= base.power.scale(degs)
+    mmps = degs * self.mmPerDeg
+    polarity = 1 if target >= motor.angle() else -1
+    percent = polarity * degs * 100 / 1400
+    drive.settings(straight_speed = mmps)
+    reached = False
+    while base.sample() and condition():
+      if (target - motor.angle()) * polarity <= finish:
+        reached = True
+        break
+      rate = -self.kp * (gyro.angle() - heading)
+      drive.drive(polarity * mmps, rate)
+      base.track(percent + rate * self.spin, percent - rate * self.spin)
+      wait(self.period)
+    base.release()
+    drive.stop()
+    if reached:
+      remaining = target - motor.angle()
+      if remaining * polarity > 0:
+        drive.straight(remaining * self.mmPerDeg)
+    base.hold()
+    if base.odometry is not None:
+      base.odometry.update()
+
+  def turn(self, angle, rate = TURN_RATE, tolerance = TOLERANCE):
+    # turn to gyro angle, then trim what the wheels slipped
+    base = self.base
+    drive = self.drive
+    gyro = base.gyro
+    base.braking.discard()
+    drive.settings(turn_rate = rate)
+    drive.turn(angle - gyro.angle())
+    error = angle - gyro.angle()
+    if abs(error) > tolerance:
+      drive.turn(error)
+    drive.stop()
+    base.hold()
+    if base.odometry is not None:
+      base.odometry.update()
+    gyro.reset_angle(gyro.angle() - angle)
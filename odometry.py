@@ -0,0 +1,109 @@
+# field pose from the wheel encoders and the gyro
+#
+# Base.run() updates the estimate once per loop iteration from the tick's
+# readings: the encoders give the distance travelled and the gyro the
+# heading whenever the loop read it this tick, otherwise the encoder
+# difference carries the heading until the next gyro reading. the field frame
+# is the simulator's: mm, y pointing down, heading in degrees clockwise like
+# the gyro. resets of the encoders or the gyro through the base are absorbed,
+# so legs can keep resetting to zero while the pose stays continuous
+#
+#   odometry = Odometry(665, 1040, -90)
+#   odometry.attach(base)
+#   ...
+#   x, y, heading = odometry.pose()
+#
+# attaching costs the encoder reads a loop doesn't already do itself (both
+# are read every tick), so it is off unless attached
+
+import math
+
+from helper import WHEEL_DIAMETER, AXLE_TRACK
+
+
+class Odometry:
+  def __init__(self, x = 0, y = 0, heading = 0, wheelDiameter = WHEEL_DIAMETER, axleTrack = AXLE_TRACK):
+    self.x = x
+    self.y = y
+    self.heading = heading
+    self.mmPerDeg = math.pi * wheelDiameter / 360
+    # heading change (deg) per degree of left - right encoder difference
+    self.degPerDiff = math.degrees(self.mmPerDeg / axleTrack)
+    self.base = None
+    self.left = 0
+    self.right = 0
+    # field heading = gyroOffset + gyro angle
+    self.gyroOffset = heading
+
+  def attach(self, base):
+    self.base = base
+    base.odometry = self
+    self.left = base.leftMotor.angle()
+    self.right = base.rightMotor.angle()
+    if base.gyro is not None:
+      self.gyroOffset = self.heading - base.gyro.angle()
+
+  def detach(self):
+    self.base.odometry = None
+    self.base = None
+
+  def set(self, x, y, heading = None):
+    # the robot is at x, y now, e.g. after squaring on a known line
+    self.update()
+    self.x = x
+    self.y = y
+    if heading is not None:
+      self.gyroOffset += heading - self.heading
+      self.heading = heading
+
+  def update(self, gyroAngle = None):
+    base = self.base
+    left = base.leftMotor.angle()
+    right = base.rightMotor.angle()
+    dl = left - self.left
+    dr = right - self.right
+    self.left = left
+    self.right = right
+    last = self.heading
+    gyro = base.gyro
+    if gyroAngle is not None:
+      heading = self.gyroOffset + gyroAngle
+    elif gyro is not None and base.sampling and gyro.angleTick == base.tick:
+      heading = self.gyroOffset + gyro.lastAngle
+    else:
+      heading = last + (dl - dr) * self.degPerDiff
+    self.heading = heading
+    distance = (dl + dr) * 0.5 * self.mmPerDeg
+    if distance:
+      middle = math.radians((last + heading) * 0.5)
+      self.x += distance * math.cos(middle)
+      self.y += distance * math.sin(middle)
+
+  def pose(self):
+    self.update()
+    return self.x, self.y, self.heading
+
+  def encoderReset(self, motor, angle):
+    # called by SampledMotor.reset_angle before the reset
+    self.update()
+    if motor is self.base.leftMotor:
+      self.left = angle
+    elif motor is self.base.rightMotor:
+      self.right = angle
+
+  def gyroReset(self, angle):
+    # called by SampledGyro.reset_angle before the reset
+    self.update(self.base.gyro.angle())
+    self.gyroOffset = self.heading - angle
+
+  def bearing(self, x, y):
+    # field heading (deg) from the robot to x, y
+    return math.degrees(math.atan2(y - self.y, x - self.x))
+
+  def turnTo(self, x, y):
+    # shortest turn (deg, clockwise positive) to face x, y
+    turn = (self.bearing(x, y) - self.heading) % 360
+    return turn - 360 if turn > 180 else turn
+
+  def distanceTo(self, x, y):
+    return math.sqrt((x - self.x) ** 2 + (y - self.y) ** 2)
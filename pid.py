@@ -1,4 +1,8 @@
+import math
+
 from helper import *
+from conditions import *
+from motion import MotionProfile, ACCEL, JERK
 from pybricks.hubs import EV3Brick
 from pybricks.ev3devices import (Motor, ColorSensor, GyroSensor)
 from pybricks.nxtdevices import ColorSensor as nxtColorSensor
@@ -7,12 +11,15 @@ from pybricks.tools import wait, StopWatch, DataLog
 from pybricks.robotics import DriveBase
 from pybricks.media.ev3dev import SoundFile, ImageFile
 from pybricks.iodevices import Ev3devSensor
+from utime import ticks_us, ticks_diff
+from telemetry import START_LOOP, START_INTEGRAL, START_NEW
 
 class PID(object):
   def __init__(self, 
                kp: float,
                ki: float, 
-               kd: float):
+               kd: float,
+               period: float = None):
     self.kp = kp
     self.ki = ki
     self.kd = kd
@@ -20,9 +27,55 @@ class PID(object):
     self.lastError = 0
     self.correction = 0
     self.stopwatch = StopWatch()
+    # timed mode: target loop period in ms, the gains keep their meaning at
+    # this period and update() scales by the measured dt. None is the
+    # original per-call update
+    self.period = period
+    self.lastTime = None
+    self.tickStart = None
+    self.dt = period
+    self.ticks = 0
+    self.overruns = 0
+    self.worstTick = 0
+    # Telemetry receiving error and correction on every update, under name,
+    # with the resets since the last update as start flags
+    self.telemetry = None
+    self.name = type(self).__name__
+    self.starts = START_NEW
     
   def resetIntegral(self):
     self.integral = 0
+    self.starts |= START_INTEGRAL
+    
+  def startLoop(self):
+    # call before a move loop so the first dt and the overrun counts
+    # don't include the time since the last move
+    self.lastTime = None
+    self.tickStart = None
+    self.ticks = 0
+    self.overruns = 0
+    self.worstTick = 0
+    self.starts |= START_LOOP
+    
+  def pace(self):
+    # in timed mode, hold each iteration to the target period and count the
+    # ones that ran over
+    if self.period is None:
+      return
+    budget = self.period * 1000
+    now = ticks_us()
+    if self.tickStart is not None:
+      elapsed = ticks_diff(now, self.tickStart)
+      if elapsed > budget:
+        self.overruns += 1
+        if elapsed > self.worstTick:
+          self.worstTick = elapsed
+      else:
+        while elapsed < budget:
+          now = ticks_us()
+          elapsed = ticks_diff(now, self.tickStart)
+    self.tickStart = now
+    self.ticks += 1
     
   def update(self, 
              error: float, 
@@ -37,14 +90,79 @@ class PID(object):
     if kd is None:
       kd = self.kd
     self.proportional = kp * error
-    if modded_integral:
-      self.integral = self.integral * 0.5 + error
+    if self.period is None:
+      if modded_integral:
+        self.integral = self.integral * 0.5 + error
+      else:
+        self.integral += error
+      self.derivative =  kd * (error - self.lastError)
     else:
-      self.integral += error
-    self.derivative =  kd * (error - self.lastError)
+      # scale = dt / period, identical to the untimed update when on time
+      now = ticks_us()
+      if self.lastTime is None:
+        scale = 1
+      else:
+        self.dt = ticks_diff(now, self.lastTime) / 1000
+        scale = self.dt / self.period
+      self.lastTime = now
+      if modded_integral:
+        self.integral = self.integral * 0.5 ** scale + error * scale
+      else:
+        self.integral += error * scale
+      if scale > 0:
+        self.derivative = kd * (error - self.lastError) / scale
     self.correction = self.proportional  + ki * self.integral + self.derivative
     self.lastError = error
+    if self.telemetry is not None:
+      self.telemetry.pid(error, self.correction, self.name, self.starts)
+    self.starts = 0
     
+
+class GainSchedule:
+  # speed-dependent gains, breakpoints [(speed, kp, ki, kd), ...] are
+  # interpolated linearly into a table with one (kp, ki, kd) per percent of
+  # speed so the control loop only indexes it
+  size = 201
+  
+  def __init__(self, breakpoints):
+    self.breakpoints = sorted(breakpoints)
+    points = self.breakpoints
+    table = []
+    for speed in range(self.size):
+      if speed <= points[0][0]:
+        gains = points[0][1:]
+      elif speed >= points[-1][0]:
+        gains = points[-1][1:]
+      else:
+        i = 1
+        while points[i][0] < speed:
+          i += 1
+        s0, s1 = points[i - 1], points[i]
+        t = (speed - s0[0]) / (s1[0] - s0[0])
+        gains = tuple([a + (b - a) * t for a, b in zip(s0[1:], s1[1:])])
+      table.append(gains)
+    self.table = table
+    
+  def gains(self, speed):
+    i = int(abs(speed) + 0.5)
+    return self.table[i if i < self.size else self.size - 1]
+  
+  def fixed(self, kp = None, ki = None, kd = None):
+    # same schedule with the given gains pinned
+    points = []
+    for speed, pkp, pki, pkd in self.breakpoints:
+      points.append((speed, 
+                     pkp if kp is None else kp, 
+                     pki if ki is None else ki, 
+                     pkd if kd is None else kd))
+    return GainSchedule(points)
+
+
+def lineTrackSchedule(kp, ki, kd, reference = 85, kpSlope = 0.002, kdSlope = 0.05):
+  # the original tuning: gains drop linearly below the reference speed
+  return GainSchedule([(0, kp - reference * kpSlope, ki, kd - reference * kdSlope),
+                       (100, kp + (100 - reference) * kpSlope, ki, kd + (100 - reference) * kdSlope)])
+
    
 class PID_LineTrack(PID):
   def __init__(self, 
@@ -52,10 +170,17 @@ class PID_LineTrack(PID):
                kp: float, 
                ki: float, 
                kd: float, 
-               threshold: int):
-    super().__init__(kp, ki, kd)
+               threshold: int,
+               period: float = None,
+               schedule: GainSchedule = None):
+    super().__init__(kp, ki, kd, period)
     self.base = base
     self.threshold = threshold    
+    if schedule is None:
+      schedule = lineTrackSchedule(kp, ki, kd)
+    self.schedule = schedule
+    self.profileAccel = ACCEL
+    self.profileJerk = JERK
     
   def move(self, 
            sensor: ColorSensor,
@@ -70,51 +195,43 @@ class PID_LineTrack(PID):
            minSpeed = 35,
            accel = False, 
            deccel = True, 
-           reset_I = True):
-    # update control constants if given
+           reset_I = True,
+           schedule: GainSchedule = None):
+    # update control constants if given, gains passed in are fixed for the
+    # whole move, the rest come from the speed schedule
+    if schedule is None:
+      schedule = self.schedule
+    if kp is not None or ki is not None or kd is not None:
+      schedule = schedule.fixed(kp, ki, kd)
+    table = schedule.table
+    top = schedule.size - 1
 
     if reset_I:
       self.resetIntegral()
+    self.startLoop()
     if threshold is None:
       threshold = self.threshold
     speed = maxSpeed
-    if target is not None:
-      rate = maxSpeed / (target * 0.04)
-    else:
-      rate = 1
-    if accel:
-      speed = maxSpeed /abs(maxSpeed) * minSpeed
-    slowingDown = False
-    while condition():
-      kp = self.kp - (85 - speed) * 0.002
-      #ki = self.ki - (85 - speed) * 0.00001
-      kd = self.kd - (85 - speed) * 0.05
+    polarity = 1 if maxSpeed >= 0 else -1
+    profile = None
+    if accel or target is not None:
+      profile = MotionProfile(self.base.rightMotor.angle(), target, maxSpeed, minSpeed, 
+                              accelerate = accel, decelerate = deccel,
+                              accel = self.profileAccel, jerk = self.profileJerk)
+    while self.base.sample() and condition():
+      self.pace()
+      if profile is not None: # acceleration and decceleration
+        speed = polarity * profile.speed(abs(self.base.rightMotor.angle()))
+      # gains at the speed this tick runs (and records)
+      i = int((speed if speed >= 0 else -speed) + 0.5)
+      kp, ki, kd = table[i if i < top else top]
       #print(kp, ki, kd)
       error = threshold - sensor.reflection()
       
       self.update(error, kp, ki, kd)
-      if accel and target is None:
-        if speed < maxSpeed:
-            speed = speed + rate
-        if speed > maxSpeed:
-          speed = maxSpeed
-      if target is not None: # decceleration
-        angle = self.base.rightMotor.angle()
-        if abs(angle) > abs(target):
-          speed = minSpeed
-        if deccel and abs(abs(angle) - abs(target)) <= 100 * maxSpeed / 40:
-          slowingDown = True
-          if abs(speed) > minSpeed:
-            speed = speed - rate 
-          if speed < minSpeed:
-            speed = minSpeed
-        elif accel and not slowingDown:
-          if speed < maxSpeed:
-            speed = speed + rate
-          if speed > maxSpeed:
-            speed = maxSpeed
       #print(speed + side * self.correction, speed - side * self.correction)
       self.base.run(speed + side * self.correction, speed - side * self.correction)   
+    self.base.release()
       
           
 
@@ -124,8 +241,9 @@ class PID_GyroStraight(PID):
                kp: float,
                ki: float,
                kd: float,
-               gyro: GyroSensor):
-    super().__init__(kp, ki, kd)
+               gyro: GyroSensor,
+               period: float = None):
+    super().__init__(kp, ki, kd, period)
     self.base = base
     self.gyro = gyro
     
@@ -140,8 +258,9 @@ class PID_GyroStraight(PID):
            minSpeed = 0, 
            precision = False):
     self.resetIntegral()
-    while condition():
-      
+    self.startLoop()
+    while self.base.sample() and condition():
+      self.pace()
       error = self.gyro.angle() - target
       self.update(error, kp, ki, kd)
       #print(error + target)
@@ -153,6 +272,7 @@ class PID_GyroStraight(PID):
           self.correction = minSpeed * polarity
       
       self.base.run(speed - self.correction, speed + self.correction)
+    self.base.release()
      
         
         
@@ -163,10 +283,15 @@ class PID_GyroStraightDegrees(PID):
                kp: float,
                ki: float,
                kd: float,
-               gyro: GyroSensor):
-    super().__init__(kp, ki, kd)
+               gyro: GyroSensor,
+               period: float = None):
+    super().__init__(kp, ki, kd, period)
     self.base = base
     self.gyro = gyro
+    # acceleration (deg/s^2) and jerk (deg/s^3, None for a trapezoid) of the
+    # speed profile
+    self.profileAccel = ACCEL
+    self.profileJerk = JERK
     
   def move(self, 
            maxSpeed: float, 
@@ -176,36 +301,36 @@ class PID_GyroStraightDegrees(PID):
            kd: float = None,
            minSpeed = 35, 
            accel = False,
-           deccel = True, condition = lambda: True):
+           deccel = True, condition = Never(),
+           brake = False,
+           native = False):
+    # brake: stop early by the predicted braking distance and hold, see
+    # braking.py. native: run by the firmware DriveBase, see native.py
+    if native:
+      if brake or accel or not deccel or kp is not None or ki is not None or kd is not None:
+        raise ValueError('a native move takes no gains, brake or ramp options')
+      self.base.native.straight(maxSpeed, target, condition = condition)
+      return
     angle = self.base.rightMotor.angle()
-    rate =  min(abs(2 * maxSpeed / (target * 0.04)), 10)
-   
     polarity = maxSpeed /abs(maxSpeed)
-    if accel:
-      speed = polarity * minSpeed
-    else:
-      speed = maxSpeed
+    profile = MotionProfile(angle, target, maxSpeed, minSpeed, accelerate = accel, decelerate = deccel,
+                            accel = self.profileAccel, jerk = self.profileJerk)
     
+    stop = Brake(self.base, self.base.rightMotor, target) if brake else Never()
     self.resetIntegral()
-    while (target < 0 and angle > target) or (target >= 0 and angle < target) and condition():
-
+    self.startLoop()
+    while self.base.sample() and ((target < 0 and angle > target) or (target >= 0 and angle < target) and condition()) and stop():
+      self.pace()
       error = self.gyro.angle() 
       self.update(error, kp, ki, kd)      
       angle = self.base.rightMotor.angle()
-
-      if abs(abs(angle) - abs(target)) <= 100 * abs(maxSpeed) / 40 and deccel :
-        if abs(speed) > minSpeed:
-          speed = (abs(speed) - rate) * polarity
-        if abs(speed) < (minSpeed):
-          speed = minSpeed * polarity
-      elif accel:
-        # otherwise accelerate up to speed from minSpeed
-        if speed < maxSpeed:
-          speed = (abs(speed) + rate) * polarity 
-        if speed > maxSpeed:
-          speed = maxSpeed
+      speed = polarity * profile.speed(abs(angle))
       
       self.base.run(speed - self.correction, speed + self.correction)
+    self.base.release()
+    if brake:
+      # learn from the latched stop, waiting for it to settle
+      self.base.braking.finish()
   
 class PID_GyroTurn(PID_GyroStraight):  
   def __init__(self,
@@ -215,26 +340,133 @@ class PID_GyroTurn(PID_GyroStraight):
                 kd: float, 
                 gyro: GyroSensor,
                 maxSpeed = 100, 
+                period: float = None
                 ):
-      super().__init__(base, kp, ki, kd, gyro)
+      super().__init__(base, kp, ki, kd, gyro, period)
       self.maxSpeed = maxSpeed
       
-  def turn(self, angle, kp = None, ki = None, kd = None, precision = False):
-  
+  def turn(self, angle, kp = None, ki = None, kd = None, precision = False, native = False):
+    if native:
+      if precision or kp is not None or ki is not None or kd is not None:
+        raise ValueError('a native turn takes no gains or precision')
+      self.base.native.turn(angle)
+      return
 
     if precision:
-      self.move(0, lambda: self.gyro.angle() != angle or self.base.leftMotor.speed() != 0 or self.base.rightMotor.speed() != 0, kp = kp, ki = ki, kd = kd, target = angle, maxSpeed = self.maxSpeed)
+      self.move(0, All(GyroWithin(self.gyro, angle), Stopped(self.base.leftMotor), Stopped(self.base.rightMotor)), kp = kp, ki = ki, kd = kd, target = angle, maxSpeed = self.maxSpeed)
     else:
-      self.move(0, lambda: self.gyro.angle() != angle, kp = kp, ki = ki, kd = kd, target = angle, maxSpeed = self.maxSpeed, minSpeed = 3)
+      self.move(0, GyroWithin(self.gyro, angle), kp = kp, ki = ki, kd = kd, target = angle, maxSpeed = self.maxSpeed, minSpeed = 3)
     self.base.hold()
     
     self.gyro.reset_angle(0)
     wait(10)
-    
-      
-def PID_SingleMotorTurn(base, gyro, angle, leftM, rightM, kp = 1.3, ki = 0.005, kd = 3, minSpeed = 5, maxSpeed = 100, reset = True):
-  pid = PID(kp, ki, kd)
-  while gyro.angle() != angle:
+
+
+class PID_Arc(PID):
+  # drives a chain of straights and arcs without stopping between them:
+  # segments are ('straight', mm) or ('arc', radius mm, angle deg, clockwise
+  # positive like the gyro). the wheel speed ratio of each arc is fed forward
+  # and the gyro is held to the heading the path should have at the distance
+  # travelled, under one speed profile for the whole chain
+  #
+  #   Arc.path(70, [('straight', 200), ('arc', 150, 90), ('straight', 300)])
+  def __init__(self,
+               base: Base,
+               kp: float,
+               ki: float,
+               kd: float,
+               gyro: GyroSensor,
+               axleTrack = AXLE_TRACK,
+               wheelDiameter = WHEEL_DIAMETER,
+               period: float = None):
+    super().__init__(kp, ki, kd, period)
+    self.base = base
+    self.gyro = gyro
+    self.axleTrack = axleTrack
+    self.mmPerDeg = math.pi * wheelDiameter / 360
+    self.profileAccel = ACCEL
+    self.profileJerk = JERK
+
+  def arc(self, speed, radius, angle, **options):
+    self.path(speed, [('arc', radius, angle)], **options)
+
+  def plan(self, segments):
+    # [(end deg, start heading, heading per deg, wheel ratio)] in encoder
+    # degrees of the robot centre. an arc needs a radius, turn on the spot
+    # with GyroTurn
+    legs = []
+    end = 0
+    heading = 0
+    for segment in segments:
+      if segment[0] == 'straight':
+        length = abs(segment[1]) / self.mmPerDeg
+        legs.append((end + length, heading, 0, 0))
+      else:
+        radius, angle = segment[1], segment[2]
+        if radius <= 0:
+          raise ValueError('arc radius must be positive, got %r' % radius)
+        length = abs(math.radians(angle)) * radius / self.mmPerDeg
+        polarity = 1 if angle > 0 else -1
+        legs.append((end + length, heading, angle / length if length else 0, polarity * self.axleTrack / (2 * radius)))
+        heading += angle
+      end += length
+    return legs, heading
+
+  def path(self,
+           maxSpeed: float,
+           segments,
+           kp: float = None,
+           ki: float = None,
+           kd: float = None,
+           minSpeed = 35,
+           accel = True,
+           deccel = True,
+           reset = True,
+           condition = Never()):
+    # reset: the gyro reads 0 along the final heading afterwards, like after
+    # a GyroTurn, without stopping
+    base = self.base
+    legs, heading = self.plan(segments)
+    total = legs[-1][0]
+    polarity = 1 if maxSpeed > 0 else -1
+    profile = MotionProfile(0, total, maxSpeed, minSpeed, accelerate = accel, decelerate = deccel,
+                            accel = self.profileAccel, jerk = self.profileJerk)
+    left0 = base.leftMotor.angle()
+    right0 = base.rightMotor.angle()
+    start = self.gyro.angle()
+    i = 0
+    travelled = 0
+
+    self.resetIntegral()
+    self.startLoop()
+    while base.sample() and travelled < total and condition():
+      self.pace()
+      # signed travel of the centre: below half the axle track the inner
+      # wheel runs backwards and must count against the outer one
+      travelled = (base.leftMotor.angle() - left0 + base.rightMotor.angle() - right0) * 0.5 * polarity
+      while i < len(legs) - 1 and travelled >= legs[i][0]:
+        i += 1
+      end, h0, rate, ratio = legs[i]
+      target = h0 + rate * (min(travelled, end) - (legs[i - 1][0] if i else 0))
+      self.update(self.gyro.angle() - start - target, kp, ki, kd)
+      speed = polarity * profile.speed(travelled)
+      # keep the outer wheel within full speed
+      if abs(speed) * (1 + abs(ratio)) > 100:
+        speed = polarity * 100 / (1 + abs(ratio))
+      turn = speed * ratio * polarity
+      base.run(speed + turn - self.correction, speed - turn + self.correction)
+    base.release()
+    if reset:
+      self.gyro.reset_angle(self.gyro.angle() - start - heading)
+
+
+def PID_SingleMotorTurn(base, gyro, angle, leftM, rightM, kp = 1.3, ki = 0.005, kd = 3, minSpeed = 5, maxSpeed = 100, reset = True, period = None):
+  pid = PID(kp, ki, kd, period)
+  pid.name = 'PID_SingleMotorTurn'
+  pid.telemetry = base.telemetry
+  pid.startLoop()
+  while base.sample() and gyro.angle() != angle:
+    pid.pace()
     error = (gyro.angle() - angle)
     pid.update(error, kp, ki, kd)
     polarity = pid.correction / abs(pid.correction)
@@ -244,6 +476,7 @@ def PID_SingleMotorTurn(base, gyro, angle, leftM, rightM, kp = 1.3, ki = 0.005,
       base.run(-maxSpeed * polarity * leftM, maxSpeed * polarity * rightM)
     else:
       base.run(-pid.correction * leftM, pid.correction * rightM)
+  base.release()
   base.hold()
   if reset:
     gyro.reset_angle(0)
@@ -260,16 +493,36 @@ def PID_AngleOffSet(base, gyro, angle):
     PID_SingleMotorTurn(base, gyro, 0, 1, 0)
     
 
-def PID_LineSquare(base, direction = 1, leeway = 2): # direction = 1 for forward, direction = -1 for backwar
+def PID_MoveTo(base, turn, straight, x, y, speed = 50):
+  # turn to face field position x, y and drive there, needs Odometry
+  # attached to the base. a negative speed backs onto it instead
+  odometry = base.odometry
+  base.gyro.reset_angle(0)
+  angle = odometry.turnTo(x, y)
+  if speed < 0:
+    angle = (angle + 360) % 360 - 180
+  turn.turn(round(angle))
+  straight.move(speed, Reached(odometry, x, y, speed >= 0))
+  base.hold()
+    
+
+def PID_LineSquare(base, direction = 1, leeway = 2, period = None, leftThresh = None, rightThresh = None): # direction = 1 for forward, direction = -1 for backwar
   kp = 0.153
   ki = 0.005
   kd = 4.56
-  leftThresh = 40
-  rightThresh = 45
-  leftPID = PID(kp, ki, kd)
-  rightPID = PID(kp, ki, kd)
-  while True:
-    
+  if leftThresh is None:
+    leftThresh = base.thresholds['lineSquareLeft']
+  if rightThresh is None:
+    rightThresh = base.thresholds['lineSquareRight']
+  leftPID = PID(kp, ki, kd, period)
+  rightPID = PID(kp, ki, kd, period)
+  # one error per row, the left side's
+  leftPID.name = 'PID_LineSquare'
+  leftPID.telemetry = base.telemetry
+  leftPID.startLoop()
+  rightPID.startLoop()
+  while base.sample():
+    leftPID.pace()
     leftVal = base.colLeft.reflection()
     rightVal = base.colRight.reflection()
 
@@ -283,6 +536,6 @@ def PID_LineSquare(base, direction = 1, leeway = 2): # direction = 1 for forward
     outRight = direction * rightPID.correction
     #print(leftVal, rightVal, outLeft, outRight)
     base.run(outLeft, outRight)
-    
+  base.release()
   base.hold()
   
\ No newline at end of file
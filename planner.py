@@ -0,0 +1,237 @@
+# field map and route planner for mission legs
+#
+# the map holds the tracking lines, the areas the robot can't drive through
+# and the places it drives to (a pose to stop at). routes run over a graph of
+# line intersections and places: line edges are tracked with LineTrack,
+# straight edges are driven on the gyro between any two points with a clear
+# view, and every change of direction costs a turn. the cheapest route (by
+# estimated time, turns included) from a pose to a place comes out as a list
+# of steps for follow()
+#
+#   planner = Planner(FieldMap())
+#   steps = planner.plan(odometry.pose(), 'house2')
+#   follow(steps, base, GyroTurn, GyroStraightDeg, LineTrack, colRight)
+#
+# routes are cached per start cell and goal; the first leg is checked again
+# from the exact pose before a cached route is reused (searched again if it
+# clips an area) and the steps are recomputed from the exact pose each time. coordinates are in the
+# simulator's field frame (mm, y down, heading clockwise from +x). the
+# default map matches sim.field.default_field, measure the real mat before
+# trusting it for the mission
+
+import math
+import heapq
+
+from conditions import Degrees
+from helper import MM_PER_DEG
+
+# tracking lines as (x0, y0, x1, y1)
+LINES = [(100, y, 2262, y) for y in (200, 570, 940)] + [(x, 100, x, 1043) for x in (250, 700, 1180, 1660, 2110)]
+
+# no-go rectangles (x, y, w, h)
+AREAS = {
+  'house1': (300, 20, 160, 120),
+  'house2': (1200, 20, 160, 120),
+  'house3': (2000, 20, 160, 120),
+}
+
+# name -> (x, y, heading to finish on, None for any)
+PLACES = {
+  'start': (665, 1040, -90),
+  'house1': (380, 240, -90),
+  'house2': (1280, 240, -90),
+  'house3': (2080, 240, -90),
+  'battery': (1420, 1000, 90),
+  'surplus': (475, 760, 180),
+  'yellow': (945, 760, 0),
+  'blue': (1900, 760, 0),
+  'green': (1420, 760, 0),
+}
+
+# time model, fitted to the simulator at speed 60: mm/s for each kind of
+# edge and s of dead time per move, s per degree of turn and per turn
+SPEEDS = {'line': 400, 'straight': 450}
+MOVE_OVERHEAD = 0.1
+TURN_RATE = 1 / 240
+TURN_OVERHEAD = 0.45
+# longest straight (mm) driven on dead reckoning
+MAX_STRAIGHT = 900
+# start cell size (mm, deg) for the route cache
+CELL = 20
+HEADING_CELL = 15
+
+
+def normalise(angle):
+  angle = angle % 360
+  return angle - 360 if angle > 180 else angle
+
+
+class FieldMap:
+  def __init__(self, lines = LINES, areas = AREAS, places = PLACES):
+    self.lines = lines
+    self.areas = areas
+    self.places = places
+
+  def crossings(self):
+    # intersections of horizontal and vertical lines, plus the line ends
+    points = []
+    for x0, y0, x1, y1 in self.lines:
+      points.append((x0, y0))
+      points.append((x1, y1))
+      if y0 == y1:
+        for vx0, vy0, vx1, vy1 in self.lines:
+          if vx0 == vx1 and min(vy0, vy1) <= y0 <= max(vy0, vy1) and min(x0, x1) <= vx0 <= max(x0, x1):
+            points.append((vx0, y0))
+    return sorted(set(points))
+
+  def onLine(self, a, b):
+    # both points on one tracking line
+    for x0, y0, x1, y1 in self.lines:
+      if y0 == y1 == a[1] == b[1] and min(x0, x1) <= min(a[0], b[0]) and max(a[0], b[0]) <= max(x0, x1):
+        return True
+      if x0 == x1 == a[0] == b[0] and min(y0, y1) <= min(a[1], b[1]) and max(a[1], b[1]) <= max(y0, y1):
+        return True
+    return False
+
+  def clear(self, a, b):
+    # the segment a-b stays out of every area, checked every 10 mm
+    steps = int(math.sqrt((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2) / 10) + 1
+    for i in range(steps + 1):
+      t = i / steps
+      x = a[0] + (b[0] - a[0]) * t
+      y = a[1] + (b[1] - a[1]) * t
+      for ax, ay, aw, ah in self.areas.values():
+        if ax <= x <= ax + aw and ay <= y <= ay + ah:
+          return False
+    return True
+
+
+class Planner:
+  def __init__(self, field = None):
+    self.field = field if field is not None else FieldMap()
+    self.nodes = self.field.crossings() + [place[:2] for place in self.field.places.values()]
+    self.nodes = sorted(set(self.nodes))
+    self.edges = {}
+    for a in self.nodes:
+      self.edges[a] = self.neighbours(a)
+    self.routes = {}
+
+  def neighbours(self, a):
+    # [(point, kind)], line edges only to the next crossing along the line
+    result = []
+    field = self.field
+    for b in self.nodes:
+      if b == a:
+        continue
+      length = math.sqrt((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2)
+      if field.onLine(a, b) and not self.between(a, b):
+        result.append((b, 'line'))
+      elif length <= MAX_STRAIGHT and field.clear(a, b):
+        result.append((b, 'straight'))
+    return result
+
+  def between(self, a, b):
+    # another node lies on the segment a-b
+    for c in self.nodes:
+      if c != a and c != b and self.field.onLine(a, c) and self.field.onLine(c, b):
+        if min(a[0], b[0]) <= c[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= c[1] <= max(a[1], b[1]):
+          return True
+    return False
+
+  def cost(self, heading, a, b, kind):
+    # (seconds, heading after) to drive a-b arriving with heading
+    bearing = math.degrees(math.atan2(b[1] - a[1], b[0] - a[0]))
+    turn = abs(normalise(bearing - heading))
+    seconds = MOVE_OVERHEAD + math.sqrt((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2) / SPEEDS[kind]
+    if turn >= 1:
+      seconds += TURN_OVERHEAD + turn * TURN_RATE
+    return seconds, bearing
+
+  def search(self, pose, goal, goalHeading = None):
+    # cheapest [(point, kind)] from pose to the goal point, including the
+    # final turn to goalHeading
+    start = (pose[0], pose[1])
+    edges = self.edges
+    first = [(b, 'straight') for b in self.nodes
+             if b != start and math.sqrt((b[0] - start[0]) ** 2 + (b[1] - start[1]) ** 2) <= MAX_STRAIGHT
+             and self.field.clear(start, b)]
+    queue = [(0.0, 0, start, pose[2], [])]
+    done = set()
+    count = 1
+    while queue:
+      seconds, _, point, heading, route = heapq.heappop(queue)
+      if point == goal:
+        return route
+      key = (point, int(round(heading)))
+      if key in done:
+        continue
+      done.add(key)
+      for b, kind in (first if point == start else edges[point]):
+        step, bearing = self.cost(heading, point, b, kind)
+        if b == goal and goalHeading is not None and abs(normalise(goalHeading - bearing)) >= 1:
+          step += TURN_OVERHEAD + abs(normalise(goalHeading - bearing)) * TURN_RATE
+        heapq.heappush(queue, (seconds + step, count, b, bearing, route + [(b, kind)]))
+        count += 1
+    return None
+
+  def plan(self, pose, goal):
+    # steps [('turn', deg) | ('straight', mm) | ('line', mm)] from pose to
+    # the named place, None if it can't be reached
+    x, y, heading = self.field.places[goal]
+    key = (int(pose[0] // CELL), int(pose[1] // CELL), int(normalise(pose[2]) // HEADING_CELL), goal)
+    route = self.routes.get(key)
+    if route and not self.field.clear((pose[0], pose[1]), route[0][0]):
+      # searched from elsewhere in the cell, the first leg from here clips
+      # an area
+      route = None
+    if route is None:
+      route = self.search(pose, (x, y), heading)
+      if route is None:
+        return None
+      if route:
+        # an empty route (already at the goal) is only right from the goal
+        # itself, not from the rest of its cell
+        self.routes[key] = route
+    steps = []
+    px, py, ph = pose
+    for (bx, by), kind in route:
+      bearing = math.degrees(math.atan2(by - py, bx - px))
+      turn = int(round(normalise(bearing - ph)))
+      if turn:
+        steps.append(('turn', turn))
+        ph += turn
+      distance = math.sqrt((bx - px) ** 2 + (by - py) ** 2)
+      if distance >= 1:
+        steps.append((kind, distance))
+      px, py = bx, by
+    if heading is not None:
+      turn = int(round(normalise(heading - ph)))
+      if turn:
+        steps.append(('turn', turn))
+    return steps
+
+  def estimate(self, steps):
+    # seconds the steps should take with the time model
+    seconds = 0
+    for kind, value in steps:
+      if kind == 'turn':
+        seconds += TURN_OVERHEAD + abs(value) * TURN_RATE
+      else:
+        seconds += MOVE_OVERHEAD + value / SPEEDS[kind]
+    return seconds
+
+
+def follow(steps, base, turn, straight, line, sensor, speed = 60, side = -1):
+  # drive planned steps: turns with a PID_GyroTurn, straights with a
+  # PID_GyroStraightDegrees and line segments with a PID_LineTrack on sensor
+  for kind, value in steps:
+    if kind == 'turn':
+      turn.turn(value)
+      continue
+    base.reset()
+    degrees = value / MM_PER_DEG
+    if kind == 'straight':
+      straight.move(speed, degrees)
+    else:
+      line.move(sensor, speed, Degrees(base.rightMotor, degrees), side = side, target = degrees)
+    base.hold()
@@ -0,0 +1,76 @@
+# battery-aware speed limits
+#
+# the motors' top speed falls with the battery voltage, so a command the
+# wheels could reach on a full battery saturates as it sags: both wheels of
+# a steering correction end up at the same top speed and the correction is
+# lost. the profile keeps the top speed a full-duty run reached and the
+# voltage it ran at (calibration.calibrate records them). while attached,
+# once the voltage is below the measured one Base.run scales both wheel
+# commands down together when one is above what the wheels reach now, so
+# the wheel ratio (the steering) survives, but never by more than the
+# measured loss: a command that saturated at calibration still does, as the
+# mission was tuned with it. at or above the measured voltage, or without a
+# measurement, commands are unchanged. the claws scale dc() duty by the
+# same loss
+#
+#   power = Power(ev3.battery, profile.power())
+#   power.attach(base)
+#   base.braking.voltage = power.read
+#
+# the voltage is read once every period ticks of the move loops (and once
+# per claw dc() at most that often), never per call
+
+# ticks between voltage reads
+PERIOD = 250
+
+
+class Power:
+  def __init__(self, battery, measured = None, period = PERIOD):
+    self.battery = battery
+    # {'top': deg/s, 'voltage': mV} of the full-duty run, None if not measured
+    self.measured = measured
+    self.period = period
+    self.base = None
+    self.update()
+
+  def update(self, tick = 0):
+    voltage = self.battery.voltage()
+    self.voltage = voltage
+    self.next = tick + self.period
+    measured = self.measured
+    if measured is None or voltage >= measured['voltage']:
+      # nothing lost, no limit
+      self.factor = 1
+      self.top = None
+    else:
+      # fraction of the measured top speed left, deg/s the drive reaches now
+      self.factor = voltage / measured['voltage']
+      self.top = measured['top'] * self.factor
+
+  def read(self):
+    # cached voltage in mV
+    if self.base is not None and self.base.tick >= self.next:
+      self.update(self.base.tick)
+    return self.voltage
+
+  def scale(self, peak):
+    # factor for both wheel commands when the faster is peak deg/s
+    top = self.top
+    if top is None or peak <= top:
+      return 1
+    return max(top / peak, self.factor)
+
+  def attach(self, base):
+    self.base = base
+    base.power = self
+    for claw in (base.frontClaw, base.backClaw):
+      if claw is not None:
+        claw.power = self
+
+  def detach(self):
+    base = self.base
+    base.power = None
+    for claw in (base.frontClaw, base.backClaw):
+      if claw is not None:
+        claw.power = None
+    self.base = None
@@ -0,0 +1,19 @@
+# headless stand-in for pybricks so the mission code runs on a workstation
+#
+# importing sim puts sim/stubs ahead of everything on sys.path, after which
+# `import pybricks` resolves to the fake package backed by sim.world
+
+import os
+import sys
+
+_here = os.path.dirname(os.path.abspath(__file__))
+_stubs = os.path.join(_here, 'stubs')
+_root = os.path.dirname(_here)
+
+if _stubs not in sys.path:
+  sys.path.insert(0, _stubs)
+if _root not in sys.path:
+  sys.path.insert(1, _root)
+
+from sim.world import World, SimTimeout, current, use
+from sim.field import Field, default_field
@@ -0,0 +1,178 @@
+# field bitmap sampled by the simulated colour sensors
+#
+# the mat is stored as a bytearray of palette indices (one byte per cell),
+# each palette entry gives what a sensor sees over that cell: reflection,
+# the pybricks Color and the raw RGB read through Ev3devSensor
+
+from pybricks.parameters import Color
+
+# name: (reflection, color, (r, g, b) raw, display rgb used to load images)
+PALETTE = [
+  ('white', 90, Color.WHITE, (60, 62, 58), (255, 255, 255)),
+  ('black', 6, Color.BLACK, (3, 3, 3), (0, 0, 0)),
+  ('red', 55, Color.RED, (40, 6, 5), (230, 30, 40)),
+  ('green', 12, Color.GREEN, (5, 14, 6), (0, 150, 70)),
+  ('blue', 14, Color.BLUE, (4, 8, 18), (0, 90, 190)),
+  ('yellow', 75, Color.YELLOW, (45, 38, 8), (255, 220, 0)),
+  ('grey', 40, None, (20, 21, 19), (150, 150, 150)),
+  ('nothing', 0, None, (0, 0, 0), (30, 30, 30)),
+]
+
+WHITE, BLACK, RED, GREEN, BLUE, YELLOW, GREY, NOTHING = range(len(PALETTE))
+
+
+class Field:
+  # sensor spot diameter in mm
+  FOOTPRINT = 10
+
+  # width and height in mm, resolution in mm per cell
+  def __init__(self, width = 2362, height = 1143, resolution = 2, fill = WHITE):
+    self.width = width
+    self.height = height
+    self.resolution = resolution
+    self.cols = int(width // resolution)
+    self.rows = int(height // resolution)
+    self.cells = bytearray([fill]) * (self.cols * self.rows)
+    self.reflections = [entry[1] for entry in PALETTE]
+    self.colors = [entry[2] for entry in PALETTE]
+    self.rgbs = [entry[3] for entry in PALETTE]
+    self._blurred = None
+
+  def index(self, x, y):
+    # off the mat reads as nothing
+    col = int(x // self.resolution)
+    row = int(y // self.resolution)
+    if col < 0 or row < 0 or col >= self.cols or row >= self.rows:
+      return NOTHING
+    return self.cells[row * self.cols + col]
+
+  def fill_rect(self, x, y, w, h, value):
+    res = self.resolution
+    c0 = max(0, int(x // res))
+    c1 = min(self.cols, int((x + w) // res))
+    r0 = max(0, int(y // res))
+    r1 = min(self.rows, int((y + h) // res))
+    if c1 <= c0:
+      return
+    self._blurred = None
+    row = bytes([value]) * (c1 - c0)
+    for r in range(r0, r1):
+      start = r * self.cols + c0
+      self.cells[start:start + c1 - c0] = row
+
+  def hline(self, x0, x1, y, value = BLACK, width = 20):
+    self.fill_rect(min(x0, x1), y - width / 2, abs(x1 - x0), width, value)
+
+  def vline(self, x, y0, y1, value = BLACK, width = 20):
+    self.fill_rect(x - width / 2, min(y0, y1), width, abs(y1 - y0), value)
+
+  # reflection seen through the sensor footprint (about 10 mm across),
+  # interpolated between cells so edges give a smooth gradient to track
+  def reflection(self, x, y):
+    res = self.resolution
+    fx = x / res - 0.5
+    fy = y / res - 0.5
+    col = int(fx // 1)
+    row = int(fy // 1)
+    tx = fx - col
+    ty = fy - row
+    a = self.blurred(col, row)
+    b = self.blurred(col + 1, row)
+    c = self.blurred(col, row + 1)
+    d = self.blurred(col + 1, row + 1)
+    return (a * (1 - tx) + b * tx) * (1 - ty) + (c * (1 - tx) + d * tx) * ty
+
+  def blurred(self, col, row):
+    if col < 0 or row < 0 or col >= self.cols or row >= self.rows:
+      return self.reflections[NOTHING]
+    i = row * self.cols + col
+    cache = self._blurred
+    if cache is None:
+      cache = self._blurred = bytearray(b'\xff') * len(self.cells)
+    value = cache[i]
+    if value == 255:
+      refl = self.reflections
+      span = max(1, int(round(self.FOOTPRINT / 2 / self.resolution)))
+      total = 0
+      count = 0
+      for r in range(row - span, row + span + 1):
+        for c in range(col - span, col + span + 1):
+          if 0 <= c < self.cols and 0 <= r < self.rows:
+            total += refl[self.cells[r * self.cols + c]]
+          else:
+            total += refl[NOTHING]
+          count += 1
+      value = cache[i] = int(round(total / count))
+    return value
+
+  def color(self, x, y):
+    return self.colors[self.index(x, y)]
+
+  def rgb(self, x, y):
+    return self.rgbs[self.index(x, y)]
+
+  @classmethod
+  def load(cls, path, width = 2362, height = 1143):
+    # binary PPM (P6) or PGM (P5) of the mat, pixels are snapped to the
+    # nearest palette colour
+    with open(path, 'rb') as f:
+      data = f.read()
+    tokens = []
+    pos = 0
+    while len(tokens) < 4:
+      while data[pos:pos + 1].isspace():
+        pos += 1
+      if data[pos:pos + 1] == b'#':
+        while data[pos:pos + 1] not in (b'\n', b''):
+          pos += 1
+        continue
+      start = pos
+      while not data[pos:pos + 1].isspace():
+        pos += 1
+      tokens.append(data[start:pos])
+    magic, cols, rows, maxval = tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+    if magic not in (b'P5', b'P6') or maxval > 255:
+      raise ValueError('unsupported image, expected 8-bit binary PPM/PGM: ' + path)
+    pixels = data[pos + 1:]
+    depth = 3 if magic == b'P6' else 1
+
+    field = cls(width, height, width / cols)
+    field.cols, field.rows = cols, rows
+    field.cells = bytearray(cols * rows)
+    field._blurred = None
+    lookup = {}
+    for i in range(cols * rows):
+      px = bytes(pixels[i * depth:(i + 1) * depth])
+      value = lookup.get(px)
+      if value is None:
+        value = lookup[px] = _nearest(px * 3 if depth == 1 else px)
+      field.cells[i] = value
+    return field
+
+
+def _nearest(px):
+  r, g, b = px[0], px[1], px[2]
+  best, bestDist = WHITE, None
+  for i, entry in enumerate(PALETTE):
+    pr, pg, pb = entry[4]
+    dist = (r - pr) ** 2 + (g - pg) ** 2 + (b - pb) ** 2
+    if bestDist is None or dist < bestDist:
+      best, bestDist = i, dist
+  return best
+
+
+def default_field():
+  # generic stand-in for the WRO 2021 mat: a grid of black tracking lines with
+  # red house areas and coloured house indicators, good enough for every loop
+  # in main.py to find the lines it is waiting for
+  field = Field()
+  for y in (200, 570, 940):
+    field.hline(100, 2262, y)
+  for x in (250, 700, 1180, 1660, 2110):
+    field.vline(x, 100, 1043)
+  for x, y in ((300, 20), (1200, 20), (2000, 20)):
+    field.fill_rect(x, y, 160, 120, RED)
+  for x, y, value in ((420, 150, YELLOW), (480, 150, GREEN), (1320, 150, BLUE),
+                      (2120, 150, GREEN), (2180, 150, YELLOW)):
+    field.fill_rect(x, y, 30, 30, value)
+  return field
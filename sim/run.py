@@ -0,0 +1,99 @@
+# run a mission function from main.py against the simulator
+#
+#   python -m sim.run                      # main.main()
+#   python -m sim.run collectYellow --limit 60000 --field mat.ppm
+
+import argparse
+import importlib
+import sys
+import time
+
+import sim
+from sim.field import Field
+from telemetry import Telemetry
+
+# modules that build devices at import and must be reloaded per world
+MISSION_MODULES = ('main', 'pid', 'helper')
+
+
+def load(world):
+  sim.use(world)
+  for name in MISSION_MODULES:
+    sys.modules.pop(name, None)
+  return importlib.import_module('main')
+
+
+def attachTelemetry(mission, size = 65536):
+  # record the base and every controller built by main.py
+  from pid import PID
+  telemetry = Telemetry(size)
+  controllers = [obj for obj in vars(mission).values() if isinstance(obj, PID)]
+  telemetry.attach(mission.base, *controllers)
+  return telemetry
+
+
+def run(entry = 'main', world = None, timeline = False, timelinePath = None, telemetryPath = None, **kwargs):
+  # returns (result dict, main module), the run stops early on a SimTimeout
+  if world is None:
+    world = sim.World(**kwargs)
+  mission = load(world)
+  telemetry = attachTelemetry(mission) if telemetryPath else None
+  start = world.now
+  host = time.perf_counter()
+  error = None
+  try:
+    if timeline or timelinePath:
+      mission.profile(entry, timelinePath)
+    else:
+      getattr(mission, entry)()
+  except sim.SimTimeout as e:
+    error = str(e)
+  if telemetry is not None:
+    telemetry.save(telemetryPath)
+  host = time.perf_counter() - host
+  simulated = (world.now - start) / 1000
+  result = {
+    'entry': entry,
+    'simulated': simulated,
+    'host': host,
+    'speedup': simulated / host if host > 0 else float('inf'),
+    'timeout': error,
+    'calls': dict(world.calls),
+    'pose': (world.x, world.y, world.gyro()),
+  }
+  return result, mission
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = __doc__)
+  parser.add_argument('entry', nargs = '?', default = 'main', help = 'function in main.py to run')
+  parser.add_argument('--field', help = 'binary PPM/PGM image of the mat')
+  parser.add_argument('--limit', type = float, default = 180000, help = 'simulated time limit in ms')
+  parser.add_argument('--battery', type = int, default = 8200, help = 'battery voltage in mV')
+  parser.add_argument('--jitter', type = float, default = 0.0, help = 'random extra cost per call, as a fraction')
+  parser.add_argument('--timeline', action = 'store_true', help = 'print the timeline of phases and primitives')
+  parser.add_argument('--save-timeline', metavar = 'CSV', help = 'also save the timeline events')
+  parser.add_argument('--cost', action = 'append', default = [], metavar = 'NAME=MS',
+                      help = 'override a device call cost, e.g. color.color=1.2')
+  parser.add_argument('--telemetry', metavar = 'FILE', help = 'save a per-tick trace of the move loops')
+  args = parser.parse_args(argv)
+
+  costs = {}
+  for item in args.cost:
+    name, ms = item.split('=')
+    costs[name] = float(ms)
+  field = Field.load(args.field) if args.field else None
+  world = sim.World(field = field, costs = costs, limit = args.limit, battery = args.battery,
+                    jitter = args.jitter)
+
+  result, _ = run(args.entry, world, args.timeline, args.save_timeline, args.telemetry)
+  print('simulated %.2f s in %.2f s (%.0fx real time)' % (result['simulated'], result['host'], result['speedup']))
+  if result['timeout']:
+    print('stopped:', result['timeout'])
+  print('pose: x %.0f mm, y %.0f mm, heading %.1f deg' % result['pose'])
+  for name, count in sorted(result['calls'].items()):
+    print('  %-20s %d' % (name, count))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1 @@
+# stand-in for the pybricks package, backed by sim.world
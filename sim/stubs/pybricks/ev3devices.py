@@ -0,0 +1,203 @@
+# stand-in for pybricks.ev3devices
+
+from pybricks.parameters import Stop, Direction, Color
+from sim.world import current
+
+
+class Control:
+  def __init__(self, model):
+    self._model = model
+
+  def limits(self, speed = None, acceleration = None, actuation = None):
+    model = self._model
+    if speed is None and acceleration is None and actuation is None:
+      return (model.limit, model.accel, 100)
+    if speed is not None:
+      model.limit = speed
+    if acceleration is not None:
+      model.accel = acceleration
+
+  def pid(self, *args, **kwargs):
+    pass
+
+  def target_tolerances(self, *args, **kwargs):
+    pass
+
+  def stall_tolerances(self, *args, **kwargs):
+    pass
+
+  def done(self):
+    return self._model.done()
+
+  def stalled(self):
+    return self._model.stalled
+
+
+class Motor:
+  def __init__(self, port, positive_direction = Direction.CLOCKWISE, gears = None):
+    self._world = current()
+    self._model = self._world.motor(port, positive_direction)
+    self.control = Control(self._model)
+
+  def speed(self):
+    self._world.charge('motor.speed')
+    return int(self._model.speed)
+
+  def angle(self):
+    self._world.charge('motor.angle')
+    return int(self._model.angle)
+
+  def reset_angle(self, angle = 0):
+    self._world.charge('motor.reset_angle')
+    model = self._model
+    if model.mode == 'hold':
+      model.holdAngle += angle - model.angle
+    model.angle = float(angle)
+
+  def stop(self):
+    self._world.charge('motor.stop')
+    self._model.set('coast')
+
+  def brake(self):
+    self._world.charge('motor.stop')
+    self._model.set('brake')
+
+  def hold(self):
+    self._world.charge('motor.stop')
+    model = self._model
+    model.set('hold')
+    model.holdAngle = model.angle
+
+  def run(self, speed):
+    self._world.charge('motor.run')
+    self._model.set('run', speed)
+
+  def dc(self, duty):
+    self._world.charge('motor.run')
+    self._model.set('dc', max(-100, min(100, duty)))
+
+  def _start(self, mode, speed, then, wait):
+    world = self._world
+    world.charge('motor.command')
+    model = self._model
+    model.set(mode, speed)
+    model.then = then
+    if wait:
+      world.block(model)
+
+  def run_time(self, speed, time, then = Stop.HOLD, wait = True):
+    self._model.endTime = self._world.now + time
+    self._start('time', speed, then, wait)
+
+  def run_angle(self, speed, rotation_angle, then = Stop.HOLD, wait = True):
+    direction = 1 if (speed >= 0) == (rotation_angle >= 0) else -1
+    self._model.target = self._model.angle + direction * abs(rotation_angle)
+    self._start('target', abs(speed), then, wait)
+
+  def run_target(self, speed, target_angle, then = Stop.HOLD, wait = True):
+    self._model.target = float(target_angle)
+    self._start('target', abs(speed), then, wait)
+
+  def run_until_stalled(self, speed, then = Stop.COAST, duty_limit = None):
+    world = self._world
+    model = self._model
+    model.set('run', speed)
+    model.then = then
+    start = world.now
+    while not model.stalled and world.now - start < 10000:
+      world.advance(1.0)
+    model.finish()
+    return int(model.angle)
+
+  def track_target(self, target_angle):
+    self._world.charge('motor.command')
+    model = self._model
+    model.set('hold')
+    model.holdAngle = float(target_angle)
+
+
+class _ColorBase:
+  def __init__(self, port):
+    self._world = current()
+    self._port = port
+    self._mode = None
+
+  def _sample(self, mode):
+    world = self._world
+    if mode != self._mode:
+      self._mode = mode
+      world.charge('color.mode_switch')
+    world.charge('color.' + mode)
+    return world.sensorPosition(self._port)
+
+  def color(self):
+    x, y = self._sample('color')
+    return self._world.field.color(x, y)
+
+  def reflection(self):
+    x, y = self._sample('reflection')
+    return int(self._world.field.reflection(x, y))
+
+  def ambient(self):
+    self._sample('ambient')
+    return 5
+
+  def rgb(self):
+    x, y = self._sample('rgb')
+    r, g, b = self._world.field.rgb(x, y)
+    return (min(100, r * 100 // 255), min(100, g * 100 // 255), min(100, b * 100 // 255))
+
+
+class ColorSensor(_ColorBase):
+  pass
+
+
+class GyroSensor:
+  def __init__(self, port, positive_direction = Direction.CLOCKWISE):
+    self._world = current()
+    self._sign = 1 if positive_direction is Direction.CLOCKWISE else -1
+
+  def angle(self):
+    world = self._world
+    world.charge('gyro.angle')
+    return int(round(self._sign * world.gyro()))
+
+  def speed(self):
+    world = self._world
+    world.charge('gyro.speed')
+    return int(round(self._sign * world.gyroRate()))
+
+  def reset_angle(self, angle):
+    world = self._world
+    world.charge('gyro.reset_angle')
+    world.gyroOffset += world.gyro() - self._sign * angle
+
+
+class TouchSensor:
+  def __init__(self, port):
+    pass
+
+  def pressed(self):
+    return False
+
+
+class InfraredSensor:
+  def __init__(self, port):
+    pass
+
+  def distance(self):
+    return 100
+
+  def buttons(self, channel):
+    return []
+
+
+class UltrasonicSensor:
+  def __init__(self, port):
+    pass
+
+  def distance(self, silent = False):
+    return 2550
+
+  def presence(self):
+    return False
@@ -0,0 +1,73 @@
+# stand-in for pybricks.hubs
+
+from sim.world import current
+
+
+class _Buttons:
+  def pressed(self):
+    return []
+
+
+class _Light:
+  def on(self, color):
+    pass
+
+  def off(self):
+    pass
+
+
+class _Speaker:
+  def beep(self, frequency = 500, duration = 100):
+    current().advance(max(duration, 0))
+
+  def play_notes(self, notes, tempo = 120):
+    current().advance(len(notes) * 60000 / tempo / 4)
+
+  def play_file(self, file):
+    pass
+
+  def say(self, text):
+    pass
+
+  def set_speech_options(self, language = None, voice = None, speed = None, pitch = None):
+    pass
+
+  def set_volume(self, volume, which = '_all_'):
+    pass
+
+
+class _Screen:
+  width = 178
+  height = 128
+
+  def clear(self):
+    current().screen.clear()
+
+  def print(self, *args, sep = ' ', end = '\n'):
+    current().screen.append(sep.join(str(a) for a in args))
+
+  def draw_text(self, x, y, text, text_color = None, background_color = None):
+    current().screen.append(str(text))
+
+  def __getattr__(self, name):
+    # drawing primitives are no-ops
+    return lambda *args, **kwargs: None
+
+
+class _Battery:
+  def voltage(self):
+    world = current()
+    world.charge('battery.voltage')
+    return int(world.battery)
+
+  def current(self):
+    return 150
+
+
+class EV3Brick:
+  def __init__(self):
+    self.buttons = _Buttons()
+    self.light = _Light()
+    self.speaker = _Speaker()
+    self.screen = _Screen()
+    self.battery = _Battery()
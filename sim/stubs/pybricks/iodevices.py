@@ -0,0 +1,25 @@
+# stand-in for pybricks.iodevices
+
+from sim.world import current
+
+
+class Ev3devSensor:
+  def __init__(self, port):
+    self._world = current()
+    self._port = port
+    self._mode = None
+    self.sensor_index = 0
+    self.port_index = int(port.name[1:]) if port.name.startswith('S') else 0
+
+  def read(self, mode):
+    world = self._world
+    if mode != self._mode:
+      self._mode = mode
+      world.charge('color.mode_switch')
+    world.charge('ev3dev.read')
+    x, y = world.sensorPosition(self._port)
+    if mode == 'RGB-RAW':
+      return world.field.rgb(x, y)
+    if mode == 'COL-REFLECT':
+      return (int(world.field.reflection(x, y)),)
+    return (0,)
@@ -0,0 +1,27 @@
+# stand-in for pybricks.media.ev3dev, every constant is its own name
+
+
+class _Names(type):
+  def __getattr__(cls, name):
+    if name.startswith('__'):
+      raise AttributeError(name)
+    return name
+
+
+class SoundFile(metaclass = _Names):
+  pass
+
+
+class ImageFile(metaclass = _Names):
+  pass
+
+
+class Font:
+  def __init__(self, family = None, size = 12, bold = False, monospace = False, lang = None, script = None):
+    self.family = family
+    self.size = size
+
+
+class Image:
+  def __init__(self, source, sub = False):
+    self.source = source
@@ -0,0 +1,58 @@
+# stand-in for pybricks.parameters
+
+
+class _Constant:
+  def __init__(self, group, name):
+    self.group = group
+    self.name = name
+
+  def __repr__(self):
+    return self.group + '.' + self.name
+
+  __str__ = __repr__
+
+
+def _constants(cls, names):
+  for name in names:
+    setattr(cls, name, _Constant(cls.__name__, name))
+  return cls
+
+
+class Port:
+  pass
+
+
+class Stop:
+  pass
+
+
+class Direction:
+  pass
+
+
+class Button:
+  pass
+
+
+class Color:
+  pass
+
+
+class Side:
+  pass
+
+
+class Align:
+  pass
+
+
+_constants(Port, ('A', 'B', 'C', 'D', 'S1', 'S2', 'S3', 'S4'))
+_constants(Stop, ('COAST', 'BRAKE', 'HOLD'))
+_constants(Direction, ('CLOCKWISE', 'COUNTERCLOCKWISE'))
+_constants(Button, ('LEFT_DOWN', 'DOWN', 'RIGHT_DOWN', 'LEFT', 'CENTER', 'RIGHT',
+                    'LEFT_UP', 'UP', 'BEACON', 'RIGHT_UP'))
+_constants(Color, ('BLACK', 'BLUE', 'GREEN', 'YELLOW', 'RED', 'WHITE', 'BROWN',
+                   'ORANGE', 'PURPLE'))
+_constants(Side, ('TOP', 'BOTTOM', 'FRONT', 'BACK', 'LEFT', 'RIGHT'))
+_constants(Align, ('BOTTOM_LEFT', 'BOTTOM', 'BOTTOM_RIGHT', 'LEFT', 'CENTER',
+                   'RIGHT', 'TOP_LEFT', 'TOP', 'TOP_RIGHT'))
@@ -0,0 +1,78 @@
+# stand-in for pybricks.robotics
+
+import math
+
+from pybricks.parameters import Stop
+
+
+class DriveBase:
+  def __init__(self, left_motor, right_motor, wheel_diameter, axle_track):
+    self.left = left_motor
+    self.right = right_motor
+    self._mmPerDeg = math.pi * wheel_diameter / 360
+    self._axleTrack = axle_track
+    self._straightSpeed = 200
+    self._turnRate = 90
+    self.reset()
+
+  def settings(self, straight_speed = None, straight_acceleration = None,
+               turn_rate = None, turn_acceleration = None):
+    if straight_speed is None and turn_rate is None:
+      return (self._straightSpeed, 400, self._turnRate, 360)
+    if straight_speed is not None:
+      self._straightSpeed = straight_speed
+    if turn_rate is not None:
+      self._turnRate = turn_rate
+
+  def _wheelSpeeds(self, speed, turn_rate):
+    # deg/s per wheel for mm/s forward and deg/s clockwise
+    diff = math.radians(turn_rate) * self._axleTrack / 2
+    return (speed + diff) / self._mmPerDeg, (speed - diff) / self._mmPerDeg
+
+  def drive(self, speed, turn_rate):
+    left, right = self._wheelSpeeds(speed, turn_rate)
+    self.left.run(left)
+    self.right.run(right)
+
+  def stop(self):
+    self.left.stop()
+    self.right.stop()
+
+  def straight(self, distance):
+    deg = distance / self._mmPerDeg
+    speed = self._straightSpeed / self._mmPerDeg
+    self.left.run_angle(speed, deg, Stop.HOLD, False)
+    self.right.run_angle(speed, deg, Stop.HOLD, True)
+    self.left._world.block(self.left._model)
+
+  def turn(self, angle):
+    deg = math.radians(angle) * self._axleTrack / 2 / self._mmPerDeg
+    speed = math.radians(self._turnRate) * self._axleTrack / 2 / self._mmPerDeg
+    self.left.run_angle(speed, deg, Stop.HOLD, False)
+    self.right.run_angle(speed, -deg, Stop.HOLD, True)
+    self.left._world.block(self.left._model)
+
+  def _wheels(self):
+    return self.left._model.angle * self._mmPerDeg, self.right._model.angle * self._mmPerDeg
+
+  def distance(self):
+    left, right = self._wheels()
+    return int((left + right) / 2 - self._distance0)
+
+  def angle(self):
+    left, right = self._wheels()
+    return int(math.degrees((left - right) / self._axleTrack) - self._angle0)
+
+  def state(self):
+    left, right = self._wheels()
+    ls = self.left._model.speed * self._mmPerDeg
+    rs = self.right._model.speed * self._mmPerDeg
+    return (self.distance(), (ls + rs) / 2, self.angle(),
+            math.degrees((ls - rs) / self._axleTrack))
+
+  def reset(self):
+    self._distance0 = 0
+    self._angle0 = 0
+    left, right = self._wheels()
+    self._distance0 = (left + right) / 2
+    self._angle0 = math.degrees((left - right) / self._axleTrack)
@@ -0,0 +1,52 @@
+# stand-in for pybricks.tools
+
+from sim.world import current
+
+
+def wait(time):
+  current().advance(time)
+
+
+class StopWatch:
+  def __init__(self):
+    self._world = current()
+    self._start = self._world.now
+    self._paused = None
+
+  def time(self):
+    world = self._world
+    world.charge('stopwatch.time')
+    if self._paused is not None:
+      return int(self._paused)
+    return int(world.now - self._start)
+
+  def pause(self):
+    if self._paused is None:
+      self._paused = self._world.now - self._start
+
+  def resume(self):
+    if self._paused is not None:
+      self._start = self._world.now - self._paused
+      self._paused = None
+
+  def reset(self):
+    self._start = self._world.now
+    if self._paused is not None:
+      self._paused = 0
+
+
+class DataLog:
+  def __init__(self, *headers, name = 'log', timestamp = True, extension = 'csv', append = False):
+    if timestamp:
+      import time
+      name = name + time.strftime('_%Y_%m_%d_%H_%M_%S')
+    self._file = open(name + '.' + extension, 'a' if append else 'w')
+    if headers:
+      self._file.write(', '.join(str(h) for h in headers) + '\n')
+
+  def log(self, *values):
+    self._file.write(', '.join(str(v) for v in values) + '\n')
+    self._file.flush()
+
+  def __repr__(self):
+    return '<DataLog ' + self._file.name + '>'
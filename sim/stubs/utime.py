@@ -0,0 +1,37 @@
+# stand-in for MicroPython's utime, ticks follow the simulated clock
+
+import time as _time
+
+from sim.world import current
+
+
+def ticks_us():
+  world = current()
+  world.charge('stopwatch.time')
+  return int(world.now * 1000)
+
+
+def ticks_ms():
+  world = current()
+  world.charge('stopwatch.time')
+  return int(world.now)
+
+
+def ticks_diff(new, old):
+  return new - old
+
+
+def ticks_add(ticks, delta):
+  return ticks + delta
+
+
+def sleep_ms(ms):
+  current().advance(ms)
+
+
+def sleep_us(us):
+  current().advance(us / 1000)
+
+
+def time():
+  return _time.time()
@@ -0,0 +1,22 @@
+# print a telemetry trace saved on the brick or by sim.run as csv
+#
+#   python -m sim.trace trace.bin > trace.csv
+
+import sys
+
+import sim
+from telemetry import load
+
+
+def main(argv = None):
+  argv = sys.argv[1:] if argv is None else argv
+  fields, rows, names = load(argv[0])
+  print(','.join(fields))
+  for row in rows:
+    print(','.join(['%g' % value for value in row]))
+  # the controller column numbers these, from 1
+  print('# controllers: ' + ','.join(names), file = sys.stderr)
+
+
+if __name__ == '__main__':
+  main()
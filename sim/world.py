@@ -0,0 +1,274 @@
+# kinematic model behind the stand-in pybricks package
+#
+# time is simulated: every device call charges its cost (ms) to the clock,
+# wait() and blocking motor commands advance it, and the motors and the
+# differential-drive pose are integrated up to the clock on every advance.
+# the costs approximate a sysfs access on ev3dev and should be calibrated
+# against the brick, they are what makes loop rates measured here meaningful
+
+import math
+import random
+
+from pybricks.parameters import Stop, Direction
+
+# cost in ms charged to the simulated clock per call
+COSTS = {
+  'motor.run': 0.25,
+  'motor.command': 0.3,
+  'motor.angle': 0.15,
+  'motor.speed': 0.15,
+  'motor.reset_angle': 0.2,
+  'motor.stop': 0.2,
+  'color.reflection': 0.6,
+  'color.color': 0.9,
+  'color.ambient': 0.6,
+  'color.rgb': 0.9,
+  'color.mode_switch': 15.0,
+  'gyro.angle': 0.4,
+  'gyro.speed': 0.4,
+  'gyro.reset_angle': 0.3,
+  'ev3dev.read': 0.9,
+  'stopwatch.time': 0.01,
+  'battery.voltage': 0.3,
+}
+
+# no-load speed (deg/s at 9 V) and acceleration (deg/s^2) per motor type
+MOTOR_TYPES = {
+  'large': (1050, 8000),
+  'medium': (1560, 12000),
+}
+
+# physical direction of a forward wheel turn
+FORWARD = {
+  'left': Direction.COUNTERCLOCKWISE,
+  'right': Direction.CLOCKWISE,
+}
+
+
+class SimTimeout(Exception):
+  pass
+
+
+class MotorModel:
+  def __init__(self, world, port, kind = 'large', sign = 1):
+    self.world = world
+    self.port = port
+    self.sign = sign
+    self.noLoad, self.accel = MOTOR_TYPES[kind]
+    self.limit = 800 if kind == 'large' else 1200
+    self.angle = 0.0
+    self.speed = 0.0
+    self.mode = 'coast'
+    self.command = 0.0
+    self.target = 0.0
+    self.then = Stop.COAST
+    self.endTime = 0.0
+    self.holdAngle = 0.0
+    self.stalled = False
+    self.range = None
+
+  def done(self):
+    return self.mode not in ('target', 'time')
+
+  def set(self, mode, command = 0.0):
+    self.mode = mode
+    self.command = command
+    self.stalled = False
+
+  def finish(self):
+    if self.then is Stop.HOLD:
+      self.holdAngle = self.angle
+      self.mode = 'hold'
+    elif self.then is Stop.BRAKE:
+      self.mode = 'brake'
+    else:
+      self.mode = 'coast'
+
+  def step(self, dt):
+    top = min(self.limit, self.noLoad * self.world.battery / 9000)
+    mode = self.mode
+    accel = self.accel
+    if mode == 'run':
+      desired = self.command
+    elif mode == 'target':
+      remaining = self.target - self.angle
+      if abs(remaining) < 0.5 and abs(self.speed) < 30:
+        self.finish()
+        desired = 0.0
+      else:
+        desired = min(abs(self.command), math.sqrt(2 * accel * abs(remaining)))
+        desired = desired if remaining > 0 else -desired
+    elif mode == 'time':
+      if self.world.now >= self.endTime:
+        self.finish()
+        desired = 0.0
+      else:
+        desired = self.command
+    elif mode == 'hold':
+      desired = 15 * (self.holdAngle - self.angle)
+    elif mode == 'dc':
+      desired = self.command / 100 * self.noLoad * self.world.battery / 9000
+      top = self.noLoad
+    elif mode == 'brake':
+      desired = 0.0
+    else:
+      desired = 0.0
+      accel = accel * 0.3
+
+    if desired > top:
+      desired = top
+    elif desired < -top:
+      desired = -top
+    step = accel * dt
+    if desired > self.speed + step:
+      self.speed += step
+    elif desired < self.speed - step:
+      self.speed -= step
+    else:
+      self.speed = desired
+    self.angle += self.speed * dt
+
+    if self.range is not None:
+      low, high = self.range
+      if self.angle < low or self.angle > high:
+        self.angle = low if self.angle < low else high
+        self.speed = 0.0
+        self.stalled = True
+
+
+class World:
+  def __init__(self,
+               field = None,
+               costs = None,
+               limit = None,
+               battery = 8200,
+               drive = None,
+               motorTypes = None,
+               sensors = None,
+               ranges = None,
+               wheelDiameter = 62.4,
+               axleTrack = 160,
+               start = (665, 1040, -90),
+               gyroDrift = 0.0,
+               jitter = 0.0,
+               seed = 0):
+    if field is None:
+      from sim.field import default_field
+      field = default_field()
+    self.field = field
+    self.costs = dict(COSTS)
+    if costs:
+      self.costs.update(costs)
+    # each call costs up to jitter * its cost extra, seeded so runs repeat
+    self.jitter = jitter
+    self.random = random.Random(seed)
+    self.limit = limit
+    self.battery = battery
+    # port name -> wheel side
+    self.drive = drive or {'B': 'left', 'C': 'right'}
+    self.motorTypes = motorTypes or {'A': 'medium', 'D': 'medium'}
+    # port name -> (mm forward of the axle, mm right of centre)
+    self.sensors = sensors or {'S1': (20, 70), 'S3': (75, -35), 'S4': (75, 35)}
+    self.ranges = ranges or {}
+    self.mmPerDeg = math.pi * wheelDiameter / 360
+    self.axleTrack = axleTrack
+    self.x, self.y = float(start[0]), float(start[1])
+    self.heading = math.radians(start[2])
+    self.gyroDrift = gyroDrift
+    # the gyro reads zero at power-up whatever the start heading
+    self.gyroOffset = math.degrees(self.heading)
+    self.now = 0.0
+    self.physicsTime = 0.0
+    self.motors = {}
+    self.left = None
+    self.right = None
+    self.calls = {}
+    self.screen = []
+
+  def motor(self, port, direction):
+    kind = self.motorTypes.get(port.name, 'large')
+    side = self.drive.get(port.name)
+    sign = 1
+    if side is not None and direction is not FORWARD[side]:
+      sign = -1
+    model = MotorModel(self, port, kind, sign)
+    if port.name in self.ranges:
+      model.range = self.ranges[port.name]
+    self.motors[port.name] = model
+    if side == 'left':
+      self.left = model
+    elif side == 'right':
+      self.right = model
+    return model
+
+  def charge(self, name):
+    self.calls[name] = self.calls.get(name, 0) + 1
+    cost = self.costs[name]
+    if self.jitter:
+      cost *= 1 + self.jitter * self.random.random()
+    self.advance(cost)
+
+  def advance(self, ms):
+    self.now += ms
+    while self.physicsTime < self.now:
+      dt = min(1.0, self.now - self.physicsTime)
+      self.physicsTime += dt
+      self.step(dt / 1000)
+    if self.limit is not None and self.now > self.limit:
+      # raise once so cleanup and reports can still use the devices
+      limit, self.limit = self.limit, None
+      raise SimTimeout('simulated time limit of %d ms reached' % limit)
+
+  def block(self, model):
+    # blocking motor command, advance until the motion completes
+    while not model.done():
+      self.advance(1.0)
+
+  def step(self, dt):
+    for model in self.motors.values():
+      model.step(dt)
+    left, right = self.left, self.right
+    if left is None or right is None:
+      return
+    vl = left.speed * left.sign * self.mmPerDeg
+    vr = right.speed * right.sign * self.mmPerDeg
+    v = (vl + vr) / 2
+    # field y points down, so a positive heading is clockwise like the gyro
+    self.heading += (vl - vr) / self.axleTrack * dt
+    self.x += v * math.cos(self.heading) * dt
+    self.y += v * math.sin(self.heading) * dt
+    # walls stop the robot, the wheels slip
+    self.x = min(max(self.x, 100), self.field.width - 100)
+    self.y = min(max(self.y, 100), self.field.height - 100)
+
+  def gyro(self):
+    return math.degrees(self.heading) + self.gyroDrift * self.now / 1000 - self.gyroOffset
+
+  def gyroRate(self):
+    left, right = self.left, self.right
+    if left is None or right is None:
+      return 0.0
+    vl = left.speed * left.sign * self.mmPerDeg
+    vr = right.speed * right.sign * self.mmPerDeg
+    return math.degrees((vl - vr) / self.axleTrack)
+
+  def sensorPosition(self, port):
+    forward, right = self.sensors.get(port.name, (0, 0))
+    c, s = math.cos(self.heading), math.sin(self.heading)
+    return self.x + forward * c - right * s, self.y + forward * s + right * c
+
+
+_current = None
+
+
+def current():
+  global _current
+  if _current is None:
+    _current = World()
+  return _current
+
+
+def use(world):
+  global _current
+  _current = world
+  return world
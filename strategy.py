@@ -0,0 +1,163 @@
+# visit order for the energy deliveries
+#
+# given what each house needs (the scanned Houses), what every energy area
+# still holds and how many cubes the battery storage takes, finds the fastest
+# order of collect and deposit legs that meets every demand, carrying at
+# most capacity cubes. the search is a memoised recursion over (place,
+# demands left, supply left, load), so each subproblem is solved once
+#
+#   engine = Strategy(plannerLegs(Planner()), actionTimes(timeline.load('t.csv')))
+#   seconds, steps = engine.plan(Houses, {'yellow': (Color.YELLOW, 4), ...})
+#   # steps: [('collect', 'green', (0, 0, 2)), ('deposit', 'house1', (0, 0, 1)), ...]
+#
+# loads and demands are counts per colour in COLORS order. leg times come
+# from a function of two place names, e.g. the route planner's estimates,
+# and the time spent at each stop from the timeline profiler or the defaults
+
+from pybricks.parameters import Color
+
+COLORS = (Color.YELLOW, Color.BLUE, Color.GREEN)
+HOUSES = ('house1', 'house2', 'house3')
+CAPACITY = 4
+
+# seconds spent at a stop
+ACTIONS = {'collect': 3.0, 'deposit': 2.5, 'battery': 3.0}
+# timeline phases behind each action
+PHASES = {
+  'collect': ('collectYellow', 'collectBlue', 'collectGreen', 'collectSurplus'),
+  'deposit': ('depositHouse',),
+  'battery': ('depositBattery',),
+}
+
+_INFINITY = float('inf')
+
+
+def counts(colors):
+  return tuple([len([c for c in colors if c == color]) for color in COLORS])
+
+
+def actionTimes(events, defaults = ACTIONS):
+  # mean seconds per action from Timeline events, defaults for the rest
+  times = dict(defaults)
+  for action, names in PHASES.items():
+    durations = [end - start for name, depth, start, end in events if name in names]
+    if durations:
+      times[action] = sum(durations) / len(durations) / 1000
+  return times
+
+
+def plannerLegs(planner):
+  # leg time between two places from the route planner, memoised
+  legs = {}
+
+  def leg(a, b):
+    key = (a, b)
+    seconds = legs.get(key)
+    if seconds is None:
+      if a == b:
+        seconds = 0
+      else:
+        steps = planner.plan(planner.field.places[a], b)
+        seconds = planner.estimate(steps) if steps is not None else _INFINITY
+      legs[key] = seconds
+    return seconds
+  return leg
+
+
+class Strategy:
+  def __init__(self, leg, actions = ACTIONS, capacity = CAPACITY, houses = HOUSES, end = 'start'):
+    self.leg = leg
+    self.actions = actions
+    self.capacity = capacity
+    self.houses = houses
+    self.end = end
+
+  def plan(self, houses, supply, battery = 0, start = 'start', load = (0, 0, 0)):
+    # (seconds, steps) for the fastest feasible order, (inf, None) if the
+    # demands can't be met. houses are lists of Colors, supply maps an energy
+    # area to (Color, cubes left), battery is how many spare cubes to store
+    self.sources = sorted(supply)
+    self.sourceColors = [COLORS.index(supply[name][0]) for name in self.sources]
+    demand = tuple([counts(house) for house in houses])
+    left = tuple([supply[name][1] for name in self.sources])
+    self.memo = {}
+    seconds = self.best(start, demand, left, battery, tuple(load))
+    if seconds == _INFINITY:
+      return seconds, None
+    steps = []
+    state = (start, demand, left, battery, tuple(load))
+    while True:
+      step = self.memo[state][1]
+      if step is None:
+        break
+      steps.append(step[0])
+      state = step[1]
+    return seconds, steps
+
+  def best(self, place, demand, supply, battery, load):
+    key = (place, demand, supply, battery, load)
+    known = self.memo.get(key)
+    if known is not None:
+      return known[0]
+    self.memo[key] = (_INFINITY, None)
+    needed = [sum([d[i] for d in demand]) for i in range(len(COLORS))]
+    carried = sum(load)
+    if sum(needed) == 0 and battery == 0:
+      seconds = self.leg(place, self.end)
+      self.memo[key] = (seconds, None)
+      return seconds
+
+    bestSeconds = _INFINITY
+    bestStep = None
+    actions = self.actions
+
+    # deposit everything the house needs that is on board
+    for h in range(len(demand)):
+      give = tuple([min(demand[h][i], load[i]) for i in range(len(COLORS))])
+      if sum(give) == 0:
+        continue
+      name = self.houses[h]
+      after = tuple([tuple([demand[j][i] - (give[i] if j == h else 0) for i in range(len(COLORS))])
+                     for j in range(len(demand))])
+      rest = tuple([load[i] - give[i] for i in range(len(COLORS))])
+      next = (name, after, supply, battery, rest)
+      seconds = self.leg(place, name) + actions['deposit'] + self.best(*next)
+      if seconds < bestSeconds:
+        bestSeconds, bestStep = seconds, (('deposit', name, give), next)
+
+    # store spare cubes in the battery, only what no house needs
+    spare = tuple([max(load[i] - needed[i], 0) for i in range(len(COLORS))])
+    if battery and sum(spare):
+      store = []
+      room = battery
+      for i in range(len(COLORS)):
+        n = min(spare[i], room)
+        store.append(n)
+        room -= n
+      store = tuple(store)
+      rest = tuple([load[i] - store[i] for i in range(len(COLORS))])
+      next = ('battery', demand, supply, battery - sum(store), rest)
+      seconds = self.leg(place, 'battery') + actions['battery'] + self.best(*next)
+      if seconds < bestSeconds:
+        bestSeconds, bestStep = seconds, (('battery', 'battery', store), next)
+
+    # collect from an area, as many as fit and are still wanted
+    room = self.capacity - carried
+    if room > 0:
+      for s in range(len(self.sources)):
+        i = self.sourceColors[s]
+        wanted = needed[i] - load[i] + battery
+        take = min(room, supply[s], wanted)
+        if take <= 0:
+          continue
+        name = self.sources[s]
+        after = tuple([supply[j] - (take if j == s else 0) for j in range(len(supply))])
+        rest = tuple([load[j] + (take if j == i else 0) for j in range(len(COLORS))])
+        taken = tuple([take if j == i else 0 for j in range(len(COLORS))])
+        next = (name, demand, after, battery, rest)
+        seconds = self.leg(place, name) + actions['collect'] + self.best(*next)
+        if seconds < bestSeconds:
+          bestSeconds, bestStep = seconds, (('collect', name, taken), next)
+
+    self.memo[key] = (bestSeconds, bestStep)
+    return bestSeconds
@@ -0,0 +1,171 @@
+# raw ev3dev sysfs reads for the hot loops
+#
+# every attribute the loops poll (tacho position and speed, colour sensor
+# value0) stays open and is read with seek + readinto into a preallocated
+# buffer, and the digits are parsed in place, so a read allocates nothing and
+# skips the pybricks object layer. commands still go through pybricks, only
+# the readings of Base's sampled devices are switched:
+#
+#   sysfs.attach(base, leftDirection = Direction.COUNTERCLOCKWISE)
+#
+# the fast path sets the sensor mode itself and only writes it on a change.
+# after a switch the driver keeps serving the old mode's value0 for a
+# while, so a read waits until the mode file reports the new mode and one
+# sample period has passed. a colour reading through pybricks (rgb(),
+# ambient() on a sampled sensor) switches the mode behind its back, so the
+# sampled sensor forgets the fast path's mode then. root can point at a
+# fake tree of plain files for testing
+
+from pybricks.parameters import Direction, Color
+from pybricks.tools import wait, StopWatch
+
+ROOT = '/sys/class'
+# ms a mode switch may take to be reported, ms between checks, ms of one
+# colour sensor sample
+SWITCH_TIMEOUT = 200
+SWITCH_POLL = 1
+SAMPLE_PERIOD = 10
+
+# ev3dev COL-COLOR values
+COLORS = (None, Color.BLACK, Color.BLUE, Color.GREEN, Color.YELLOW, Color.RED, Color.WHITE, Color.BROWN)
+
+
+def find(kind, port, root = ROOT):
+  # device directory under root/kind whose address ends with the port, e.g.
+  # find('tacho-motor', 'outB')
+  import os
+  base = root + '/' + kind
+  for name in sorted(os.listdir(base)):
+    path = base + '/' + name
+    try:
+      with open(path + '/address') as f:
+        if f.read().strip().endswith(port):
+          return path
+    except OSError:
+      pass
+  raise OSError('no %s on %s under %s' % (kind, port, root))
+
+
+class Attribute:
+  # one sysfs attribute held open
+  def __init__(self, path, size = 32):
+    self.file = open(path, 'rb', buffering = 0)
+    self.buffer = bytearray(size)
+
+  def read(self):
+    # first integer in the file
+    f = self.file
+    f.seek(0)
+    n = f.readinto(self.buffer)
+    buffer = self.buffer
+    value = 0
+    sign = 1
+    for i in range(n):
+      c = buffer[i]
+      if 48 <= c <= 57:
+        value = value * 10 + c - 48
+      elif c == 45:
+        sign = -1
+      else:
+        break
+    return sign * value
+
+  def close(self):
+    self.file.close()
+
+
+class SysfsMotor:
+  def __init__(self, path, positive_direction = Direction.CLOCKWISE):
+    self.position = Attribute(path + '/position')
+    self.speedAttribute = Attribute(path + '/speed')
+    self.sign = -1 if positive_direction == Direction.COUNTERCLOCKWISE else 1
+    self.offset = 0
+
+  def angle(self):
+    return self.sign * self.position.read() - self.offset
+
+  def speed(self):
+    return self.sign * self.speedAttribute.read()
+
+  def reset_angle(self, angle = 0):
+    # the tacho count is never written, the offset moves instead
+    self.offset = self.sign * self.position.read() - angle
+
+
+class SysfsColor:
+  def __init__(self, path):
+    self.path = path
+    self.modeFile = open(path + '/mode', 'w')
+    self.modeRead = open(path + '/mode', 'rb', buffering = 0)
+    self.modeBuffer = bytearray(32)
+    self.value0 = Attribute(path + '/value0')
+    self.values = [self.value0, Attribute(path + '/value1'), Attribute(path + '/value2')]
+    # mode the driver is known to be in, None once something else may have
+    # switched it
+    self.current = None
+
+  def mode(self, mode):
+    if mode != self.current:
+      self.modeFile.seek(0)
+      self.modeFile.write(mode + '\n')
+      self.modeFile.flush()
+      self.current = None
+      self.settle(mode)
+      self.current = mode
+
+  def settle(self, mode):
+    # wait for the driver to report mode, then for a sample taken in it
+    name = mode.encode()
+    clock = StopWatch()
+    while True:
+      self.modeRead.seek(0)
+      n = self.modeRead.readinto(self.modeBuffer)
+      if self.modeBuffer[:n].split(b'\n')[0] == name:
+        break
+      if clock.time() >= SWITCH_TIMEOUT:
+        raise OSError('%s did not switch to %s' % (self.path, mode))
+      wait(SWITCH_POLL)
+    wait(SAMPLE_PERIOD)
+
+  def reflection(self):
+    self.mode('COL-REFLECT')
+    return self.value0.read()
+
+  def color(self):
+    self.mode('COL-COLOR')
+    value = self.value0.read()
+    return COLORS[value] if 0 <= value < len(COLORS) else None
+
+  def rgb(self):
+    self.mode('RGB-RAW')
+    values = self.values
+    return values[0].read(), values[1].read(), values[2].read()
+
+
+def attach(base, root = ROOT, leftPort = 'outB', rightPort = 'outC', leftColor = 'in3', rightColor = 'in4',
+           leftDirection = Direction.COUNTERCLOCKWISE, rightDirection = Direction.CLOCKWISE):
+  # switch the readings of base's drive motors and line sensors to sysfs,
+  # keeping the current angles
+  for sampled, port, direction in ((base.leftMotor, leftPort, leftDirection),
+                                   (base.rightMotor, rightPort, rightDirection)):
+    reader = SysfsMotor(find('tacho-motor', port, root), direction)
+    reader.reset_angle(sampled.motor.angle())
+    sampled.reader = reader
+    sampled.angleTick = -1
+    sampled.speedTick = -1
+  for sampled, port in ((base.colLeft, leftColor), (base.colRight, rightColor)):
+    sampled.reader = SysfsColor(find('lego-sensor', port, root))
+    sampled.reflectionTick = -1
+    sampled.colorTick = -1
+
+
+def detach(base):
+  # back to reading through pybricks
+  for sampled in (base.leftMotor, base.rightMotor):
+    sampled.reader = sampled.motor
+    sampled.angleTick = -1
+    sampled.speedTick = -1
+  for sampled in (base.colLeft, base.colRight):
+    sampled.reader = sampled.sensor
+    sampled.reflectionTick = -1
+    sampled.colorTick = -1
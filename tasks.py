@@ -0,0 +1,81 @@
+# cooperative tasks for overlapping claw motion with driving
+#
+# a task is a generator that yields whenever it is waiting. the scheduler
+# steps every ready task once per Base.sample(), i.e. once per iteration of
+# whatever move loop is running, and join() steps them until they finish.
+# motor commands run in the firmware, so a task only has to start them with
+# wait = False and yield until they are done
+#
+#   frontClaw.openUp(wait = False)
+#   opening = scheduler.spawn(frontClaw.moving())
+#   GyroStraightDeg.move(-60, -160)      # the claw opens while reversing
+#   base.hold()
+#   scheduler.join(opening)
+
+from pybricks.tools import wait, StopWatch
+
+
+def sleep(time):
+  # yield for time ms
+  watch = StopWatch()
+  while watch.time() < time:
+    yield
+
+
+class Task:
+  def __init__(self, gen, after = ()):
+    self.gen = gen
+    self.after = after
+    self.done = False
+
+  def ready(self):
+    for task in self.after:
+      if not task.done:
+        return False
+    return True
+
+
+class Scheduler:
+  def __init__(self):
+    self.tasks = []
+    self.pending = False
+
+  def spawn(self, gen, after = ()):
+    # start gen once every task in after has finished
+    task = Task(gen, after)
+    self.tasks.append(task)
+    self.pending = True
+    return task
+
+  def step(self):
+    finished = False
+    for task in self.tasks:
+      if task.ready():
+        try:
+          next(task.gen)
+        except StopIteration:
+          task.done = True
+          finished = True
+    if finished:
+      self.tasks = [task for task in self.tasks if not task.done]
+      self.pending = len(self.tasks) > 0
+
+  def join(self, *tasks):
+    # block until the given tasks (all tasks if none given) have finished
+    if not tasks:
+      tasks = self.tasks[:]
+    while True:
+      for task in tasks:
+        if not task.done:
+          break
+      else:
+        return
+      self.step()
+      wait(1)
+
+  def run(self, *gens):
+    # run generators to completion side by side
+    self.join(*[self.spawn(gen) for gen in gens])
+
+
+scheduler = Scheduler()
@@ -0,0 +1,144 @@
+# full-rate control loop traces
+#
+# a fixed-size ring buffer in one preallocated float array, one row per loop
+# tick: the controller's error and correction from PID.update, and the
+# commanded speeds, encoder and gyro from Base.run. controller numbers the
+# PID that updated on the tick (1 for the first name in the file's names, 0
+# for none) and start flags where its state was reset, so a replay can take
+# one controller's rows and restart it where the loop did. recording only stores
+# values the loop already has (encoder and gyro are the tick's cached
+# readings, no extra device reads) so traces don't change the loop timing;
+# a reading the loop didn't take on that tick is stored as NAN, not as
+# whatever an earlier tick or leg left in the cache.
+# the newest rows win once the buffer is full; flush with save() after the run.
+# time is stored as integer microseconds (an int goes into the float array
+# without a heap object, a divided float would not) and read back in ms
+#
+#   telemetry = Telemetry()
+#   telemetry.attach(base, LineTrack, GyroStraight, GyroStraightDeg, GyroTurn)
+#   collectYellow()
+#   telemetry.save('trace.bin')
+
+import struct
+from array import array
+from utime import ticks_us, ticks_diff
+
+FIELDS = ('time', 'error', 'correction', 'left', 'right', 'encoder', 'gyro', 'controller', 'start')
+WIDTH = len(FIELDS)
+CONTROLLER = FIELDS.index('controller')
+START = FIELDS.index('start')
+# a column not read on the row's tick
+NAN = float('nan')
+# start flags: a new move loop (PID.startLoop), an integral reset
+# (PID.resetIntegral), a new controller (last error 0)
+START_LOOP = 1
+START_INTEGRAL = 2
+START_NEW = 4
+MAGIC = b'TLM1'
+# magic, columns, rows, bytes of comma separated controller names
+HEADER = '<4sHIH'
+
+
+class Telemetry:
+  def __init__(self, size = 4096):
+    self.size = size
+    # allocated once, recording never allocates
+    self.data = array('f', [0.0] * (size * WIDTH))
+    # rows written since the last clear, the buffer holds the last size
+    self.count = 0
+    self.start = ticks_us()
+    self.error = 0.0
+    self.correction = 0.0
+    self.controller = 0
+    self.flags = 0
+    # controller names in the order first seen, name -> number
+    self.names = []
+    self.numbers = {}
+
+  def attach(self, base, *controllers):
+    # record every Base.run, and the errors of the given controllers.
+    # PID_SingleMotorTurn and PID_LineSquare pick it up from the base
+    base.telemetry = self
+    for controller in controllers:
+      controller.telemetry = self
+
+  def detach(self, base, *controllers):
+    base.telemetry = None
+    for controller in controllers:
+      controller.telemetry = None
+
+  def clear(self):
+    self.count = 0
+    self.start = ticks_us()
+
+  def pid(self, error, correction, name = None, start = 0):
+    # held until the tick's row is written by record()
+    self.error = error
+    self.correction = correction
+    if name is not None:
+      number = self.numbers.get(name)
+      if number is None:
+        self.names.append(name)
+        number = self.numbers[name] = len(self.names)
+      self.controller = number
+      self.flags |= start
+
+  def record(self, left, right, encoder, gyro):
+    data = self.data
+    i = (self.count % self.size) * WIDTH
+    data[i] = ticks_diff(ticks_us(), self.start)
+    data[i + 1] = self.error
+    data[i + 2] = self.correction
+    data[i + 3] = left
+    data[i + 4] = right
+    data[i + 5] = encoder
+    data[i + 6] = gyro
+    data[i + 7] = self.controller
+    data[i + 8] = self.flags
+    self.controller = 0
+    self.flags = 0
+    self.count += 1
+
+  def rows(self):
+    # rows held, oldest first
+    data = self.data
+    first = self.count - self.size if self.count > self.size else 0
+    for n in range(first, self.count):
+      i = (n % self.size) * WIDTH
+      yield (data[i] / 1000,) + tuple(data[i + 1:i + WIDTH])
+
+  def save(self, path):
+    # header then the float32 rows oldest first, written straight from the
+    # buffer
+    view = memoryview(self.data)
+    names = ','.join(self.names).encode()
+    with open(path, 'wb') as f:
+      f.write(struct.pack(HEADER, MAGIC, WIDTH, min(self.count, self.size), len(names)))
+      f.write(names)
+      if self.count <= self.size:
+        f.write(view[:self.count * WIDTH])
+      else:
+        split = (self.count % self.size) * WIDTH
+        f.write(view[split:])
+        f.write(view[:split])
+
+
+def load(path):
+  # (fields, rows, controller names) from a file written by Telemetry.save
+  with open(path, 'rb') as f:
+    magic, width, count, size = struct.unpack(HEADER, f.read(struct.calcsize(HEADER)))
+    if magic != MAGIC:
+      raise ValueError('not a telemetry file: %s' % path)
+    names = f.read(size).decode()
+    data = struct.unpack('<%df' % (width * count), f.read(4 * width * count))
+  rows = [(data[i] / 1000,) + tuple(data[i + 1:i + width]) for i in range(0, width * count, width)]
+  return FIELDS[:width], rows, names.split(',') if names else []
+
+
+def select(rows, names, name):
+  # the rows controller name updated on
+  if name not in names:
+    return []
+  number = names.index(name) + 1
+  return [row for row in rows if row[CONTROLLER] == number]
+
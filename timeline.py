@@ -0,0 +1,110 @@
+# mission timeline profiler
+#
+# wraps mission phases and primitives so every call records its start and end
+# on one StopWatch. calls nest, so the report is a tree of where the time
+# went, plus totals per name to show which legs are worth optimising
+#
+#   timeline = Timeline()
+#   timeline.instrument(globals(), ('checkHouse1', 'collectGreen'))
+#   timeline.instrumentMethods(GyroTurn, 'GyroTurn', ('turn',))
+#   main()
+#   timeline.report()
+
+from pybricks.tools import StopWatch
+
+
+class Timeline:
+  def __init__(self):
+    self.clock = StopWatch()
+    # [name, depth, start ms, end ms], end is None while running
+    self.events = []
+    self.depth = 0
+
+  def begin(self, name):
+    self.events.append([name, self.depth, self.clock.time(), None])
+    self.depth += 1
+    return len(self.events) - 1
+
+  def end(self, index):
+    self.depth -= 1
+    self.events[index][3] = self.clock.time()
+
+  def wrap(self, fn, name):
+    timeline = self
+
+    def timed(*args, **kwargs):
+      index = timeline.begin(name)
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        timeline.end(index)
+    return timed
+
+  def instrument(self, namespace, names):
+    # replace functions in a module's globals, calls made by name from that
+    # module (including between phases) go through the wrapper
+    for name in names:
+      if name in namespace:
+        namespace[name] = self.wrap(namespace[name], name)
+
+  def instrumentMethods(self, obj, label, names):
+    # shadow bound methods on one instance
+    for name in names:
+      setattr(obj, name, self.wrap(getattr(obj, name), label + '.' + name))
+
+  def totals(self):
+    # name -> [calls, total ms], nested calls of the same name count once
+    totals = {}
+    covered = {}
+    for name, depth, start, end in self.events:
+      if end is None:
+        end = self.clock.time()
+      entry = totals.get(name)
+      if entry is None:
+        entry = totals[name] = [0, 0]
+      entry[0] += 1
+      if covered.get(name, -1) < start:
+        entry[1] += end - start
+        covered[name] = end
+    return totals
+
+  def report(self, depth = None, minimum = 0):
+    # tree of calls lasting at least minimum ms, then totals per name
+    if not self.events:
+      return
+    first = self.events[0][2]
+    last = max([e[3] if e[3] is not None else self.clock.time() for e in self.events])
+    total = max(last - first, 1)
+    print('timeline (s, %% of %.2f s)' % (total / 1000))
+    for name, level, start, end in self.events:
+      if depth is not None and level > depth:
+        continue
+      running = end is None
+      if running:
+        end = self.clock.time()
+      if end - start < minimum:
+        continue
+      print('%8.3f %5.1f%%  %s%s%s' % ((end - start) / 1000, 100 * (end - start) / total,
+                                    '  ' * level, name, ' (unfinished)' if running else ''))
+    print('totals')
+    totals = self.totals()
+    for name in sorted(totals, key = lambda n: -totals[n][1]):
+      calls, ms = totals[name]
+      print('%8.3f %5.1f%%  %-28s x%d' % (ms / 1000, 100 * ms / total, name, calls))
+
+  def save(self, path):
+    with open(path, 'w') as f:
+      f.write('name,depth,start,end\n')
+      for name, depth, start, end in self.events:
+        f.write('%s,%d,%d,%d\n' % (name, depth, start, end if end is not None else start))
+
+
+def load(path):
+  # events saved by Timeline.save
+  events = []
+  with open(path) as f:
+    f.readline()
+    for line in f:
+      name, depth, start, end = line.strip().split(',')
+      events.append([name, int(depth), int(start), int(end)])
+  return events